@@ -0,0 +1,129 @@
+import multiprocessing
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List
+
+import llm
+from ingest import SOURCE_PATTERNS
+from pipeline import run_pipeline
+from scheduler import SchedulerManager
+from utils import load_config, write_json
+
+
+def discover_clients(root: Path) -> List[Path]:
+    """Return the sub-folders of *root* that contain client data files."""
+    return [
+        p for p in sorted(root.iterdir())
+        if p.is_dir() and any(next(p.glob(pattern), None) for pattern in SOURCE_PATTERNS)
+    ]
+
+
+def _init_worker(slots, scheduler) -> None:
+    llm.set_call_slots(slots)
+    if scheduler is not None:
+        llm.set_scheduler(scheduler)
+
+
+def _run_client(data_folder: str, outputs_dir: str, work_folder: str) -> Dict:
+    """Run one client; any failure is returned instead of raised."""
+    start = time.perf_counter()
+    try:
+        metrics = run_pipeline(data_folder=data_folder, outputs_dir=outputs_dir, work_folder=work_folder)
+        status = {"status": "ok", "metrics": metrics}
+    except Exception as e:
+        traceback.print_exc()
+        status = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+    status["wall_seconds"] = time.perf_counter() - start
+    return status
+
+
+def run_batch(root: Path, workers: int | None = None) -> Dict:
+    """
+    Run the pipeline for every client folder under *root*.
+
+    Clients are scheduled across ``batch_workers`` processes; all of them
+    share one semaphore so at most ``batch_max_llm_calls`` model calls are
+    in flight at any time.  With ``scheduler_enabled`` they also share one
+    ModelScheduler, so calls for loaded models run before calls that
+    would swap them out, across all clients.  Each client writes its
+    outputs to ``output_folder/<client>/`` and an aggregate
+    ``metrics_file`` is written to ``output_folder``.
+    """
+    cfg = load_config()
+    workers = workers or int(cfg.get("batch_workers", 2))
+    max_llm_calls = int(cfg.get("batch_max_llm_calls", 4))
+    outputs_root = Path(cfg.get("output_folder", "outputs"))
+    work_root = Path(cfg.get("work_folder", "work"))
+
+    clients = discover_clients(root)
+    if not clients:
+        raise ValueError(f"No client data folders found under {root}")
+    print(f"batch: {len(clients)} clients, {workers} workers, {max_llm_calls} concurrent LLM calls")
+
+    slots = multiprocessing.BoundedSemaphore(max_llm_calls)
+    manager = scheduler = None
+    if int(cfg.get("scheduler_enabled", 0)) == 1:
+        manager = SchedulerManager()
+        manager.start()
+        scheduler = manager.ModelScheduler(cfg)
+    results: Dict[str, Dict] = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(slots, scheduler)) as pool:
+        futures = {
+            pool.submit(
+                _run_client,
+                str(client),
+                str(outputs_root / client.name),
+                str(work_root / client.name),
+            ): client.name
+            for client in clients
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                # the worker process itself died
+                results[name] = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            print(f"batch: {name} {results[name]['status']}")
+    wall_seconds = time.perf_counter() - start
+    scheduler_stats = None
+    if manager is not None:
+        scheduler_stats = {**scheduler.stats(), "events": scheduler.events()}
+        manager.shutdown()
+
+    succeeded = [r for r in results.values() if r["status"] == "ok"]
+    total_tokens = sum(r["metrics"].get("total_tokens", 0) for r in succeeded)
+    cost_estimate_usd = sum(float(r["metrics"].get("cost_estimate_usd", 0)) for r in succeeded)
+
+    aggregate = {
+        "latency_seconds": wall_seconds,
+        "cost_estimate_usd": f"{cost_estimate_usd:.2f}",
+        "total_tokens": total_tokens,
+        "clients": len(clients),
+        "clients_succeeded": len(succeeded),
+        "clients_failed": len(clients) - len(succeeded),
+        "throughput_clients_per_hour": len(succeeded) / wall_seconds * 3600 if wall_seconds else 0.0,
+        "workers": workers,
+        "max_llm_calls": max_llm_calls,
+        "model_scheduler": scheduler_stats,
+        "per_client": {
+            name: {
+                "status": r["status"],
+                "wall_seconds": r.get("wall_seconds"),
+                "error": r.get("error"),
+                "latency_seconds": r.get("metrics", {}).get("latency_seconds"),
+                "total_tokens": r.get("metrics", {}).get("total_tokens"),
+                "best_attempt_score": r.get("metrics", {}).get("work_metrics", {}).get("best_attempt_score"),
+            }
+            for name, r in sorted(results.items())
+        },
+    }
+    write_json(str(outputs_root / cfg["metrics_file"]), aggregate, indent=2)
+
+    print(f"Batch finished: {len(succeeded)}/{len(clients)} clients "
+          f"({aggregate['throughput_clients_per_hour']:.1f} clients/hour)")
+    return aggregate
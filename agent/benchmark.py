@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+Offline pipeline benchmark.
+
+Starts a MockOllamaServer, generates synthetic client corpora of
+increasing size, runs ``run_pipeline`` over each of them and reports
+stage latencies, p50/p95 call timings and throughput.  Results are
+saved as JSON; ``--compare`` diffs them against an earlier result file.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import yaml
+
+from mock_ollama import MODULE_NAMES, MockOllamaServer
+
+AGENT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = AGENT_DIR.parent
+# metrics compared by --compare (lower is better)
+COMPARED = ("wall_seconds", "extraction_seconds", "generation_seconds", "evaluation_seconds", "llm_call_seconds")
+
+
+def make_corpus(folder: Path, n_transcripts: int, seed: int = 0) -> None:
+    """Write a synthetic client data folder shaped like ``data/``."""
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    modules = rng.sample(MODULE_NAMES, 3)
+    for i in range(1, n_transcripts + 1):
+        topic = rng.choice(["Kickoff", "Workshop", "Status Call", "Design Review", "Training Plan"])
+        lines = [
+            f"{topic} – Customer X",
+            "Attendees: Project Lead, Solutions Consultant, Billing SME",
+            "Discussion:",
+            f"- Modules in scope: {', '.join(rng.sample(modules, 2))}",
+            f"- Timeline: pilot in {rng.randint(2, 6)} weeks, go-live in {rng.randint(7, 12)} weeks",
+            f"- Risks: {rng.choice(['integration latency', 'limited test data', 'staff availability'])}",
+            "Actions:",
+            f"- Provide sample data for {rng.choice(modules)} validation",
+            f"- Confirm {rng.choice(['pharmacy', 'payer', 'lab'])} partner mapping",
+        ]
+        (folder / f"transcript_{i:02d}.txt").write_text("\n".join(lines))
+    (folder / "requirements_modules.csv").write_text(
+        "module,enabled,owner,start_date\n"
+        + "".join(f"{m},TRUE,Project Lead,2025-09-{8 + 7 * n:02d}\n" for n, m in enumerate(modules))
+    )
+    (folder / "requirements_timeline.csv").write_text(
+        "milestone,date,owner\nPilot Complete,2025-10-01,Project Lead\nGo-Live,2025-10-15,Program Manager\n"
+    )
+    (folder / "salesforce_export.json").write_text(json.dumps({
+        "account_name": "Customer X",
+        "modules_purchased": modules,
+        "primary_contacts": [{"name": "Pat Jordan", "role": "Sponsor"}],
+    }, indent=2))
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    arr = np.asarray(values, dtype=float)
+    return {"p50": float(np.percentile(arr, 50)), "p95": float(np.percentile(arr, 95)), "max": float(arr.max())}
+
+
+def _read_spans(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def run_once(workspace: Path, size: int, repeat: int, run_pipeline) -> Dict:
+    """Run the pipeline over a fresh ``size``-transcript corpus inside *workspace*."""
+    data = workspace / f"data_{size}"
+    if not data.exists():
+        make_corpus(data, size, seed=size)
+    work = workspace / f"work_{size}_{repeat}"
+    outputs = workspace / f"outputs_{size}_{repeat}"
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics = run_pipeline(data_folder=str(data), outputs_dir=str(outputs), work_folder=str(work))
+    wall = time.perf_counter() - start
+
+    spans = _read_spans(work / "trace.jsonl")
+    stage = {s["name"]: s["duration_seconds"] for s in spans if s["parent_id"] is not None}
+    stage_totals: Dict[str, float] = {}
+    for s in spans:
+        stage_totals[s["name"]] = stage_totals.get(s["name"], 0.0) + s["duration_seconds"]
+    documents = len(list(data.iterdir()))
+    return {
+        "size": size,
+        "repeat": repeat,
+        "documents": documents,
+        "wall_seconds": wall,
+        "extraction_seconds": stage.get("extract_entities", 0.0),
+        "generation_seconds": stage_totals.get("generate_brief", 0.0),
+        "evaluation_seconds": stage_totals.get("evaluate", 0.0) + stage_totals.get("embed_corpus", 0.0),
+        "llm_call_durations": [s["duration_seconds"] for s in spans if s["name"] in ("llm.chat", "llm.embed")],
+        "total_tokens": metrics.get("total_tokens"),
+        "documents_per_second": documents / wall if wall else None,
+    }
+
+
+def summarize(runs: List[Dict]) -> Dict[str, Dict]:
+    summary = {}
+    for size in sorted({r["size"] for r in runs}):
+        group = [r for r in runs if r["size"] == size]
+        calls = [d for r in group for d in r["llm_call_durations"]]
+        summary[str(size)] = {
+            "runs": len(group),
+            "wall_seconds": percentiles([r["wall_seconds"] for r in group]),
+            "extraction_seconds": percentiles([r["extraction_seconds"] for r in group]),
+            "generation_seconds": percentiles([r["generation_seconds"] for r in group]),
+            "evaluation_seconds": percentiles([r["evaluation_seconds"] for r in group]),
+            "llm_call_seconds": percentiles(calls),
+            "llm_calls_per_run": len(calls) / len(group),
+            "documents_per_second": float(np.mean([r["documents_per_second"] for r in group])),
+        }
+    return summary
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Lines describing p50/p95 changes; regressions beyond *tolerance* are flagged."""
+    lines = []
+    for size, stats in current["summary"].items():
+        base = baseline.get("summary", {}).get(size)
+        if not base:
+            continue
+        for metric in COMPARED:
+            for pct in ("p50", "p95"):
+                now, before = stats[metric][pct], base.get(metric, {}).get(pct)
+                if not now or not before:
+                    continue
+                change = (now - before) / before
+                flag = "REGRESSION" if change > tolerance else ("improved" if change < -tolerance else "")
+                lines.append(f"size {size:>4} {metric:<20} {pct}: {before:8.3f}s -> {now:8.3f}s ({change:+.1%}) {flag}")
+    return lines
+
+
+def _build_label() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against a mock Ollama server")
+    parser.add_argument("--sizes", default="5,20,50", help="comma-separated transcript counts")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="mock seconds per request")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--output", default=str(PROJECT_ROOT / "outputs" / "benchmark.json"))
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier benchmark JSON to diff against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    server = MockOllamaServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                              failure_rate=args.failure_rate).start()
+    # the ollama module reads OLLAMA_HOST when it is first imported
+    os.environ["OLLAMA_HOST"] = server.host
+    sys.path.insert(0, str(AGENT_DIR))
+    from pipeline import run_pipeline
+
+    with open(PROJECT_ROOT / "config.yaml") as f:
+        cfg = yaml.safe_load(f)
+    cfg.update({"llm_cache_enabled": 0, "incremental_index": 0, "trace_enabled": 1, "DEBUG": 0})
+
+    runs = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-") as tmp:
+        workspace = Path(tmp)
+        with open(workspace / "config.yaml", "w") as f:
+            yaml.safe_dump(cfg, f)
+        os.chdir(workspace)  # stages load ./config.yaml
+        try:
+            for size in sizes:
+                for repeat in range(args.repeats):
+                    run = run_once(workspace, size, repeat, run_pipeline)
+                    runs.append(run)
+                    print(f"size {size:>4} run {repeat + 1}: {run['wall_seconds']:.2f}s")
+        finally:
+            os.chdir(cwd)
+            server.stop()
+
+    result = {
+        "build": _build_label(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "mock_server": {"latency": args.latency, "tokens_per_second": args.tokens_per_second,
+                        "failure_rate": args.failure_rate, "requests": server.requests},
+        "summary": summarize(runs),
+        "runs": [{k: v for k, v in r.items() if k != "llm_call_durations"} for r in runs],
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps(result["summary"], indent=2))
+    print(f"Benchmark written to: {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} (build {baseline.get('build')}):")
+        print("\n".join(compare(result, baseline, args.tolerance)) or "no overlapping sizes")
+
+
+if __name__ == "__main__":
+    main()
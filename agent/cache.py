@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for LLM responses.
+
+    Each response is stored as ``<folder>/<key[:2]>/<key>.json`` where the
+    key is a SHA-256 of the model name, the request options and the full
+    message list.  Entries older than ``max_age_hours`` are treated as
+    misses and removed; when the folder grows past ``max_size_mb`` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        folder: str | Path,
+        max_size_mb: float = 256,
+        max_age_hours: float = 168,
+    ) -> None:
+        self.folder = Path(folder)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_hours * 3600
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size_bytes: Optional[int] = None
+
+    @staticmethod
+    def key(model: str, options: Dict[str, Any], messages: List[Dict[str, Any]]) -> str:
+        payload = json.dumps(
+            {"model": model, "options": options, "messages": messages},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.folder / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._count("misses")
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.max_age_seconds:
+            self._remove(path)
+            self._count("misses")
+            return None
+
+        # touch so size-based eviction drops the least recently used entries
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count("hits")
+        return entry["response"]
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"created_at": time.time(), "response": response})
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.writes += 1
+            if self._size_bytes is None:
+                self._size_bytes = self._scan_size()
+            else:
+                self._size_bytes += len(data)
+            over_limit = self._size_bytes > self.max_size_bytes
+        if over_limit:
+            self.prune()
+
+    def prune(self) -> None:
+        """Drop expired entries, then the oldest ones until under the size limit."""
+        now = time.time()
+        entries = []
+        for path in self.folder.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = 0
+        kept = []
+        for mtime, size, path in entries:
+            if now - mtime > self.max_age_seconds:
+                self._remove(path)
+            else:
+                kept.append((mtime, size, path))
+                total += size
+
+        # keep 10% headroom so we do not prune on every write
+        target = self.max_size_bytes * 0.9
+        for mtime, size, path in sorted(kept):
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+
+        with self._lock:
+            self._size_bytes = total
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+    def _scan_size(self) -> int:
+        total = 0
+        for path in self.folder.glob("*/*.json"):
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _remove(self, path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            return
+        self._count("evictions")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
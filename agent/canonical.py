@@ -0,0 +1,164 @@
+import json
+import re
+import unicodedata
+
+from difflib import SequenceMatcher
+from typing import Dict, List
+
+from utils import timer, load_config, token_count
+
+
+def normalize(text: str) -> str:
+    """Lower-case, strip accents and punctuation, collapse whitespace."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w]+", " ", text.casefold()).split())
+
+
+def similar(a: str, b: str, threshold: float) -> bool:
+    """
+    True when two normalized values state the same fact: equal once spaces
+    are dropped ("customer x" / "customerx") or a fuzzy match at
+    *threshold*.  A value contained in a longer one is not enough: "data
+    migration" and "data migration rollback plan" are distinct deliverables.
+    """
+    if a.replace(" ", "") == b.replace(" ", ""):
+        return True
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    return (matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold
+            and matcher.ratio() >= threshold)
+
+
+def _canonical_value(variants: List[str]) -> str:
+    """The variant closest to all the others; ties go to the more informative (longer) one."""
+    if len(variants) == 1:
+        return variants[0]
+    normalized = [normalize(v) for v in variants]
+
+    def centrality(i: int) -> float:
+        return sum(SequenceMatcher(None, normalized[i], other).ratio() for other in normalized)
+
+    best = max(range(len(variants)), key=lambda i: (centrality(i), len(variants[i])))
+    return variants[best]
+
+
+def _window_sources(record: Dict) -> Dict[str, Dict[str, List[str]]]:
+    """
+    ``{field: {normalized value: [window labels]}}`` of a record merged
+    from windows, where a label such as ``transcript_01.txt#1[0:24000]``
+    names the chunk and character range the value was extracted from.
+    """
+    located: Dict[str, Dict[str, List[str]]] = {}
+    for window in record.get("windows") or []:
+        label = f"{window.get('chunk', record['source'])}[{window['start']}:{window['end']}]"
+        for field, value in (window.get("entities") or {}).items():
+            for v in value if isinstance(value, list) else [value]:
+                if isinstance(v, (dict, list)):
+                    v = json.dumps(v, sort_keys=True)
+                labels = located.setdefault(field, {}).setdefault(normalize(v), [])
+                if v and label not in labels:
+                    labels.append(label)
+    return located
+
+
+def cluster_values(mentions: List[Dict], threshold: float) -> List[Dict]:
+    """
+    Greedily cluster ``{"value", "sources", "provenance"}`` mentions of one
+    field, in order of first appearance.
+    """
+    clusters: List[Dict] = []
+    cluster_of: Dict[str, Dict] = {}   # exact normalized value -> its cluster
+    for mention in mentions:
+        norm = normalize(mention["value"])
+        if not norm:
+            continue
+        cluster = cluster_of.get(norm)
+        if cluster is None:
+            for candidate in clusters:
+                if any(similar(norm, member, threshold) for member in candidate["normalized"]):
+                    cluster = candidate
+                    break
+            else:
+                cluster = {"normalized": [], "variants": [], "sources": [], "provenance": set()}
+                clusters.append(cluster)
+            cluster["normalized"].append(norm)
+            cluster_of[norm] = cluster
+        cluster["variants"].append(str(mention["value"]).strip())
+        cluster["provenance"].add(mention.get("provenance", "llm"))
+        for source in mention["sources"]:
+            if source not in cluster["sources"]:
+                cluster["sources"].append(source)
+    return clusters
+
+
+def brief_view(entries: List[Dict]) -> Dict[str, List[str]]:
+    """
+    The canonical values per field, in index order, as the brief prompt
+    gets them: sources, mentions and provenance stay in the index file,
+    so prompt tokens grow with distinct facts only.
+    """
+    view: Dict[str, List[str]] = {}
+    for entry in entries:
+        view.setdefault(entry["field"], []).append(entry["value"])
+    return view
+
+
+@timer
+def canonicalize(records: List[Dict]) -> Dict:
+    """
+    Merge the entities of every extraction record into one canonical
+    entry per distinct fact:
+
+        {"field": "goals", "value": "...", "sources": ["transcript_01.txt", ...], "mentions": 3,
+         "provenance": "llm"}
+
+    Values are normalized and fuzzy-clustered per field
+    (``canonical_similarity``); the cluster's most central variant is kept,
+    and at most ``canonical_max_sources`` sources are listed so an entry
+    does not grow with the number of documents repeating it.
+    Facts from a document extracted in windows list the windows they
+    came from (``transcript_01.txt#1[0:24000]``) rather than the file.
+    ``provenance`` is "structured" when a structured source (see
+    structured.py) states the fact, else "llm".
+    ``compression_ratio`` is extracted entities over canonical entries;
+    ``tokens_out`` counts the ``brief_view`` the brief prompt gets.
+    """
+    print("canonicalizing entities")
+    cfg = load_config()
+    threshold = float(cfg.get("canonical_similarity", 0.85))
+    max_sources = int(cfg.get("canonical_max_sources", 5))
+
+    mentions: Dict[str, List[Dict]] = {}
+    for record in records:
+        located = _window_sources(record)
+        for field, value in (record.get("entities") or {}).items():
+            values = value if isinstance(value, list) else [value]
+            for v in values:
+                if isinstance(v, (dict, list)):
+                    v = json.dumps(v, sort_keys=True)
+                if v:
+                    sources = located.get(field, {}).get(normalize(v)) or [record["source"]]
+                    mentions.setdefault(field, []).append({"value": v, "sources": sources,
+                                                           "provenance": record.get("provenance", "llm")})
+
+    entries = []
+    for field, field_mentions in mentions.items():
+        for cluster in cluster_values(field_mentions, threshold):
+            entries.append({
+                "field": field,
+                "value": _canonical_value(cluster["variants"]),
+                "sources": cluster["sources"][:max_sources],
+                "mentions": len(cluster["variants"]),
+                "provenance": "structured" if "structured" in cluster["provenance"] else "llm",
+            })
+
+    entities_in = sum(len(m) for m in mentions.values())
+    return {
+        "result": entries,
+        "elapsed_seconds": 0,
+        "entities_in": entities_in,
+        "entities_out": len(entries),
+        "compression_ratio": entities_in / len(entries) if entries else 0.0,
+        "tokens_in": token_count(json.dumps([r.get("entities") or {} for r in records])),
+        "tokens_out": token_count(json.dumps(brief_view(entries))),
+    }
@@ -1,53 +1,213 @@
+import csv
 import json
-import os
-import ollama
+import re
+import lexical
+import llm
+import tracing
+from lexical import LexicalCorpus
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 from ingest import Document
 
 import numpy as np
-from utils import cosine_similarity, timer, load_config, token_count
+from utils import (cosine_similarity_matrix, timer, load_config, add_usage,
+                   merge_usage, response_usage, usage_tokens)
+
+# the keys starter/eval.py requires in every brief
+REQUIRED_KEYS = ["modules", "config_yaml", "risks", "next_steps"]
+# brief sections scored individually against the corpus
+SECTIONS = ["summary", *REQUIRED_KEYS]
+
+
+def flatten(value) -> str:
+    """A brief (or one of its fields) as text for embedding; lists and dicts included."""
+    if isinstance(value, dict):
+        return " ".join(f"{k}: {flatten(v)}" for k, v in value.items() if flatten(v))
+    if isinstance(value, list):
+        return ", ".join(flatten(v) for v in value if flatten(v))
+    return "" if value is None else str(value)
+
+
+def reference_modules(data_dir: Path) -> List[str]:
+    """
+    Modules named by the structured sources: ``modules_purchased`` in
+    salesforce_export.json and the enabled rows of requirements_modules.csv.
+    """
+    modules = []
+    try:
+        with open(data_dir / "salesforce_export.json", encoding="utf-8") as f:
+            modules += [str(m) for m in json.load(f).get("modules_purchased", [])]
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        with open(data_dir / "requirements_modules.csv", newline="", encoding="utf-8") as f:
+            modules += [row["module"] for row in csv.DictReader(f)
+                        if row.get("module") and str(row.get("enabled", "true")).strip().lower() in ("true", "1", "yes")]
+    except (OSError, KeyError):
+        pass
+    return list(dict.fromkeys(m.strip() for m in modules if m.strip()))
+
+
+def module_names(value) -> List[str]:
+    """
+    The module names of a brief's ``modules`` field, whatever its shape:
+    a list of names, a list of objects (``{"name": ...}``, ``{"module": ...}``)
+    or one comma or newline separated string.
+    """
+    if isinstance(value, str):
+        value = re.split(r"[,\n]", value)
+    elif isinstance(value, dict):
+        value = [value]
+    elif not isinstance(value, list):
+        return []
+    names = []
+    for item in value:
+        if isinstance(item, dict):
+            item = item.get("name") or item.get("module") or next(
+                (v for v in item.values() if isinstance(v, str)), "")
+        if isinstance(item, (str, int, float)) and str(item).strip(" -*\t"):
+            names.append(str(item).strip(" -*\t"))
+    return names
+
+
+def gate(brief: Dict, modules: Optional[List[str]], cfg: Dict) -> Dict:
+    """
+    Deterministic checks run before any embedding call: every key in
+    REQUIRED_KEYS is present (it may be empty, as the brief prompt
+    allows), and the brief's modules overlap the reference *modules*
+    (Jaccard) by at least ``eval_min_module_accuracy``.
+    """
+    checks = {"missing_keys": [k for k in REQUIRED_KEYS if k not in brief]}
+    if modules:
+        pred = {m.lower() for m in module_names(brief.get("modules"))}
+        ref = {m.lower() for m in modules}
+        checks["module_accuracy"] = len(pred & ref) / max(1, len(pred | ref))
+        checks["hallucinated_modules"] = sorted(pred - ref)
+    reasons = []
+    if checks["missing_keys"]:
+        reasons.append(f"missing {', '.join(checks['missing_keys'])}")
+    if checks.get("module_accuracy", 1.0) < float(cfg.get("eval_min_module_accuracy", 0.5)):
+        reasons.append(f"module accuracy {checks['module_accuracy']:.2f}")
+    checks["passed"] = not reasons
+    checks["reason"] = "; ".join(reasons)
+    return checks
 
 @timer
-def evaluate(brief: Dict, fact_check: List[Document]) -> Dict:
-    total_tokens = 0
+def embed_corpus(fact_check: List[Document]) -> Dict:
+    """
+    Embed every fact-check document in a single batched call.
+
+    The returned ``result`` is a (n_docs, dim) matrix meant to be computed
+    once per run and handed to every ``evaluate`` call; with
+    ``eval_backend: lexical`` it is a LexicalCorpus instead.
+    """
     cfg = load_config()
     DEBUG = cfg["DEBUG"] == 1
-    # Flatten the two dicts into strings for embedding
-    def flatten(d):
-        return " ".join([f"{k}: {v}" for k, v in d.items() if isinstance(v, str)])
+    texts = [doc.text for doc in fact_check]
+    if cfg.get("eval_backend", "embedding") == "lexical":
+        # fail before any brief is generated rather than reject every one of them
+        lexical.require_calibration(cfg)
+        # no model call: hashed TF-IDF/BM25 vectors, cached per corpus
+        return {"result": lexical.get_corpus(cfg, texts), "elapsed_seconds": 0, "total_tokens": 0, "usage": {}}
+    if not texts:
+        return {"result": np.zeros((0, 0)), "elapsed_seconds": 0, "total_tokens": 0, "usage": {}}
 
-    brief_str = flatten(brief)    
-    brief_emb = get_embeddings(brief_str)
-    total_tokens += brief_emb.get("total_tokens", 1)
+    response = llm.embed(cfg, model=cfg["embeddings_model_name"], input=texts)
+    matrix = np.asarray(response["embeddings"], dtype=float)
+    usage = {}
+    add_usage(usage, cfg["embeddings_model_name"], response_usage(response, "\n".join(texts)))
+    total_tokens = usage_tokens(usage)
 
     if DEBUG:
         print("DEBUG")
-        print(f"brief_emb: {brief_emb}")
+        print(f"corpus embeddings shape={matrix.shape}")
         print(f"total_tokens={total_tokens}")
 
-    if not brief_emb["result"]:
-        return {"similarity": -1} # return no embeddings
+    return {"result": matrix, "elapsed_seconds": 0, "total_tokens": total_tokens, "usage": usage}
 
-    sim_scores = []
-    for doc in fact_check:
-        doc_emb = get_embeddings(doc.text)
-        total_tokens += doc_emb.get("total_tokens", 1)
-        sim_scores.append(cosine_similarity(brief_emb["result"], doc_emb["result"]))
 
-    # Guard against an empty list
-    avg_sim = sum(sim_scores) / len(sim_scores) if sim_scores else 0.0
-    return {"similarity": avg_sim}
+@timer
+def evaluate(brief: Dict, fact_check: List[Document], corpus_embeddings: Optional[np.ndarray] = None,
+             modules: Optional[List[str]] = None) -> Dict:
+    """
+    Score *brief* against the fact-check corpus, cheapest checks first.
 
+    Briefs failing ``gate`` (missing keys, modules that do not match the
+    reference *modules*) score 0 without any model call.  Otherwise the
+    whole brief and each section in SECTIONS are embedded in one batch and
+    compared to every corpus document in one similarity matrix:
+    ``similarity`` is the whole brief's mean over the corpus, and
+    ``sections`` holds each section's best match (its strongest support).
 
-def get_embeddings(text):
+    With ``eval_backend: lexical`` the same scores come from hashed
+    TF-IDF/BM25 vectors (lexical.py), calibrated onto the embedding scale,
+    without any model call.  With ``lexical_calibrate`` embedding-scored
+    briefs are also scored lexically to fit that calibration.
+    """
     total_tokens = 0
+    usage = {}
+    cfg = load_config()
+    DEBUG = cfg["DEBUG"] == 1
+
+    checks = gate(brief, modules, cfg)
+    tracing.current().set(gate_passed=checks["passed"])
+    if not checks["passed"]:
+        print(f"brief rejected before scoring: {checks['reason']}")
+        return {"similarity": 0.0, "sections": {}, "gate": checks, "total_tokens": 0, "usage": usage}
+
+    if corpus_embeddings is None:
+        corpus = embed_corpus(fact_check)
+        corpus_embeddings = corpus["result"]
+        total_tokens += corpus["total_tokens"]
+        merge_usage(usage, corpus["usage"])
+
+    sections = [k for k in SECTIONS if flatten(brief.get(k))]
+    texts = [flatten(brief)] + [f"{k}: {flatten(brief[k])}" for k in sections]
+
+    if isinstance(corpus_embeddings, LexicalCorpus):
+        if not corpus_embeddings.size:
+            return {"similarity": -1, "sections": {}, "gate": checks, "total_tokens": 0, "usage": usage}
+        raw, scores = lexical.score(cfg, corpus_embeddings, texts)
+        avg_sim = float(scores[0].mean())
+        section_scores = {k: float(scores[i + 1].max()) for i, k in enumerate(sections)}
+        tracing.current().set(similarity=avg_sim, backend="lexical")
+        return {"similarity": avg_sim, "raw_similarity": float(raw[0].mean()), "sections": section_scores,
+                "gate": checks, "backend": "lexical", "total_tokens": 0, "usage": usage}
+
+    brief_emb = get_embeddings(texts)
+    total_tokens += brief_emb.get("total_tokens", 0)
+    merge_usage(usage, brief_emb["usage"])
+
+    if DEBUG:
+        print("DEBUG")
+        print(f"brief_emb: {brief_emb}")
+        print(f"total_tokens={total_tokens}")
+
+    if not brief_emb["result"] or not corpus_embeddings.size:
+        return {"similarity": -1, "sections": {}, "gate": checks, "total_tokens": total_tokens, "usage": usage} # return no embeddings
+
+    # one (1 + sections, docs) matrix scores the brief and every section against every document
+    scores = cosine_similarity_matrix(np.asarray(brief_emb["result"], dtype=float), corpus_embeddings)
+    avg_sim = float(scores[0].mean())
+    section_scores = {k: float(scores[i + 1].max()) for i, k in enumerate(sections)}
+    tracing.current().set(similarity=avg_sim)
+    if int(cfg.get("lexical_calibrate", 0)) == 1:
+        corpus = lexical.get_corpus(cfg, [doc.text for doc in fact_check])
+        lexical.add_calibration_pair(cfg, float(corpus.similarity(texts[:1])[0].mean()), avg_sim)
+    return {"similarity": avg_sim, "sections": section_scores, "gate": checks,
+            "total_tokens": total_tokens, "usage": usage}
+
+
+def get_embeddings(text: str | List[str]):
+    usage = {}
     cfg = load_config()
     DEBUG = cfg["DEBUG"] == 1
     embeddings_model_name = cfg["embeddings_model_name"]
-    response = ollama.embed(model=embeddings_model_name, input=text)
+    response = llm.embed(cfg, model=embeddings_model_name, input=text)
 
-    total_tokens += token_count(text) + token_count(str(response))
+    add_usage(usage, embeddings_model_name,
+              response_usage(response, text if isinstance(text, str) else "\n".join(text)))
+    total_tokens = usage_tokens(usage)
 
     if DEBUG:
         print("DEBUG")
@@ -55,6 +215,5 @@ def get_embeddings(text):
         print(f"response={response}")
         print(f"embeddings_model_name={embeddings_model_name}")
         print(f"total_tokens={total_tokens}")
-    
-    return {"result": response["embeddings"], "elapsed_seconds": 0, "total_tokens": total_tokens}
 
+    return {"result": response["embeddings"], "elapsed_seconds": 0, "total_tokens": total_tokens, "usage": usage}
@@ -1,10 +1,15 @@
 import json
+import time
 
-from typing import Dict, List
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
-import ollama
+import llm
+import tracing
 from ingest import Document
-from utils import timer, load_config, extract_json, token_count
+from resilience import Deadline, call_deadline, stage_deadline
+from utils import timer, load_config, extract_json, token_count, add_usage, merge_usage, response_usage, usage_tokens
 
 
 @timer
@@ -12,43 +17,303 @@ def extract_entities(docs: List[Document]) -> Dict:
     """
     For each document, call the LLM with the extraction prompt and
     return a list of extracted entities.
+
+    Documents too long for ``extract_context_tokens`` are split into
+    overlapping windows (map) whose entities are merged back into one
+    record per source file (reduce), across the chunks ingest split it
+    into; the windows are kept as provenance.
+    Windows are sent concurrently, up to ``extract_max_in_flight``
+    requests at a time (1 = serial).  Results keep the input order.
+    Once the ``extraction`` stage budget is spent, remaining windows are
+    skipped rather than waited on.
+
+    With ``extract_pack_documents`` small documents share one request
+    (see ``plan_packs``); the packed answer is keyed by doc_id and split
+    back into one record per document.
     """
     cfg = load_config()
-    DEBUG = cfg["DEBUG"] == 1
-    prompt_template = cfg["extraction_prompt"]
+    stage = stage_deadline(cfg, "extraction")
+    max_in_flight = max(1, int(cfg.get("extract_max_in_flight", 1)))
+
+    windows = []
+    for doc_no, doc in enumerate(docs):
+        for start, end in plan_windows(doc.text, cfg):
+            windows.append((doc_no, start, end))
+    units = plan_packs(docs, windows, cfg)
+
+    def run(unit: List[Tuple[int, int, int]]) -> List[Dict]:
+        if len(unit) > 1:
+            return _extract_pack([docs[doc_no] for doc_no, _, _ in unit], cfg, stage)
+        doc_no, start, end = unit[0]
+        doc = docs[doc_no]
+        if (start, end) == (0, len(doc.text)):
+            return [_extract_text(doc.doc_id, doc.text, cfg, stage)]
+        return [_extract_text(f"{doc.doc_id}[{start}:{end}]", doc.text[start:end], cfg, stage)]
+
+    if max_in_flight == 1 or len(units) <= 1:
+        unit_outcomes = [run(unit) for unit in units]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_in_flight, len(units))) as pool:
+            unit_outcomes = list(pool.map(tracing.propagate(run), units))
+
+    # reduce per source file: ingest may have split a large source into name#0, name#1, ...
+    per_source: Dict[str, List[Tuple[Document, int, int, Dict]]] = {}
+    for doc in docs:
+        per_source.setdefault(doc.source or doc.doc_id, [])
+    for unit, outcomes in zip(units, unit_outcomes):
+        for (doc_no, start, end), outcome in zip(unit, outcomes):
+            doc = docs[doc_no]
+            per_source[doc.source or doc.doc_id].append((doc, start, end, outcome))
+    packs = [outcomes for outcomes in unit_outcomes if len(outcomes) > 1]
+    order = {id(doc): doc_no for doc_no, doc in enumerate(docs)}
+
     results = []
+    document_seconds = {}
     total_tokens = 0
+    usage = {}
+    for source, parts in per_source.items():
+        parts.sort(key=lambda part: (order[id(part[0])], part[1]))
+        total_tokens += sum(outcome["total_tokens"] for _, _, _, outcome in parts)
+        for _, _, _, outcome in parts:
+            merge_usage(usage, outcome["usage"])
+        document_seconds[source] = sum(outcome["elapsed_seconds"] for _, _, _, outcome in parts)
+        found = [(doc, start, end, outcome["entities"]) for doc, start, end, outcome in parts
+                 if outcome["entities"] is not None]
+        if not found:
+            continue
+        if len(parts) == 1:
+            results.append({"source": source, "entities": found[0][3]})
+        else:
+            results.append({
+                "source": source,
+                "entities": merge_window_entities([entities for _, _, _, entities in found]),
+                # start and end are character offsets in the chunk's text
+                "windows": [
+                    {"chunk": doc.doc_id, "start": start, "end": end, "entities": entities}
+                    for doc, start, end, entities in found
+                ],
+            })
 
-    for doc in docs:
-        print(f"extracting {doc.doc_id}")
-        prompt = prompt_template + f"\n\nText:\n{doc.text}"
-        try:
-            resp = ollama.chat(
-                model=cfg["extract_model_name"],
-                messages=[{"role": "user", "content": prompt}],
-                options={
-                    "temperature": cfg["temperature"],
-                    "max_tokens": cfg["max_tokens"],
-                },
-            )            
-
-            total_tokens += token_count(prompt) + token_count(str(resp))
-
-            if DEBUG:
-                print(f"LLM Response Content: {resp}")
-
-            # The model should return a JSON object
-            # just in case, attempty to extract json from response content
-            json_string = extract_json(resp["message"]["content"])
-
-            if DEBUG:
-                print(f"json extracted : {json_string}")
-
-            if json_string:
-                entity = json.loads(json_string)
-                results.append({"source": doc.doc_id, "entities": entity})
-            
-        except Exception as e:            
-            print(f"Extraction error for {doc.doc_id}: {e}")        
-    return {"result": results, "elapsed_seconds": 0, "total_tokens": total_tokens}
+    return {
+        "result": results,
+        "elapsed_seconds": 0,
+        "total_tokens": total_tokens,
+        "usage": usage,
+        "document_seconds": document_seconds,
+        "packed_calls": len(packs),
+        "packed_documents": sum(len(outcomes) for outcomes in packs),
+        "pack_fallbacks": sum(1 for outcomes in packs for outcome in outcomes if outcome.get("fallback")),
+    }
+
+
+def extract_window_chars(cfg: Dict) -> int:
+    """
+    Characters of document text that fit one extraction request: the
+    extract model's context less a quarter for the response and the
+    prompt itself.  Also the default ingest chunk size, so a chunk is
+    extracted in one request.
+    """
+    context_tokens = int(cfg.get("extract_context_tokens", 8192))
+    budget_tokens = context_tokens - context_tokens // 4 - token_count(cfg["extraction_prompt"])
+    # token_count estimates 4 characters per token
+    return max(256, budget_tokens * 4)
+
+
+def plan_windows(text: str, cfg: Dict) -> List[Tuple[int, int]]:
+    """
+    Character windows of *text* that fit the extract model's context
+    (see ``extract_window_chars``).
+
+    Consecutive windows overlap by ``extract_window_overlap_tokens`` so
+    entities cut at a boundary are seen whole at least once.  Window
+    ends are moved back to the nearest line or word break.
+    """
+    window_chars = extract_window_chars(cfg)
+    overlap_chars = min(int(cfg.get("extract_window_overlap_tokens", 256)) * 4, window_chars // 2)
+
+    if len(text) <= window_chars:
+        return [(0, len(text))]
+
+    windows = []
+    start = 0
+    while True:
+        end = min(start + window_chars, len(text))
+        if end < len(text):
+            brk = max(text.rfind("\n", start + window_chars // 2, end),
+                      text.rfind(" ", start + window_chars // 2, end))
+            if brk > start:
+                end = brk + 1
+        windows.append((start, end))
+        if end >= len(text):
+            return windows
+        start = end - overlap_chars
+
+
+def plan_packs(docs: List[Document], windows: List[Tuple[int, int, int]], cfg: Dict) -> List[List[Tuple[int, int, int]]]:
+    """
+    Group *windows* into requests.  Whole documents of at most
+    ``extract_pack_tokens`` are bin-packed (first fit, largest first) into
+    packs of up to ``extract_pack_max_docs`` documents and
+    ``extract_pack_tokens`` tokens; every other window is a request of
+    its own.  Requests keep the order of their first window.
+    """
+    if int(cfg.get("extract_pack_documents", 0)) != 1:
+        return [[window] for window in windows]
+    budget = int(cfg.get("extract_pack_tokens", 2048))
+    max_docs = max(1, int(cfg.get("extract_pack_max_docs", 8)))
+
+    singles = []
+    candidates = []
+    for i, (doc_no, start, end) in enumerate(windows):
+        tokens = token_count(docs[doc_no].text)
+        if (start, end) == (0, len(docs[doc_no].text)) and tokens <= budget:
+            candidates.append((tokens, i))
+        else:
+            singles.append([i])
+    bins: List[Tuple[int, List[int]]] = []
+    for tokens, i in sorted(candidates, key=lambda c: -c[0]):
+        for b, (used, members) in enumerate(bins):
+            if used + tokens <= budget and len(members) < max_docs:
+                bins[b] = (used + tokens, members + [i])
+                break
+        else:
+            bins.append((tokens, [i]))
+
+    units = singles + [sorted(members) for _, members in bins]
+    units.sort(key=lambda members: members[0])
+    return [[windows[i] for i in members] for members in units]
+
+
+def merge_window_entities(parts: List[Dict]) -> Dict:
+    """
+    Reduce per-window entities into one record: the most frequent client
+    name, and the ordered union of every list field.
+    """
+    names = Counter()
+    merged: Dict = {"client_name": "", "goals": [], "deliverables": []}
+    seen: Dict[str, set] = {}
+    for part in parts:
+        if not isinstance(part, dict):
+            continue
+        for key, value in part.items():
+            if key == "client_name":
+                if value:
+                    names[str(value).strip()] += 1
+                continue
+            values = value if isinstance(value, list) else [value]
+            bucket = merged.setdefault(key, [])
+            keys = seen.setdefault(key, set())
+            for item in values:
+                marker = item.strip().casefold() if isinstance(item, str) else json.dumps(item, sort_keys=True)
+                if item and marker not in keys:
+                    keys.add(marker)
+                    bucket.append(item)
+    if names:
+        merged["client_name"] = names.most_common(1)[0][0]
+    return merged
+
+
+def _extract_text(label: str, text: str, cfg: Dict, stage: Deadline | None = None) -> Dict:
+    """Extract entities from one document or window; errors are contained here."""
+    prompt = cfg["extraction_prompt"] + f"\n\nText:\n{text}"
+    usage = {}
+
+    print(f"extracting {label}")
+    start = time.perf_counter()
+    with tracing.span("document", doc_id=label, chars=len(text)) as span:
+        entities = _extract_with_llm(label, prompt, cfg, usage, stage)
+        span.set(found=entities is not None)
+
+    return {
+        "entities": entities,
+        "elapsed_seconds": time.perf_counter() - start,
+        "total_tokens": usage_tokens(usage),
+        "usage": usage,
+    }
+
+
+def _extract_pack(docs: List[Document], cfg: Dict, stage: Deadline | None = None) -> List[Dict]:
+    """
+    Extract entities from several whole documents in one request, one
+    outcome per document.  Documents missing from the answer (or all of
+    them, when it is not a JSON object) are extracted again on their own.
+    """
+    sections = "\n\n".join(f"=== DOCUMENT {doc.doc_id} ===\n{doc.text}\n=== END {doc.doc_id} ===" for doc in docs)
+    prompt = cfg["extraction_prompt"] + "\n\n" + cfg["extraction_pack_prompt"] + f"\n\nText:\n{sections}"
+    label = f"pack of {len(docs)} ({', '.join(doc.doc_id for doc in docs)})"
+    usage = {}
+
+    print(f"extracting {label}")
+    start = time.perf_counter()
+    with tracing.span("document_pack", doc_ids=[doc.doc_id for doc in docs], chars=len(sections)) as span:
+        answer = _extract_with_llm(label, prompt, cfg, usage, stage)
+        by_id = answer if isinstance(answer, dict) else {}
+        # tolerate models that change the case of the ids
+        folded = {str(k).casefold(): v for k, v in by_id.items()}
+        found = [by_id.get(doc.doc_id, folded.get(doc.doc_id.casefold())) for doc in docs]
+        span.set(found=sum(isinstance(entities, dict) for entities in found))
+    elapsed = time.perf_counter() - start
+
+    outcomes = []
+    for i, (doc, entities) in enumerate(zip(docs, found)):
+        # the pack's tokens are booked on its first document
+        outcome = {
+            "entities": entities,
+            "elapsed_seconds": elapsed / len(docs),
+            "total_tokens": usage_tokens(usage) if i == 0 else 0,
+            "usage": usage if i == 0 else {},
+        }
+        if not isinstance(entities, dict):
+            print(f"packed answer has no entities for {doc.doc_id}; extracting it alone")
+            single = _extract_text(doc.doc_id, doc.text, cfg, stage)
+            combined = {}
+            merge_usage(combined, outcome["usage"])
+            merge_usage(combined, single["usage"])
+            outcome = {
+                "entities": single["entities"],
+                "elapsed_seconds": outcome["elapsed_seconds"] + single["elapsed_seconds"],
+                "total_tokens": outcome["total_tokens"] + single["total_tokens"],
+                "usage": combined,
+                "fallback": True,
+            }
+        outcomes.append(outcome)
+    return outcomes
+
+
+def _extract_with_llm(label: str, prompt: str, cfg: Dict, usage: Dict, stage: Deadline | None = None) -> Dict | None:
+    DEBUG = cfg["DEBUG"] == 1
+    entities = None
+    try:
+        resp = llm.chat(
+            cfg,
+            model=cfg["extract_model_name"],
+            messages=[{"role": "user", "content": prompt}],
+            options={
+                "temperature": cfg["temperature"],
+                "max_tokens": cfg["max_tokens"],
+            },
+            until_json=True,
+            deadline=call_deadline(cfg, "extraction", stage),
+            hedge=int(cfg.get("hedge_extraction", 0)) == 1,
+        )
+
+        add_usage(usage, cfg["extract_model_name"], response_usage(resp, prompt))
+
+        if DEBUG:
+            print(f"LLM Response Content: {resp}")
+
+        # The model should return a JSON object
+        # just in case, attempty to extract json from response content
+        json_string = extract_json(resp["message"]["content"])
+
+        if DEBUG:
+            print(f"json extracted : {json_string}")
+
+        if json_string:
+            entities = json.loads(json_string)
+
+    except Exception as e:
+        tracing.current().set(error=f"{type(e).__name__}: {e}")
+        print(f"Extraction error for {label}: {e}")
 
+    return entities
@@ -1,36 +1,49 @@
 import json
-from typing import Dict
+import threading
+from typing import Dict, Optional
 
-import ollama
-from utils import timer, load_config, extract_json, token_count
+import llm
+import tracing
+from resilience import Deadline, call_deadline
+from utils import timer, load_config, extract_json, token_count, add_usage, response_usage, usage_tokens
 
 
 @timer
-def generate_brief(index: Dict, brief_attempt=1) -> Dict:
-    total_tokens = 0
+def generate_brief(index: Dict, brief_attempt=1, cancel: Optional[threading.Event] = None,
+                   deadline: Optional[Deadline] = None, model: Optional[str] = None) -> Dict:
+    usage = {}
 
     """
     Uses the brief prompt to turn the index into a structured brief.
+    Setting *cancel* aborts an in-flight generation; the result is then
+    None and ``cancelled`` is True.  The call is also bounded by the
+    ``generation`` call deadline, capped by the stage *deadline*.
+    *model* overrides the ``brief_model_names`` entry for the attempt.
     """
     print(f"(attempt {brief_attempt})")
     print(f"generating brief")
     cfg = load_config()
     DEBUG = cfg["DEBUG"] == 1
     prompt = cfg["brief_prompt"] + f"\n\nIndex:\n{json.dumps(index, indent=2)}"
+    models = cfg.get("brief_model_names", "").split(",")
+    model_index = max(0, min(brief_attempt - 1, len(models) - 1))
+    model_name = model or models[model_index]
+    tracing.current().set(model=model_name, attempt=brief_attempt)
     try:
-        models = cfg.get("brief_model_names", "").split(",")
-        model_index = max(0, min(brief_attempt - 1, len(models) - 1))
-        model_name = models[model_index]
-        resp = ollama.chat(
+        resp = llm.chat(
+            cfg,
             model=model_name,
             messages=[{"role": "user", "content": prompt}],
                 options={
                     "temperature": cfg["temperature"],
                     "max_tokens": cfg["max_tokens"],
                 },
+            cancel=cancel,
+            until_json=True,
+            deadline=call_deadline(cfg, "generation", deadline),
         )
         
-        total_tokens += token_count(prompt) + token_count(str(resp))
+        add_usage(usage, model_name, response_usage(resp, prompt))
 
         if DEBUG:
             print(resp)
@@ -47,6 +60,14 @@ def generate_brief(index: Dict, brief_attempt=1) -> Dict:
         else:
             raise ValueError("no json found in LLM response")
 
+    except llm.Cancelled as e:
+        print(f"Brief generation cancelled ({model_name})")
+        # the prompt was (at least partly) evaluated before the cancel, plus what was streamed
+        add_usage(usage, model_name, {"calls": 1, "estimated_calls": 1, "prompt_tokens": token_count(prompt),
+                                      "completion_tokens": e.completion_tokens})
+        return {"result": None, "cancelled": True, "model": model_name, "elapsed_seconds": 0,
+                "total_tokens": usage_tokens(usage), "usage": usage}
+
     except Exception as e:
         brief = {
             "summary": "",
@@ -56,6 +77,8 @@ def generate_brief(index: Dict, brief_attempt=1) -> Dict:
             "risks": "",
             "next_steps": "",
         }
+        tracing.current().set(error=f"{type(e).__name__}: {e}")
         print(f"Brief generation error: {e}")
 
-    return {"result": brief, "elapsed_seconds": 0, "total_tokens": total_tokens}
\ No newline at end of file
+    return {"result": brief, "model": model_name, "elapsed_seconds": 0,
+            "total_tokens": usage_tokens(usage), "usage": usage}
\ No newline at end of file
@@ -1,23 +1,242 @@
+import hashlib
 import json
-from typing import Dict, List
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
 
-from ingest import Document
-from utils import timer, write_json
+import numpy as np
+
+import llm
+from ingest import Document, SOURCE_PATTERNS
+from utils import (timer, load_config, read_json, write_json, add_usage, cosine_similarities,
+                   response_usage, token_count, usage_tokens)
+
+# what each brief section is looked up by in the vector index
+SECTION_QUERIES = {
+    "summary": "client name, project goals and scope of the implementation",
+    "modules": "software modules purchased, enabled or in scope",
+    "config_yaml": "module configuration, owners, start dates and milestones",
+    "risks": "risks, issues, blockers and concerns raised",
+    "next_steps": "action items, next steps, deliverables and timeline",
+}
+EMBED_BATCH = 64
 
 
 @timer
-def build_index(extracted: List[Document]) -> Dict:
+def build_index(entities: List[Dict]) -> Dict:
     print("indexing")
     """
-    Builds a JSON index of the form:
+    Builds a JSON index of the canonical entities (see canonical.py):
         {
-          "documents": [
-            { "source": "...", "entities": { ... } },
+          "entities": [
+            { "field": "...", "value": "...", "sources": [...], "mentions": n },
             ...
           ]
         }
     """
-    if not extracted:
+    if not entities:
         raise ValueError("No data was extracted")
-    index = {"documents": extracted}
-    return index
\ No newline at end of file
+    index = {"entities": entities}
+    return index
+
+
+# ------------------------------------------------------------------
+# Incremental indexing
+# ------------------------------------------------------------------
+def fingerprint_sources(data_dir: Path, previous: Dict | None = None) -> Dict[str, Dict]:
+    """
+    Return ``{file name: {"sha256", "size", "mtime"}}`` for every source file.
+
+    Files whose size and mtime match *previous* keep their old hash
+    instead of being read again.
+    """
+    previous = previous or {}
+    fingerprints = {}
+    for pattern in SOURCE_PATTERNS:
+        for p in sorted(data_dir.glob(pattern)):
+            st = p.stat()
+            old = previous.get(p.name)
+            if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime:
+                fingerprints[p.name] = old
+                continue
+            digest = hashlib.sha256()
+            with p.open("rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            fingerprints[p.name] = {"sha256": digest.hexdigest(), "size": st.st_size, "mtime": st.st_mtime}
+    return fingerprints
+
+
+def diff_sources(old: Dict[str, Dict], new: Dict[str, Dict]) -> Tuple[set, set]:
+    """Return (new or changed sources, deleted sources)."""
+    changed = {name for name, fp in new.items() if old.get(name, {}).get("sha256") != fp["sha256"]}
+    deleted = set(old) - set(new)
+    return changed, deleted
+
+
+def merge_records(
+    previous: Dict[str, List[Dict]],
+    fresh: Dict[str, List[Dict]],
+    order: Iterable[str],
+) -> Dict[str, List[Dict]]:
+    """
+    Combine per-source extraction records: *fresh* replaces *previous*
+    for the sources it covers, sources not in *order* are dropped, and
+    the result follows *order* (the corpus order).
+    """
+    merged = {}
+    for name in order:
+        if name in fresh:
+            merged[name] = fresh[name]
+        elif name in previous:
+            merged[name] = previous[name]
+    return merged
+
+
+def load_index_state(path: str) -> Dict:
+    """Previous fingerprints, per-source records and index; empty if none."""
+    try:
+        return read_json(path)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_index_state(path: str, state: Dict) -> None:
+    write_json(path, state, indent=2)
+
+
+# ------------------------------------------------------------------
+# Vector index for retrieval
+# ------------------------------------------------------------------
+def _split_text(text: str, max_chars: int) -> List[str]:
+    """Split *text* at line breaks into pieces of at most about *max_chars*."""
+    pieces, current = [], ""
+    for line in text.splitlines(keepends=True):
+        if current and len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        pieces.append(current)
+    return [p.strip() for p in pieces if p.strip()]
+
+
+def index_items(texts: List[Document], entities: List[Dict], max_chars: int) -> List[Dict]:
+    """
+    The retrievable items: source text chunks and every canonical entity,
+    each as ``{"kind", "source", "text", "sha256"}``.
+    """
+    items = []
+    for doc in texts:
+        for piece in _split_text(doc.text, max_chars):
+            items.append({"kind": "chunk", "source": doc.doc_id, "text": piece})
+    for entity in entities:
+        items.append({
+            "kind": "entity",
+            "source": ", ".join(entity["sources"]),
+            "text": f"{entity['field']}: {entity['value']}",
+        })
+    for item in items:
+        item["sha256"] = hashlib.sha256(item["text"].encode("utf-8")).hexdigest()
+    return items
+
+
+def load_vector_index(prefix: str) -> Tuple[np.ndarray, Dict] | None:
+    """The matrix and ``{"model", "items"}`` saved by ``build_vector_index``, or None."""
+    try:
+        return np.load(f"{prefix}.npy"), read_json(f"{prefix}.json")
+    except (OSError, ValueError):
+        return None
+
+
+@timer
+def build_vector_index(texts: List[Document], entities: List[Dict], work_folder: str) -> Dict:
+    """
+    Embed the corpus chunks and canonical entities into a (n_items, dim)
+    matrix, saved as ``<vector_index_file>.npy`` with the item metadata in
+    ``<vector_index_file>.json``.
+
+    Rows whose text is unchanged since the saved index are reused, so
+    only new chunks and entities are embedded.
+    """
+    cfg = load_config()
+    model = cfg["embeddings_model_name"]
+    prefix = f"{work_folder}/{cfg.get('vector_index_file', 'vector_index')}"
+    items = index_items(texts, entities, int(cfg.get("retrieval_chunk_chars", 1200)))
+
+    known = {}
+    previous = load_vector_index(prefix)
+    if previous is not None:
+        matrix, meta = previous
+        if meta.get("model") == model and len(meta.get("items", [])) == len(matrix):
+            known = {item["sha256"]: matrix[row] for row, item in enumerate(meta["items"])}
+
+    usage = {}
+    reused = sum(1 for item in items if item["sha256"] in known)
+    missing = list(dict.fromkeys(item["text"] for item in items if item["sha256"] not in known))
+    for start in range(0, len(missing), EMBED_BATCH):
+        batch = missing[start:start + EMBED_BATCH]
+        response = llm.embed(cfg, model=model, input=batch)
+        add_usage(usage, model, response_usage(response, "\n".join(batch)))
+        for text, vector in zip(batch, response["embeddings"]):
+            known[hashlib.sha256(text.encode("utf-8")).hexdigest()] = np.asarray(vector, dtype=float)
+
+    matrix = np.vstack([known[item["sha256"]] for item in items]) if items else np.zeros((0, 0))
+    np.save(f"{prefix}.npy", matrix)
+    write_json(f"{prefix}.json", {"model": model, "items": items}, indent=2)
+    return {
+        "result": {"matrix": matrix, "items": items},
+        "elapsed_seconds": 0,
+        "total_tokens": usage_tokens(usage),
+        "usage": usage,
+        "embedded": len(missing),
+        "reused": reused,
+    }
+
+
+@timer
+def retrieve_evidence(vector_index: Dict) -> Dict:
+    """
+    Pick the best-matching items for each brief section in SECTION_QUERIES.
+
+    Sections share ``retrieval_token_budget`` equally and take at most
+    ``retrieval_top_k`` items each; an item is only used once, by the
+    section that reaches it first.
+    """
+    cfg = load_config()
+    model = cfg["embeddings_model_name"]
+    matrix, items = vector_index["matrix"], vector_index["items"]
+    evidence: Dict[str, List[Dict]] = {section: [] for section in SECTION_QUERIES}
+    usage = {}
+    if not items:
+        return {"result": evidence, "elapsed_seconds": 0, "total_tokens": 0, "usage": usage, "evidence_tokens": 0}
+
+    queries = list(SECTION_QUERIES.values())
+    response = llm.embed(cfg, model=model, input=queries)
+    add_usage(usage, model, response_usage(response, "\n".join(queries)))
+
+    top_k = int(cfg.get("retrieval_top_k", 8))
+    section_budget = int(cfg.get("retrieval_token_budget", 3000)) // len(SECTION_QUERIES)
+    used_rows, evidence_tokens = set(), 0
+    for section, query in zip(SECTION_QUERIES, response["embeddings"]):
+        scores = cosine_similarities(matrix, query)
+        budget = section_budget
+        for row in np.argsort(-scores):
+            if len(evidence[section]) >= top_k:
+                break
+            if row in used_rows:
+                continue
+            tokens = token_count(items[row]["text"])
+            if tokens > budget:
+                continue
+            used_rows.add(row)
+            budget -= tokens
+            evidence_tokens += tokens
+            evidence[section].append({"source": items[row]["source"], "text": items[row]["text"]})
+
+    return {
+        "result": evidence,
+        "elapsed_seconds": 0,
+        "total_tokens": usage_tokens(usage),
+        "usage": usage,
+        "evidence_tokens": evidence_tokens,
+    }
@@ -1,13 +1,28 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from itertools import chain
 from pathlib import Path
+from typing import Any, Iterator, List, Tuple
 import json
 import csv
+import mmap
+
+# files read by build_corpus / iter_corpus
+SOURCE_PATTERNS = ("transcript_*.txt", "*.csv", "salesforce_export.json")
+# chunk size used when the caller does not pass one
+DEFAULT_CHUNK_CHARS = 8000
+# read size for buffered (non memory-mapped) I/O
+READ_BUFFER_BYTES = 1 << 20
 
 @dataclass
 class Document:
     doc_id: str
     text: str
+    # where the chunk came from: byte offsets for text files, row numbers
+    # for CSV files, record numbers for JSON exports (end is exclusive)
+    source: str = ""
+    start: int = 0
+    end: int = 0
 
 def load_transcripts(data_dir: Path) -> list[Document]:
     docs: list[Document] = []
@@ -34,11 +49,238 @@ def load_salesforce_export(data_dir: Path) -> dict:
     print(f"reading {p.name}")
     return json.loads(p.read_text()) if p.exists() else {}
 
-def build_corpus(data_dir: Path) -> list[Document]:
-    docs = []
-    docs.extend(load_transcripts(data_dir))
-    docs.extend(load_spreadsheets(data_dir))
-    sf = load_salesforce_export(data_dir)
-    if sf:
-        docs.append(Document(doc_id="salesforce_export.json", text=json.dumps(sf)))
-    return docs
+def build_corpus(data_dir: Path, max_chars: int | None = None) -> list[Document]:
+    return list(iter_corpus(data_dir, max_chars or DEFAULT_CHUNK_CHARS))
+
+# ------------------------------------------------------------------
+# Streaming ingestion
+# ------------------------------------------------------------------
+def iter_corpus(data_dir: Path, max_chars: int = DEFAULT_CHUNK_CHARS) -> Iterator[Document]:
+    """
+    Yield the corpus as Documents of at most ~``max_chars`` characters.
+
+    Files are never held in memory whole: transcripts are memory-mapped
+    and split on paragraphs, CSVs are read row by row and the Salesforce
+    export record by record.  A file that fits in one chunk yields a
+    single Document with the same id and text as ``load_*`` would give;
+    larger files yield ``<name>#<n>`` chunks.
+    """
+    for p in sorted(data_dir.glob("transcript_*.txt")):
+        print(f"reading {p.name}")
+        yield from _with_ids(p.name, iter_text_chunks(p, max_chars))
+    for p in data_dir.glob("*.csv"):
+        print(f"reading {p.name}")
+        yield from _with_ids(p.name, iter_csv_chunks(p, max_chars))
+    p = data_dir / "salesforce_export.json"
+    if p.exists():
+        print(f"reading {p.name}")
+        yield from _with_ids(p.name, iter_json_chunks(p, max_chars))
+
+def _with_ids(name: str, chunks: Iterator[Tuple[str, int, int]]) -> Iterator[Document]:
+    """Turn (text, start, end) chunks into Documents, numbering them only if there are several."""
+    first = next(chunks, None)
+    if first is None:
+        return
+    second = next(chunks, None)
+    if second is None:
+        text, start, end = first
+        yield Document(doc_id=name, text=text, source=name, start=start, end=end)
+        return
+    for i, (text, start, end) in enumerate(chain([first, second], chunks)):
+        yield Document(doc_id=f"{name}#{i}", text=text, source=name, start=start, end=end)
+
+def iter_text_chunks(path: Path, max_chars: int) -> Iterator[Tuple[str, int, int]]:
+    """Paragraph-aligned chunks of a text file, with byte offsets."""
+    with path.open("rb") as f:
+        size = path.stat().st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            chunk_start = pos = 0
+            while pos < size:
+                brk = mm.find(b"\n\n", pos)
+                para_end = size if brk == -1 else brk + 2
+                if para_end - chunk_start <= max_chars:
+                    pos = para_end
+                    continue
+                if pos > chunk_start:
+                    # close the chunk before this paragraph
+                    yield _decode(mm[chunk_start:pos]), chunk_start, pos
+                    chunk_start = pos
+                    continue
+                # a single paragraph larger than a chunk: cut on a line, else hard
+                cut = mm.rfind(b"\n", chunk_start, chunk_start + max_chars) + 1
+                if cut <= chunk_start:
+                    cut = chunk_start + max_chars
+                    while cut > chunk_start + 1 and mm[cut] & 0xC0 == 0x80:
+                        cut -= 1  # do not split a UTF-8 sequence
+                yield _decode(mm[chunk_start:cut]), chunk_start, cut
+                chunk_start = pos = cut
+            if chunk_start < size:
+                yield _decode(mm[chunk_start:size]), chunk_start, size
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n")
+
+def iter_csv_chunks(path: Path, max_chars: int) -> Iterator[Tuple[str, int, int]]:
+    """Row-aligned chunks of a CSV file (``k=v`` lines), with row numbers."""
+    with path.open(newline="", encoding="utf-8", buffering=READ_BUFFER_BYTES) as f:
+        lines: List[str] = []
+        size = 0
+        start = 0
+        row_no = 0
+        for row_no, row in enumerate(csv.DictReader(f)):
+            line = ", ".join(f"{k}={v}" for k, v in row.items())
+            if lines and size + len(line) + 1 > max_chars:
+                yield "\n".join(lines), start, row_no
+                lines, size, start = [], 0, row_no
+            lines.append(line)
+            size += len(line) + 1
+        if lines:
+            yield "\n".join(lines), start, row_no + 1
+
+def iter_json_chunks(path: Path, max_chars: int) -> Iterator[Tuple[str, int, int]]:
+    """
+    Record-aligned chunks of a JSON export, with record numbers.
+
+    Records are the items of a top-level array, or the members of a
+    top-level object, where array members contribute one record per item.
+    Each chunk is itself a JSON document holding its records.
+    """
+    if path.stat().st_size <= max_chars:
+        with path.open(encoding="utf-8") as f:
+            data = json.load(f)
+        if data:
+            yield json.dumps(data), 0, 1
+        return
+
+    group: List[Tuple[Any, bool, Any]] = []
+    size = 0
+    start = 0
+    record_no = -1
+    for record_no, (key, is_item, value) in enumerate(_iter_json_records(path)):
+        length = len(json.dumps(value)) + len(str(key)) + 4
+        if group and size + length > max_chars:
+            yield _records_to_json(group), start, record_no
+            group, size, start = [], 0, record_no
+        group.append((key, is_item, value))
+        size += length
+    if group:
+        yield _records_to_json(group), start, record_no + 1
+
+def _records_to_json(group: List[Tuple[Any, bool, Any]]) -> str:
+    if all(key is None for key, _, _ in group):
+        return json.dumps([value for _, _, value in group])
+    merged: dict = {}
+    for key, is_item, value in group:
+        if is_item:
+            merged.setdefault(key, []).append(value)
+        else:
+            merged[key] = value
+    return json.dumps(merged)
+
+def _iter_json_records(path: Path) -> Iterator[Tuple[Any, bool, Any]]:
+    """Yield (key, is_array_item, value) records without loading the whole file."""
+    reader = _JsonReader(path)
+    try:
+        opening = reader.next_char()
+        if opening == "[":
+            for value in reader.iter_array():
+                yield None, True, value
+        elif opening == "{":
+            for key in reader.iter_object_keys():
+                if reader.peek_char() == "[":
+                    reader.next_char()
+                    for value in reader.iter_array():
+                        yield key, True, value
+                else:
+                    yield key, False, reader.value()
+        else:
+            raise ValueError(f"{path.name}: expected a JSON object or array")
+    finally:
+        reader.close()
+
+class _JsonReader:
+    """Minimal incremental reader over a buffered JSON file."""
+
+    def __init__(self, path: Path):
+        self._f = path.open(encoding="utf-8", buffering=READ_BUFFER_BYTES)
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, at_least: int = READ_BUFFER_BYTES) -> bool:
+        if self._eof:
+            return False
+        data = self._f.read(at_least)
+        if not data:
+            self._eof = True
+            return False
+        # drop what has been consumed so memory stays bounded by one record
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def close(self) -> None:
+        self._f.close()
+
+    def peek_char(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("unexpected end of JSON input")
+
+    def next_char(self) -> str:
+        ch = self.peek_char()
+        self._pos += 1
+        return ch
+
+    def value(self) -> Any:
+        self.peek_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # most likely a record cut by the buffer: read more and retry,
+                # growing the read so large records stay linear overall
+                if not self._fill(max(READ_BUFFER_BYTES, len(self._buf))):
+                    raise
+                continue
+            if end == len(self._buf) and self._fill():
+                # a number may continue past the buffer
+                continue
+            self._pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """Items of an array whose ``[`` was already consumed."""
+        if self.peek_char() == "]":
+            self.next_char()
+            return
+        while True:
+            yield self.value()
+            sep = self.next_char()
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"expected ',' or ']' in JSON array, got {sep!r}")
+
+    def iter_object_keys(self) -> Iterator[str]:
+        """Keys of an object whose ``{`` was already consumed; the caller reads each value."""
+        if self.peek_char() == "}":
+            self.next_char()
+            return
+        while True:
+            key = self.value()
+            if self.next_char() != ":":
+                raise ValueError("expected ':' in JSON object")
+            yield key
+            sep = self.next_char()
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"expected ',' or '}}' in JSON object, got {sep!r}")
@@ -0,0 +1,95 @@
+import json
+
+from typing import Any, Dict, Optional
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag(text: str, tag: str) -> str:
+    """The longest suffix of *text* that could be the start of *tag*."""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-size:]):
+            return text[-size:]
+    return ""
+
+
+class JsonObjectScanner:
+    """
+    Find the first complete top-level JSON object in streamed model output.
+
+    Text is fed chunk by chunk as it arrives.  ``<think>`` blocks and any
+    prose before the object are skipped; braces are only counted outside
+    JSON strings, and a balanced candidate that does not parse is dropped
+    and the search resumes one character after its opening brace.
+    ``feed`` returns the object (also kept in ``result``) as soon as its
+    closing brace arrives, so the caller can stop the generation there.
+    """
+
+    def __init__(self):
+        self.result: Optional[Dict[str, Any]] = None
+        self._pending = ""      # unscanned tail that may be a split think tag
+        self._in_think = False
+        self._candidate = []    # characters of the object being read
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> Optional[Dict[str, Any]]:
+        if self.result is not None:
+            return self.result
+        text = self._pending + text
+        self._pending = ""
+        i = 0
+        while i < len(text):
+            if self._depth == 0:
+                if self._in_think:
+                    end = text.find(THINK_CLOSE, i)
+                    if end < 0:
+                        self._pending = _partial_tag(text[i:], THINK_CLOSE)
+                        return None
+                    self._in_think = False
+                    i = end + len(THINK_CLOSE)
+                    continue
+                think = text.find(THINK_OPEN, i)
+                brace = text.find("{", i)
+                if think >= 0 and (brace < 0 or think < brace):
+                    self._in_think = True
+                    i = think + len(THINK_OPEN)
+                    continue
+                if brace < 0:
+                    self._pending = _partial_tag(text[i:], THINK_OPEN)
+                    return None
+                i = brace
+
+            c = text[i]
+            self._candidate.append(c)
+            i += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{":
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = "".join(self._candidate)
+                    self._candidate = []
+                    try:
+                        obj = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        self.result = obj
+                        return obj
+                    # not JSON after all: rescan from just past its opening brace
+                    text = candidate[1:] + text[i:]
+                    i = 0
+                    self._in_string = self._escape = False
+        return None
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN = re.compile(r"\w+")
+# corpora kept in memory, most recently used last
+CACHE_SIZE = 8
+
+
+def _bucket(token: str, features: int) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little") % features
+
+
+def term_counts(text: str, features: int) -> Counter:
+    """Hashed unigram and bigram counts of *text*."""
+    words = TOKEN.findall(text.lower())
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return Counter(_bucket(t, features) for t in terms)
+
+
+class LexicalCorpus:
+    """
+    Hashed TF-IDF or BM25 vectors of a corpus, stored sparse (CSR) and
+    L2-normalized, so a brief is scored against every document with one
+    gather, multiply and segment sum.
+    """
+
+    def __init__(self, texts: List[str], method: str = "bm25", features: int = 1 << 16,
+                 k1: float = 1.2, b: float = 0.75):
+        self.method = method
+        self.features = features
+        self.k1 = k1
+        self.b = b
+        counts = [term_counts(t, features) for t in texts]
+        self.size = len(texts)
+        df = np.zeros(features)
+        for c in counts:
+            df[list(c)] += 1
+        self.idf = np.log((1 + self.size) / (1 + df)) + 1
+        lengths = np.array([sum(c.values()) for c in counts], dtype=float)
+        self.avg_length = float(lengths.mean()) if self.size else 0.0
+
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for c, length in zip(counts, lengths):
+            idx = np.fromiter(c.keys(), dtype=np.int64, count=len(c))
+            tf = np.fromiter(c.values(), dtype=float, count=len(c))
+            weights = self._weights(idx, tf, length)
+            norm = np.linalg.norm(weights)
+            indices.extend(idx.tolist())
+            data.extend((weights / norm if norm else weights).tolist())
+            indptr.append(len(indices))
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=float)
+
+    def _weights(self, idx: np.ndarray, tf: np.ndarray, length: float) -> np.ndarray:
+        if self.method == "bm25":
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            return self.idf[idx] * tf * (self.k1 + 1) / (tf + norm)
+        return self.idf[idx] * (1 + np.log(tf))
+
+    def vectorize(self, texts: List[str]) -> np.ndarray:
+        """Dense, L2-normalized (len(texts), features) query vectors."""
+        out = np.zeros((len(texts), self.features))
+        for row, text in enumerate(texts):
+            c = term_counts(text, self.features)
+            if not c:
+                continue
+            idx = np.fromiter(c.keys(), dtype=np.int64, count=len(c))
+            tf = np.fromiter(c.values(), dtype=float, count=len(c))
+            weights = self._weights(idx, tf, float(tf.sum()))
+            out[row, idx] = weights / np.linalg.norm(weights)
+        return out
+
+    def similarity(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), documents) cosine similarities."""
+        queries = self.vectorize(texts)
+        sums = np.zeros((len(texts), self.size))
+        starts = self.indptr[:-1]
+        nonempty = starts < self.indptr[1:]
+        if nonempty.any():
+            products = queries[:, self.indices] * self.data
+            # segments of empty documents would be ill-defined: sum the others only
+            sums[:, nonempty] = np.add.reduceat(products, starts[nonempty], axis=1)
+        return sums
+
+
+_corpora: "OrderedDict[str, LexicalCorpus]" = OrderedDict()
+_corpora_lock = threading.Lock()
+
+
+def get_corpus(cfg: Dict, texts: List[str]) -> LexicalCorpus:
+    """The LexicalCorpus of *texts*, built once per distinct corpus and settings."""
+    method = cfg.get("lexical_method", "bm25")
+    features = int(cfg.get("lexical_features", 1 << 16))
+    digest = hashlib.sha256(json.dumps([method, features, texts]).encode()).hexdigest()
+    with _corpora_lock:
+        corpus = _corpora.get(digest)
+        if corpus is not None:
+            _corpora.move_to_end(digest)
+            return corpus
+    corpus = LexicalCorpus(texts, method, features)
+    with _corpora_lock:
+        _corpora[digest] = corpus
+        while len(_corpora) > CACHE_SIZE:
+            _corpora.popitem(last=False)
+    return corpus
+
+
+# ------------------------------------------------------------------
+# Calibration against the embedding scores
+# ------------------------------------------------------------------
+_calibration_lock = threading.Lock()
+
+
+def calibration_path(cfg: Dict) -> Path:
+    return Path(cfg.get("work_folder", "work")) / cfg.get("lexical_calibration_file", "lexical_calibration.json")
+
+
+def load_calibration(cfg: Dict) -> Optional[Dict]:
+    """The stored pairs and, once fitted, slope and intercept; None when the file is unreadable."""
+    path = calibration_path(cfg)
+    if not path.exists():
+        return {"pairs": []}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def calibration(cfg: Dict) -> Optional[Tuple[float, float]]:
+    """
+    The (slope, intercept) mapping lexical scores onto the embedding scale:
+    fitted from at least ``lexical_calibration_min_pairs`` pairs, else
+    ``lexical_calibration`` when it is set, else None.
+    """
+    stored = load_calibration(cfg) or {}
+    if "slope" in stored and len(stored.get("pairs", [])) >= int(cfg.get("lexical_calibration_min_pairs", 20)):
+        return float(stored["slope"]), float(stored["intercept"])
+    if cfg.get("lexical_calibration"):
+        slope, intercept = cfg["lexical_calibration"]
+        return float(slope), float(intercept)
+    return None
+
+
+def require_calibration(cfg: Dict) -> Tuple[float, float]:
+    """
+    ``calibration``, or a ValueError: raw lexical scores run far below
+    embedding scores, so uncalibrated they would fail every brief against
+    ``similarity_threshold``.
+    """
+    mapping = calibration(cfg)
+    if mapping is None:
+        stored = load_calibration(cfg) or {}
+        raise ValueError(
+            f"eval_backend lexical is not calibrated ({len(stored.get('pairs', []))} of "
+            f"{cfg.get('lexical_calibration_min_pairs', 20)} score pairs in {calibration_path(cfg)}): "
+            "run with eval_backend: embedding and lexical_calibrate: 1 until enough pairs are recorded, "
+            "or set lexical_calibration to a [slope, intercept] fitted elsewhere")
+    return mapping
+
+
+def add_calibration_pair(cfg: Dict, lexical: float, embedding: float) -> None:
+    """
+    Record a (lexical, embedding) score pair of the same brief and refit
+    the linear mapping by least squares once ``lexical_calibration_min_pairs``
+    pairs exist (a plain scale when the lexical scores do not vary).  The
+    most recent 1000 pairs are kept.  The file is replaced atomically, so
+    concurrent readers never see it half written.
+    """
+    with _calibration_lock:
+        stored = load_calibration(cfg)
+        if stored is None:
+            # never replace pairs we could not read
+            print(f"Unreadable calibration file {calibration_path(cfg)}; pair not recorded")
+            return
+        pairs = (stored.get("pairs", []) + [[lexical, embedding]])[-1000:]
+        stored["pairs"] = pairs
+        x = np.array([p[0] for p in pairs])
+        y = np.array([p[1] for p in pairs])
+        if len(pairs) >= int(cfg.get("lexical_calibration_min_pairs", 20)):
+            if np.ptp(x) > 1e-6:
+                slope, intercept = np.polyfit(x, y, 1)
+            else:
+                # every pair scored alike: the best fit is a scale through the origin
+                slope, intercept = (y.mean() / x.mean() if x.mean() else 1.0), 0.0
+            stored.update({"slope": float(slope), "intercept": float(intercept)})
+        path = calibration_path(cfg)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(stored, f)
+        os.replace(tmp, path)
+
+
+def score(cfg: Dict, corpus: LexicalCorpus, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Raw and calibrated (texts, documents) similarity matrices; the
+    calibration maps lexical scores onto the embedding scale, so
+    ``similarity_threshold`` keeps its meaning.
+    """
+    raw = corpus.similarity(texts)
+    slope, intercept = require_calibration(cfg)
+    return raw, np.clip(slope * raw + intercept, -1.0, 1.0)
@@ -0,0 +1,510 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import ollama
+import resilience
+import tracing
+from cache import ResponseCache
+from jsonstream import JsonObjectScanner
+from resilience import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded, LatencyTracker, StageBudgetExceeded
+from utils import extract_json
+
+# one cache per folder, shared by every stage (and thread) in the process
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+# one pooled keep-alive client per connection setting, shared like the caches
+_clients: Dict[tuple, ollama.Client] = {}
+_clients_lock = threading.Lock()
+
+# calls with a deadline or hedge run here, so the caller can stop waiting
+_call_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+_latencies: Dict[str, LatencyTracker] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_resilience_lock = threading.Lock()
+POLL_SECONDS = 0.2
+# deadline of the call running on this thread, applied to its HTTP requests by _cap_timeout
+_thread_deadline = threading.local()
+
+# optional semaphore bounding concurrent model calls; batch mode shares one
+# across all worker processes
+_call_slots = None
+
+
+def set_call_slots(slots) -> None:
+    """Install a (process-shared) semaphore limiting in-flight LLM calls."""
+    global _call_slots
+    _call_slots = slots
+
+
+# optional model-residency scheduler (see scheduler.py); batch mode installs
+# a proxy to one shared instance
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def set_scheduler(scheduler) -> None:
+    """Install a (possibly process-shared) ModelScheduler for every call."""
+    global _scheduler
+    _scheduler = scheduler
+
+
+def get_scheduler(cfg: Dict):
+    """Return the installed scheduler, creating one when ``scheduler_enabled``."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None and int(cfg.get("scheduler_enabled", 0)) == 1:
+            from scheduler import ModelScheduler
+            _scheduler = ModelScheduler(cfg)
+        return _scheduler
+
+
+def scheduler_events(cfg: Dict) -> List[Dict]:
+    scheduler = get_scheduler(cfg)
+    return scheduler.events() if scheduler is not None else []
+
+
+@contextmanager
+def _model_slot(cfg: Dict, model: str, kind: str):
+    """Wait until the scheduler (if any) has *model* loaded, then hold it."""
+    scheduler = get_scheduler(cfg)
+    if scheduler is None:
+        yield
+        return
+    scheduler.acquire(model, kind)
+    try:
+        yield
+    finally:
+        scheduler.release(model)
+
+
+@contextmanager
+def _call_slot():
+    if _call_slots is None:
+        yield
+        return
+    with _call_slots:
+        yield
+
+
+def get_client(cfg: Dict) -> ollama.Client:
+    """
+    Return the shared Ollama client for the host and timeouts in *cfg*.
+
+    The underlying httpx pool keeps connections open between calls, so
+    stages and threads reuse them instead of reconnecting per request.
+    An empty ``ollama_host`` falls back to ``OLLAMA_HOST``.
+    """
+    key = (
+        cfg.get("ollama_host") or None,
+        cfg.get("ollama_connect_timeout_seconds", 5),
+        cfg.get("ollama_timeout_seconds", 600),
+        cfg.get("ollama_max_connections", 8),
+    )
+    with _clients_lock:
+        if key not in _clients:
+            host, connect, read, connections = key
+            _clients[key] = ollama.Client(
+                host=host,
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+                event_hooks={"request": [_cap_timeout]},
+            )
+        return _clients[key]
+
+
+def _cap_timeout(request: httpx.Request) -> None:
+    """
+    httpx request hook: cap the request's timeouts at the deadline of the
+    call running on this thread, so an abandoned call gives up its pool
+    worker, scheduler slot and call slot instead of waiting for Ollama.
+    """
+    deadline = getattr(_thread_deadline, "deadline", None)
+    remaining = None if deadline is None else deadline.remaining()
+    if remaining is None:
+        return
+    if remaining <= 0:
+        raise DeadlineExceeded("no time left for the request")
+    timeout = dict(request.extensions.get("timeout") or {})
+    for phase in ("connect", "read", "write", "pool"):
+        timeout[phase] = remaining if timeout.get(phase) is None else min(timeout[phase], remaining)
+    request.extensions["timeout"] = timeout
+
+
+def keep_alive(cfg: Dict) -> Optional[str]:
+    """How long Ollama should keep a model loaded after a call (server default if unset)."""
+    return cfg.get("ollama_keep_alive") or None
+
+
+def warm_up(cfg: Dict, chat_models: List[str], embed_models: List[str]) -> Dict[str, float]:
+    """
+    Load *chat_models* and *embed_models* in parallel with empty requests,
+    so the first real call does not pay the cold-load cost.
+
+    Returns ``{model: seconds}``; models that fail to load are reported
+    and left out.
+    """
+    client = get_client(cfg)
+    models = [(m, False) for m in dict.fromkeys(chat_models)] + [(m, True) for m in dict.fromkeys(embed_models)]
+
+    scheduler = get_scheduler(cfg)
+
+    def load(model: str, is_embedding: bool) -> Optional[float]:
+        # with a scheduler, only preload what fits without evicting anything
+        if scheduler is not None and not scheduler.acquire(model, "embed" if is_embedding else "chat", preload=True):
+            return None
+        start = time.perf_counter()
+        try:
+            with tracing.span("llm.warm_up", model=model):
+                if is_embedding:
+                    client.embed(model=model, input="", keep_alive=keep_alive(cfg))
+                else:
+                    client.generate(model=model, prompt="", keep_alive=keep_alive(cfg))
+        finally:
+            if scheduler is not None:
+                scheduler.release(model)
+        return time.perf_counter() - start
+
+    loaded = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(models))) as pool:
+        futures = {pool.submit(tracing.propagate(load), m, e): m for m, e in models}
+        for future, model in futures.items():
+            try:
+                seconds = future.result()
+            except Exception as e:
+                print(f"Warm-up of {model} failed: {e}")
+                continue
+            if seconds is not None:
+                loaded[model] = seconds
+    return loaded
+
+
+def unload(cfg: Dict, model: str, kind: str = "chat") -> None:
+    """Ask Ollama to unload *model* now (``keep_alive=0``)."""
+    client = get_client(cfg)
+    if kind == "embed":
+        client.embed(model=model, input="", keep_alive=0)
+    else:
+        client.generate(model=model, prompt="", keep_alive=0)
+
+
+def running_models(cfg: Dict) -> List[Dict]:
+    """Models Ollama currently has loaded (``/api/ps``)."""
+    return _as_dict(get_client(cfg).ps()).get("models", [])
+
+
+def get_cache(cfg: Dict) -> Optional[ResponseCache]:
+    """Return the response cache configured in *cfg*, or None when bypassed."""
+    if int(cfg.get("llm_cache_enabled", 0)) != 1:
+        return None
+    folder = Path(cfg.get("work_folder", "work")) / cfg.get("llm_cache_folder", "llm_cache")
+    key = str(folder.resolve())
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ResponseCache(
+                folder,
+                max_size_mb=cfg.get("llm_cache_max_size_mb", 256),
+                max_age_hours=cfg.get("llm_cache_max_age_hours", 168),
+            )
+        return _caches[key]
+
+
+def cache_stats(cfg: Dict) -> Dict[str, int]:
+    cache = get_cache(cfg)
+    if cache is None:
+        return {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+    return cache.stats()
+
+
+class Cancelled(Exception):
+    """
+    Raised by ``chat`` when its cancel event is set mid-generation;
+    ``completion_tokens`` counts the chunks streamed before the cancel.
+    """
+
+    def __init__(self, model: str, completion_tokens: int = 0):
+        super().__init__(model)
+        self.completion_tokens = completion_tokens
+
+
+def chat(
+    cfg: Dict,
+    model: str,
+    messages: List[Dict[str, Any]],
+    options: Dict[str, Any],
+    cancel: Optional[threading.Event] = None,
+    until_json: bool = False,
+    deadline: Optional[Deadline] = None,
+    hedge: bool = False,
+) -> Dict:
+    """
+    Chat through the shared client, behind the response cache.
+
+    Always returns the response as a plain dict so cached and live
+    responses look the same to the callers.  With a *cancel* event the
+    response is streamed so setting the event closes the connection,
+    which makes Ollama stop generating, and raises ``Cancelled``.
+
+    With *until_json* and ``llm_stream_json`` enabled the response is
+    streamed and closed as soon as the first complete JSON object has
+    arrived, skipping whatever the model would have written after it.
+    With *until_json* a response is only cached if it holds a JSON object.
+
+    Past *deadline* the call is abandoned with ``DeadlineExceeded``; with
+    *hedge* a duplicate is sent once the call has taken longer than the
+    model's recent p95 (see ``hedge_delay``).  Models whose calls keep
+    failing are skipped with ``CircuitOpen`` until their breaker cools down.
+    """
+    with tracing.span("llm.chat", model=model) as span:
+        cache = get_cache(cfg)
+        key = None
+        if cache is not None:
+            key = ResponseCache.key(model, options, messages)
+            cached = cache.get(key)
+            if cached is not None:
+                span.set(cache_hit=True)
+                return {**cached, "cached": True}
+
+        wants_json = until_json
+        until_json = until_json and int(cfg.get("llm_stream_json", 0)) == 1
+        # chunks received by this call's streams, reported when it is cancelled
+        streamed = [0]
+
+        def call(stop: Optional[threading.Event]) -> Dict:
+            with _model_slot(cfg, model, "chat"), _call_slot():
+                if stop is None and not until_json:
+                    return _as_dict(get_client(cfg).chat(
+                        model=model, messages=messages, options=options, keep_alive=keep_alive(cfg)))
+                return _chat_stream(cfg, model, messages, options, stop, until_json, streamed)
+
+        try:
+            resp = _guarded(cfg, model, call, cancel, deadline, hedge_delay(cfg, model) if hedge else None, span)
+        except Cancelled:
+            span.set(cancelled=True, completion_tokens=streamed[0])
+            raise Cancelled(model, streamed[0]) from None
+        span.set(cache_hit=False, prompt_tokens=resp.get("prompt_eval_count"),
+                 completion_tokens=resp.get("eval_count"), ttft_seconds=resp.get("ttft_seconds"),
+                 early_stop=resp.get("early_stop", False))
+
+        # a reply without the JSON the caller asked for must not be replayed to the next run
+        if cache is not None and (not wants_json or extract_json(resp.get("message", {}).get("content", ""))):
+            cache.put(key, resp)
+        return resp
+
+
+def hedge_delay(cfg: Dict, model: str) -> Optional[float]:
+    """
+    How long to wait before hedging a call to *model*: the
+    ``hedge_percentile`` of its recent latencies (at least
+    ``hedge_min_delay_seconds``), or None until ``hedge_min_samples``
+    calls have been timed.
+    """
+    with _resilience_lock:
+        tracker = _latencies.setdefault(model, LatencyTracker())
+    p = tracker.percentile(float(cfg.get("hedge_percentile", 95)), int(cfg.get("hedge_min_samples", 8)))
+    return None if p is None else max(p, float(cfg.get("hedge_min_delay_seconds", 0)))
+
+
+def _breaker(cfg: Dict, model: str) -> CircuitBreaker:
+    with _resilience_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(int(cfg.get("breaker_failure_threshold", 3)),
+                                              float(cfg.get("breaker_cooldown_seconds", 300)))
+        return _breakers[model]
+
+
+def _guarded(cfg: Dict, model: str, call, cancel: Optional[threading.Event],
+             deadline: Optional[Deadline], hedge_after: Optional[float], span) -> Dict:
+    """Run *call* behind the model's circuit breaker, deadline and hedge, timing it."""
+    if deadline is not None and deadline.expired():
+        # the stage budget is spent; not the model's fault
+        resilience.count("deadline_skips")
+        raise DeadlineExceeded(f"{model}: no time left in the stage budget")
+    breaker = _breaker(cfg, model)
+    if not breaker.allow():
+        resilience.count("breaker_skips")
+        span.set(breaker_open=True)
+        raise CircuitOpen(model)
+
+    start = time.perf_counter()
+    try:
+        if deadline is None and hedge_after is None:
+            resp = call(cancel)
+        else:
+            resp = _run_bounded(call, cancel, deadline or Deadline(), hedge_after, model, span)
+    except (Cancelled, StageBudgetExceeded):
+        # neither says anything about the model
+        breaker.release()
+        raise
+    except Exception:
+        if breaker.failure():
+            resilience.count("breaker_trips")
+            print(f"Circuit breaker opened for {model}")
+        raise
+    breaker.success()
+    with _resilience_lock:
+        tracker = _latencies.setdefault(model, LatencyTracker())
+    tracker.add(time.perf_counter() - start)
+    return resp
+
+
+def _run_bounded(call, cancel: Optional[threading.Event], deadline: Deadline,
+                 hedge_after: Optional[float], model: str, span) -> Dict:
+    """
+    Run ``call(stop)`` on the call pool and wait for it until *deadline*.
+
+    With *hedge_after*, a duplicate is started if no answer has arrived by
+    then and the first successful answer wins.  Whatever is still running
+    when this returns has its stop event set, so streamed calls close
+    their connection at the next chunk; the HTTP requests of the call
+    also time out at *deadline* (see ``_cap_timeout``), so a call that is
+    not streamed does not outlive it either.
+    """
+    stops: List[threading.Event] = []
+    futures = {}
+
+    def run(stop: threading.Event) -> Dict:
+        _thread_deadline.deadline = deadline
+        try:
+            return call(stop)
+        finally:
+            _thread_deadline.deadline = None
+
+    def submit() -> None:
+        stop = threading.Event()
+        stops.append(stop)
+        futures[_call_pool.submit(tracing.propagate(run), stop)] = len(stops)
+
+    submit()
+    hedge_at = None if hedge_after is None else time.monotonic() + hedge_after
+    error: Optional[BaseException] = None
+    try:
+        while futures:
+            timeout = POLL_SECONDS
+            if deadline.remaining() is not None:
+                timeout = min(timeout, deadline.remaining())
+            if hedge_at is not None:
+                timeout = min(timeout, max(0.0, hedge_at - time.monotonic()))
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt = futures.pop(future)
+                try:
+                    resp = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if attempt > 1:
+                    resilience.count("hedge_wins")
+                    span.set(hedge_won=True)
+                return resp
+            if not futures:
+                break
+            if cancel is not None and cancel.is_set():
+                raise Cancelled(model)
+            if deadline.expired():
+                raise _deadline_error(deadline, model, span)
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                resilience.count("hedges")
+                span.set(hedged=True)
+                submit()
+                hedge_at = None
+        if deadline.expired():
+            # the requests timed out at the deadline before the wait noticed it
+            raise _deadline_error(deadline, model, span)
+        raise error
+    finally:
+        for stop in stops:
+            stop.set()
+
+
+def _deadline_error(deadline: Deadline, model: str, span) -> DeadlineExceeded:
+    """The error of a call that ran past *deadline*: its own limit, or its stage's budget."""
+    if deadline.stage_budget:
+        resilience.count("stage_timeouts")
+        span.set(stage_budget_exceeded=True)
+        return StageBudgetExceeded(f"{model}: the stage budget ran out during the call")
+    resilience.count("timeouts")
+    span.set(timed_out=True)
+    return DeadlineExceeded(f"{model}: call exceeded its deadline")
+
+
+def _chat_stream(cfg: Dict, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any],
+                 cancel: Optional[threading.Event], until_json: bool,
+                 streamed: Optional[List[int]] = None) -> Dict:
+    """
+    Stream a chat and assemble the chunks into one non-streamed response,
+    with ``ttft_seconds`` added.  Every content chunk is also counted in
+    ``streamed[0]``, so a cancelled call can report what it generated.
+
+    An early stop (*until_json*) never sees Ollama's final chunk, so its
+    ``eval_count`` is the number of chunks received (one token each) and
+    ``tokens_saved_max`` bounds what was saved by the token limit.
+    """
+    if cancel is not None and cancel.is_set():
+        raise Cancelled(model)
+    start = time.perf_counter()
+    stream = get_client(cfg).chat(model=model, messages=messages, options=options,
+                                  keep_alive=keep_alive(cfg), stream=True)
+    scanner = JsonObjectScanner() if until_json else None
+    content = []
+    final: Dict = {}
+    ttft = None
+    try:
+        for chunk in stream:
+            if cancel is not None and cancel.is_set():
+                raise Cancelled(model)
+            chunk = _as_dict(chunk)
+            text = chunk.get("message", {}).get("content", "")
+            if text:
+                content.append(text)
+                if streamed is not None:
+                    streamed[0] += 1
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+            if chunk.get("done"):
+                final = chunk
+                break
+            if scanner is not None and scanner.feed(text) is not None:
+                limit = options.get("num_predict") or options.get("max_tokens")
+                final = {"early_stop": True, "eval_count": len(content)}
+                if limit:
+                    final["tokens_saved_max"] = max(0, int(limit) - len(content))
+                break
+    finally:
+        stream.close()
+    final.setdefault("model", model)
+    final["message"] = {"role": "assistant", "content": "".join(content)}
+    final["ttft_seconds"] = ttft
+    return final
+
+
+def embed(cfg: Dict, model: str, input: str | List[str], deadline: Optional[Deadline] = None) -> Dict:
+    """
+    Embed through the shared client, returning a plain dict; *input* may
+    be a batch of texts.  *deadline* defaults to the ``embedding`` entry
+    of ``call_deadline_seconds``.
+    """
+    if deadline is None:
+        deadline = resilience.call_deadline(cfg, "embedding")
+    with tracing.span("llm.embed", model=model, inputs=1 if isinstance(input, str) else len(input)) as span:
+        def call(stop: Optional[threading.Event]) -> Dict:
+            with _model_slot(cfg, model, "embed"), _call_slot():
+                return _as_dict(get_client(cfg).embed(model=model, input=input, keep_alive=keep_alive(cfg)))
+
+        resp = _guarded(cfg, model, call, None, deadline if deadline.at is not None else None, None, span)
+        span.set(prompt_tokens=resp.get("prompt_eval_count"))
+        return resp
+
+
+def _as_dict(resp: Any) -> Dict:
+    if hasattr(resp, "model_dump"):
+        return resp.model_dump(mode="json", exclude_none=True)
+    return dict(resp)
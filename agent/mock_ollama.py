@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Ollama HTTP API, for offline benchmarks.
+
+Speaks enough of ``/api/chat``, ``/api/embed``, ``/api/generate``,
+``/api/ps`` and ``/api/tags`` for the ollama client used by the
+pipeline.  Latency is modelled as a fixed per-request delay plus
+generation at ``tokens_per_second``; ``failure_rate`` makes a fraction
+of requests fail with HTTP 500.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+
+EMBED_DIM = 64
+MODULE_NAMES = ["Admissions", "eMAR", "Billing", "Pharmacy", "Scheduling", "Reporting"]
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def embed_text(text: str) -> List[float]:
+    """Deterministic hashed bag-of-words embedding, so similar texts score higher."""
+    vec = np.zeros(EMBED_DIM)
+    for word in re.findall(r"\w+", text.lower()):
+        h = int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "little")
+        vec[h % EMBED_DIM] += 1.0 if h & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    return (vec / norm).tolist() if norm else vec.tolist()
+
+
+DOCUMENT_SECTION = re.compile(r"=== DOCUMENT (.+?) ===\n(.*?)\n=== END \1 ===", re.S)
+
+
+def _entities_for(text: str) -> Dict:
+    client = re.search(r"Customer [A-Z]\w*", text)
+    lines = [l.strip("- ").strip() for l in text.splitlines() if l.strip()]
+    return {
+        "client_name": client.group(0) if client else "",
+        "goals": lines[1:3],
+        "deliverables": [l for l in lines if l.lower().startswith(("provide", "confirm", "train"))][:3],
+    }
+
+
+def reply_for(prompt: str) -> str:
+    """A plausible JSON answer for the extraction (single or packed) or brief prompt."""
+    text = prompt.split("\n\nText:\n", 1)[-1] if "\n\nText:\n" in prompt else prompt
+    modules = [m for m in MODULE_NAMES if m.lower() in text.lower()]
+    client = re.search(r"Customer [A-Z]\w*", text)
+    client_name = client.group(0) if client else ""
+
+    if '"client_name"' in prompt and "Text:" in prompt:
+        sections = DOCUMENT_SECTION.findall(text)
+        if sections:
+            return json.dumps({doc_id: _entities_for(body) for doc_id, body in sections})
+        return json.dumps(_entities_for(text))
+    return json.dumps({
+        "summary": f"Implementation of {', '.join(modules) or 'the platform'} for {client_name or 'the client'}",
+        "modules": modules,
+        "config_yaml": "modules:\n" + "".join(f"  - {m}\n" for m in modules),
+        "risks": ["integration latency from legacy system"],
+        "next_steps": ["confirm go-live date"],
+    })
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing streams early (cancellation, early JSON stop) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockOllamaServer:
+    """Threaded mock server; use as a context manager or call start()/stop()."""
+
+    def __init__(self, port: int = 0, latency: float = 0.05, tokens_per_second: float = 200.0,
+                 failure_rate: float = 0.0, seed: int = 0, model_size_gb: float = 4.0):
+        self.latency = latency
+        self.model_size_gb = model_size_gb
+        self.loaded: Dict[str, bool] = {}
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.requests: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = _Server(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self) -> "MockOllamaServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _count(self, path: str) -> None:
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def _touch(self, request: Dict) -> None:
+        """Track loaded models like Ollama does (under tagged names); keep_alive=0 unloads."""
+        model = str(request.get("model"))
+        if ":" not in model.rsplit("/", 1)[-1]:
+            model += ":latest"
+        with self._lock:
+            if request.get("keep_alive") in (0, "0"):
+                self.loaded.pop(model, None)
+            else:
+                self.loaded[model] = True
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, obj: Dict, status: int = 200) -> None:
+                body = json.dumps(obj).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                server._count(self.path)
+                if self.path == "/api/ps":
+                    size = int(server.model_size_gb * 1024 ** 3)
+                    with server._lock:
+                        models = [{"name": m, "model": m, "size": size, "size_vram": size} for m in server.loaded]
+                    self._send({"models": models})
+                elif self.path == "/api/tags":
+                    self._send({"models": []})
+                else:
+                    self._send({"error": "not found"}, 404)
+
+            def do_POST(self):
+                server._count(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(server.latency)
+                if server._should_fail():
+                    self._send({"error": "injected failure"}, 500)
+                    return
+                server._touch(request)
+                if self.path == "/api/chat":
+                    self._chat(request)
+                elif self.path == "/api/embed":
+                    self._embed(request)
+                elif self.path == "/api/generate":
+                    self._send({"model": request.get("model"), "response": "", "done": True})
+                else:
+                    self._send({"error": "not found"}, 404)
+
+            def _embed(self, request: Dict) -> None:
+                inputs = request.get("input", "")
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                self._send({
+                    "model": request.get("model"),
+                    "embeddings": [embed_text(text) for text in inputs],
+                    "prompt_eval_count": sum(_tokens(text) for text in inputs),
+                })
+
+            def _chat(self, request: Dict) -> None:
+                prompt = request["messages"][-1]["content"]
+                content = reply_for(prompt)
+                if "r1" in str(request.get("model")):
+                    # reasoning models think first and add chatter after the answer
+                    content = (f"<think>\nThe index asks for {{summary, modules}}; {prompt[:400]}\n</think>\n"
+                               f"{content}\n\nThis brief covers the main points from the index; "
+                               "adjust the next steps as the project evolves.")
+                prompt_tokens = _tokens(prompt)
+                completion_tokens = _tokens(content)
+                per_token = 1.0 / server.tokens_per_second if server.tokens_per_second else 0.0
+                final = {
+                    "model": request.get("model"),
+                    "done": True,
+                    "done_reason": "stop",
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": completion_tokens,
+                    "prompt_eval_duration": int(server.latency * 1e9),
+                    "eval_duration": int(completion_tokens * per_token * 1e9),
+                }
+                if not request.get("stream", True):
+                    time.sleep(completion_tokens * per_token)
+                    self._send({**final, "message": {"role": "assistant", "content": content}})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    # one chunk per ~4 characters, i.e. per estimated token
+                    for i in range(0, len(content), 4):
+                        time.sleep(per_token)
+                        self._chunk({"model": request.get("model"), "done": False,
+                                     "message": {"role": "assistant", "content": content[i:i + 4]}})
+                    self._chunk({**final, "message": {"role": "assistant", "content": ""}})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client cancelled the stream
+
+            def _chunk(self, obj: Dict) -> None:
+                data = json.dumps(obj).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05, help="fixed seconds per request")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockOllamaServer(args.port, args.latency, args.tokens_per_second, args.failure_rate)
+    print(f"mock ollama listening on {server.host} (Ctrl+C to stop)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,118 +3,263 @@ import argparse
 import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List
 
-from evaluator import evaluate
-from extraction import extract_entities
+from canonical import brief_view, canonicalize
+from evaluator import embed_corpus, evaluate, reference_modules
+from extraction import extract_entities, extract_window_chars
 from generator import generate_brief
 from ingest import build_corpus
-from indexer import build_index
-from utils import load_config, write_json, get_client_name
+from indexer import (build_index, build_vector_index, diff_sources, fingerprint_sources,
+                     load_index_state, merge_records, retrieve_evidence, save_index_state)
+from llm import cache_stats, scheduler_events, warm_up
+from router import route_models
+from runstore import record_run
+from structured import extract_structured
+import resilience
+import tracing
+from resilience import stage_deadline
+from utils import config_hash, load_config, merge_usage, token_count, usage_report, write_json, get_client_name
+
+# settings that change what extraction returns; a change re-extracts everything
+EXTRACTION_CONFIG_KEYS = [
+    "extract_model_name", "extraction_prompt", "temperature", "max_tokens",
+    "ingest_chunk_chars", "extract_context_tokens", "extract_window_overlap_tokens",
+    "structured_extraction", "extract_pack_documents", "extract_pack_tokens", "extract_pack_max_docs",
+    "extraction_pack_prompt",
+]
+# settings that change the brief; a change regenerates it even if the index did not
+BRIEF_CONFIG_KEYS = [
+    "brief_model_names", "brief_prompt", "temperature", "max_tokens",
+    "embeddings_model_name", "similarity_threshold", "eval_min_module_accuracy",
+    "canonical_similarity", "canonical_max_sources",
+    "retrieval_enabled", "retrieval_chunk_chars", "retrieval_top_k", "retrieval_token_budget",
+    "router_enabled", "eval_backend", "lexical_method", "lexical_features",
+]
 
 # ------------------------------------------------------------------
 # Pipeline driver
 # ------------------------------------------------------------------
-def run_pipeline() -> None:
-    attempts = []
-    brief_attempt = 1
+def run_pipeline(data_folder: str | None = None,
+                 outputs_dir: str | None = None,
+                 work_folder: str | None = None,
+                 incremental: bool | None = None,
+                 trace_folder: str | None = None) -> Dict:
+    """
+    Run ingest → extraction → indexing → generation → evaluation for one
+    client.  Folders default to the ones in config.yaml; the combined
+    metrics are written to ``metrics_file`` and returned.
+
+    With ``incremental`` (default: ``incremental_index`` in config.yaml)
+    only new or changed source files are re-extracted, and generation is
+    skipped when the merged index equals the one behind the last brief.
+
+    With ``trace_enabled`` every stage, document and LLM call is traced
+    and exported to *trace_folder* (default: work_folder) as JSONL and
+    Chrome trace_event files.
+    With ``run_store_enabled`` the metrics are also appended to the run
+    history (see runstore.py).
+    """
+    cfg = load_config()
+    work_folder = work_folder or cfg.get("work_folder", "work")
+    if int(cfg.get("trace_enabled", 0)) == 1:
+        tracing.enable()
+
+    started_at = time.time()
+    with tracing.span("pipeline", data_folder=str(data_folder or cfg.get("data_folder", "data"))) as root:
+        all_metrics = _run_pipeline(data_folder, outputs_dir, work_folder, incremental)
+    tracing.export(root, trace_folder or work_folder, cfg.get("trace_file", "trace"))
+    if int(cfg.get("run_store_enabled", 0)) == 1:
+        try:
+            record_run(cfg, all_metrics, data_folder or cfg.get("data_folder", "data"),
+                       config_hash(cfg, EXTRACTION_CONFIG_KEYS + BRIEF_CONFIG_KEYS), started_at)
+        except Exception as e:
+            print(f"Run history error: {e}")
+    return all_metrics
+
+
+def _run_pipeline(data_folder: str | None,
+                  outputs_dir: str | None,
+                  work_folder: str,
+                  incremental: bool | None) -> Dict:
     cfg = load_config()
-    threshold = cfg.get("similarity_threshold", 0.75)
     total_seconds = 0
     total_tokens = 0
 
-    work_folder = cfg.get("work_folder", "work")
-    data_folder = cfg.get("data_folder", "data")    
-    outputs_dir = cfg.get("output_folder", "outputs")    
+    data_folder = data_folder or cfg.get("data_folder", "data")
+    outputs_dir = outputs_dir or cfg.get("output_folder", "outputs")
 
-    Path(outputs_dir).mkdir(exist_ok=True)
-    Path(work_folder).mkdir(exist_ok=True)
+    Path(outputs_dir).mkdir(parents=True, exist_ok=True)
+    Path(work_folder).mkdir(parents=True, exist_ok=True)
+    cache_before = cache_stats(cfg)
+    events_before = len(scheduler_events(cfg))
+    resilience_before = resilience.counters()
+    warming = _start_warm_up(cfg)
 
     # ------------------------------------------------------------------
     # 1. Ingest
     # ------------------------------------------------------------------
-    texts = build_corpus(Path(data_folder))
+    # chunks default to the extraction window, so each is extracted in one request
+    texts = build_corpus(Path(data_folder), cfg.get("ingest_chunk_chars") or extract_window_chars(cfg))
 
     # ------------------------------------------------------------------
-    # 2. Extraction
+    # 2. Extraction (only new or changed sources when incremental)
     # ------------------------------------------------------------------
-    extracted = extract_entities(texts)
+    if incremental is None:
+        incremental = int(cfg.get("incremental_index", 0)) == 1
+    state_file = f"{work_folder}/{cfg.get("index_state_file", "index_state.json")}"
+    state = load_index_state(state_file) if incremental else {}
+    extract_config = config_hash(cfg, EXTRACTION_CONFIG_KEYS)
+    if state.get("extract_config") != extract_config:
+        state = {}
+    fingerprints = fingerprint_sources(Path(data_folder), state.get("fingerprints"))
+    changed, deleted = diff_sources(state.get("fingerprints", {}), fingerprints)
+
+    # structured sources of known schemas are mapped directly; the rest go to the LLM
+    structured = {"result": [], "elapsed_seconds": 0, "fallback": sorted(changed)}
+    if int(cfg.get("structured_extraction", 0)) == 1:
+        structured = extract_structured(Path(data_folder), sorted(changed))
+    total_seconds += structured["elapsed_seconds"]
+    llm_sources = set(structured["fallback"])
+
+    extracted = extract_entities([doc for doc in texts if doc.source in llm_sources])
     total_seconds += extracted.get("elapsed_seconds", 0)
     total_tokens += extracted.get("total_tokens", 0)
+    usage = {"extraction": extracted["usage"]}
     client_name = get_client_name(extracted)
 
+    fresh = {name: [] for name in changed}
+    for record in extracted["result"]:
+        fresh[record["source"]].append(record)
+    for record in structured["result"]:
+        fresh[record["source"]].append(record)
+    corpus_order = list(dict.fromkeys(doc.source for doc in texts))
+    records = merge_records(state.get("records", {}), fresh, corpus_order)
+    # sources that yielded nothing are left out so the next run retries them
+    failed = {name for name in changed if not fresh[name]}
+
     # ------------------------------------------------------------------
-    # 3. Indexing
+    # 3. Canonicalization and indexing
     # ------------------------------------------------------------------
-    index = build_index(extracted["result"])
-    total_seconds += index.get("elapsed_seconds", 0)
+    canonical = canonicalize([record for recs in records.values() for record in recs])
+    total_seconds += canonical["elapsed_seconds"]
+    index = build_index(canonical["result"])
+    # the timing must not leak into the brief prompt (or its cache key)
+    total_seconds += index.pop("elapsed_seconds", 0)
     index_file = f"{work_folder}/{cfg["index_file"].format(client_name=client_name)}"
     write_json(index_file, index, indent=2)
 
-    # ------------------------------------------------------------------
-    # 4. Generation
-    # ------------------------------------------------------------------
-    brief = generate_brief(index)
-    total_seconds += brief.get("elapsed_seconds", 0)
-    total_tokens += int(brief.get("total_tokens", 0))
-    brief_file = f"{work_folder}/{cfg["brief_file"].format(client_name=f"{client_name}_v{brief_attempt}")}"    
-    write_json(brief_file, brief["result"], indent=2)
+    brief_config = config_hash(cfg, BRIEF_CONFIG_KEYS)
+    new_state = {
+        "extract_config": extract_config,
+        "brief_config": brief_config,
+        "fingerprints": {name: fp for name, fp in fingerprints.items() if name not in failed},
+        "records": records,
+        "index": index,
+    }
+    index_metrics = {
+        "entities_extracted": canonical["entities_in"],
+        "entities_canonical": canonical["entities_out"],
+        "canonical_compression_ratio": canonical["compression_ratio"],
+        "canonical_tokens_in": canonical["tokens_in"],
+        "canonical_tokens_out": canonical["tokens_out"],
+        "sources_extracted": len(changed),
+        "sources_structured": len(structured["result"]),
+        "sources_reused": len(records) - len(changed - failed),
+        "sources_deleted": len(deleted),
+    }
+
+    final_brief_file = f"{outputs_dir}/{cfg["brief_file"].format(client_name=client_name)}"
+    if (incremental and state.get("index") == index and state.get("brief_config") == brief_config
+            and Path(final_brief_file).exists()):
+        print("index unchanged - keeping the existing brief")
+        save_index_state(state_file, new_state)
+        cache_after = cache_stats(cfg)
+        usage_metrics, cost_estimate_usd = usage_report(cfg, usage)
+        all_metrics = {
+            "client": _index_client(index, client_name),
+            "latency_seconds": total_seconds,
+            "cost_estimate_usd": f"{cost_estimate_usd:.2f}",
+            "total_tokens": total_tokens,
+            "usage": usage_metrics,
+            "llm_cache": {k: cache_after[k] - cache_before.get(k, 0) for k in cache_after},
+            "model_scheduler": _scheduler_metrics(cfg, events_before),
+            "resilience": _resilience_metrics(resilience_before),
+            "work_metrics": {**index_metrics, "index_unchanged": True, "warm_up_seconds": _warm_up_seconds(warming)},
+        }
+        write_json(f"{outputs_dir}/{cfg["metrics_file"]}", all_metrics, indent=2)
+        return all_metrics
 
     # ------------------------------------------------------------------
-    # 5. Evaluation
+    # 4. Evaluation corpus
     # ------------------------------------------------------------------
-    print(f"evaluating brief (attempt {brief_attempt})")
-
-    eval_result = evaluate(brief["result"], texts)
-    total_seconds += eval_result.get("elapsed_seconds", 0)
-    total_tokens += eval_result.get("total_tokens", 0)
-    similarity = eval_result["similarity"]
+    # the corpus never changes between attempts: embed it once, in one batch
+    corpus = embed_corpus(texts)
+    total_seconds += corpus.get("elapsed_seconds", 0)
+    total_tokens += corpus.get("total_tokens", 0)
+    usage["evaluation"] = dict(corpus["usage"])
+    corpus_embeddings = corpus["result"]
+    # modules named by the structured sources, checked before any embedding call
+    modules = reference_modules(Path(data_folder))
 
     metrics = {
+        **index_metrics,
         "extraction_time": extracted["elapsed_seconds"],
-        "evaluation_time": eval_result["elapsed_seconds"],
-        f"attempt_{brief_attempt}_similarity": similarity,
-        f"attempt_{brief_attempt}_generation_time": brief["elapsed_seconds"],
+        "extraction_document_seconds": extracted.get("document_seconds", {}),
+        "extraction_packed_calls": extracted.get("packed_calls", 0),
+        "extraction_packed_documents": extracted.get("packed_documents", 0),
+        "extraction_pack_fallbacks": extracted.get("pack_fallbacks", 0),
+        "corpus_embedding_time": corpus["elapsed_seconds"],
+        "evaluation_backend": cfg.get("eval_backend", "embedding"),
     }
 
-    attempts.append({
-        "attempt": brief_attempt,
-        "brief_file": str(brief_file),
-        "score": similarity
-    })
-
-    print(f"brief attempt {brief_attempt} score {similarity})")
-    
     # ------------------------------------------------------------------
-    # 6. Loop if needed
+    # 5. Retrieval: the brief gets the best evidence per section, not the whole index
     # ------------------------------------------------------------------
-    while similarity < threshold and brief_attempt < 3:
-        brief_attempt += 1
-        print(f"Similarity {similarity:.3f} below {threshold}. Re‑running extraction/generation (attempt {brief_attempt})")        
-        brief = generate_brief(index, brief_attempt)        
-        total_seconds += brief.get("elapsed_seconds", 0)
-        total_tokens += int(brief.get("total_tokens", 0))
-        brief_file = f"{work_folder}/{cfg["brief_file"].format(client_name=f"{client_name}_v{brief_attempt}")}"    
-        write_json(brief_file, brief, indent=2)
-        print(f"evaluating brief (attempt {brief_attempt})")
-        eval_result = evaluate(brief["result"], texts)
-        total_seconds += eval_result.get("elapsed_seconds", 0)
-        total_tokens += eval_result.get("total_tokens", 0)
-        similarity = eval_result["similarity"]
-
+    # the prompt gets the canonical values only; sources and mentions stay in the index file
+    brief_index = brief_view(index["entities"])
+    if int(cfg.get("retrieval_enabled", 0)) == 1:
+        vectors = build_vector_index(texts, index["entities"], work_folder)
+        evidence = retrieve_evidence(vectors["result"])
+        total_seconds += vectors["elapsed_seconds"] + evidence["elapsed_seconds"]
+        total_tokens += vectors["total_tokens"] + evidence["total_tokens"]
+        usage["retrieval"] = dict(vectors["usage"])
+        merge_usage(usage["retrieval"], evidence["usage"])
+        brief_index = {"evidence": evidence["result"]}
         metrics.update({
-            f"attempt_{brief_attempt}_similarity": similarity,
-            f"attempt_{brief_attempt}_generation_time": brief["elapsed_seconds"],
-        })
-        
-        attempts.append({
-            "attempt": brief_attempt,
-            "brief_file": str(brief_file),
-            "score": similarity
+            "vector_index_items": len(vectors["result"]["items"]),
+            "vector_index_embedded": vectors["embedded"],
+            "vector_index_reused": vectors["reused"],
+            "vector_index_time": vectors["elapsed_seconds"],
+            "retrieval_time": evidence["elapsed_seconds"],
+            "evidence_tokens": evidence["evidence_tokens"],
         })
 
-        print(f"brief attempt {brief_attempt} score {similarity})")
+    # ------------------------------------------------------------------
+    # 6. Generation and evaluation, retrying other models if needed
+    # ------------------------------------------------------------------
+    models, router, routing = route_models(cfg, token_count(json.dumps(brief_index)))
+    if routing is not None:
+        metrics["brief_routing"] = routing
+    width = int(cfg.get("speculative_width", 1))
+    if width > 1:
+        generated = _speculative_briefs(brief_index, texts, corpus_embeddings, modules, cfg, work_folder,
+                                        client_name, width, models, router)
+    else:
+        generated = _sequential_briefs(brief_index, texts, corpus_embeddings, modules, cfg, work_folder,
+                                       client_name, models, router)
+    attempts = generated["attempts"]
+    metrics.update(generated["metrics"])
+    metrics["brief_attempts"] = len(generated["attempts"])
+    total_seconds += generated["elapsed_seconds"]
+    total_tokens += generated["total_tokens"]
+    usage["generation"] = generated["usage"]["generation"]
+    merge_usage(usage["evaluation"], generated["usage"]["evaluation"])
+    brief = {}
 
     # ------------------------------------------------------------------
     # 7. Save final output
@@ -142,23 +287,286 @@ def run_pipeline() -> None:
 
     write_json(brief_file, brief, indent=2)
 
-    cost_estimate_usd = total_tokens / 1000 * cfg.get("estimate_model_cost_1k", 0)
+    usage_metrics, cost_estimate_usd = usage_report(cfg, usage)
+    cache_after = cache_stats(cfg)
+
+    metrics["warm_up_seconds"] = _warm_up_seconds(warming)
 
     # metrics are combined into a single JSON
     all_metrics = {
+        "client": _index_client(index, client_name),
         "latency_seconds": total_seconds,
         "cost_estimate_usd": f"{cost_estimate_usd:.2f}",
         "total_tokens": total_tokens,
+        "usage": usage_metrics,
+        "llm_cache": {k: cache_after[k] - cache_before.get(k, 0) for k in cache_after},
+        "model_scheduler": _scheduler_metrics(cfg, events_before),
+        "resilience": _resilience_metrics(resilience_before),
         "work_metrics": metrics,
     }
     write_json(metrics_file, all_metrics, indent=2)
+    if incremental:
+        save_index_state(state_file, new_state)
 
     print(f"Pipeline finished. Final similarity: {best_score:.3f}")
     print(f"Final result written to: {outputs_dir}")
+    return all_metrics
+
+
+def _index_client(index: Dict, client_name: str) -> str:
+    """The client the sources name most often (the index's client_name entries), else *client_name*."""
+    names = [e for e in index.get("entities", []) if e.get("field") == "client_name" and e.get("value")]
+    return str(max(names, key=lambda e: e.get("mentions", 0))["value"]) if names else client_name
+
+
+def _start_warm_up(cfg: Dict):
+    """
+    Preload the models this run will use, in the background so ingest
+    and fingerprinting overlap the loads.  Returns a future, or None.
+    """
+    if int(cfg.get("warm_up_models", 0)) != 1:
+        return None
+    width = max(1, int(cfg.get("speculative_width", 1)))
+    brief_models = cfg["brief_model_names"].split(",")[:width]
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(tracing.propagate(warm_up), cfg,
+                         [cfg["extract_model_name"], *brief_models], embedding_models(cfg))
+    pool.shutdown(wait=False)
+    return future
+
+
+def embedding_models(cfg: Dict) -> List[str]:
+    """The embedding model, unless neither retrieval nor evaluation uses it."""
+    if int(cfg.get("retrieval_enabled", 0)) != 1 and cfg.get("eval_backend", "embedding") == "lexical":
+        return []
+    return [cfg["embeddings_model_name"]]
+
+
+def _warm_up_seconds(warming) -> Dict[str, float]:
+    return warming.result() if warming is not None else {}
+
+
+def _scheduler_metrics(cfg: Dict, events_before: int) -> Dict:
+    """Model loads and unloads since *events_before* (all clients' in batch mode)."""
+    events = scheduler_events(cfg)[events_before:]
+    return {
+        "loads": sum(1 for e in events if e["event"] == "load"),
+        "unloads": sum(1 for e in events if e["event"] == "unload"),
+        "events": events,
+    }
+
+
+def _resilience_metrics(before: Dict[str, int]) -> Dict[str, int]:
+    """Timeouts, hedges and circuit-breaker activity since *before*."""
+    return {k: v - before.get(k, 0) for k, v in resilience.counters().items() if v - before.get(k, 0)}
+
+
+def _record_attempt(router, brief: Dict, eval_result: Dict) -> None:
+    """Add an evaluated attempt to the router history; cached responses say nothing about the model."""
+    if router is None or any(u.get("cached_calls") for u in brief["usage"].values()):
+        return
+    router.record(brief["model"], eval_result["similarity"],
+                  brief.get("elapsed_seconds", 0) + eval_result.get("elapsed_seconds", 0),
+                  int(brief.get("total_tokens", 0)) + int(eval_result.get("total_tokens", 0)))
+
+
+def _attempt_file(cfg: Dict, work_folder: str, client_name: str, attempt: int) -> str:
+    return f"{work_folder}/{cfg["brief_file"].format(client_name=f"{client_name}_v{attempt}")}"
+
+
+def _sequential_briefs(index: Dict, texts, corpus_embeddings, modules, cfg: Dict,
+                       work_folder: str, client_name: str, models: List[str], router=None) -> Dict:
+    """Try brief *models* one after another until a brief clears the threshold."""
+    threshold = cfg.get("similarity_threshold", 0.75)
+    attempts = []
+    metrics = {}
+    usage = {"generation": {}, "evaluation": {}}
+    total_seconds = 0
+    total_tokens = 0
+    similarity = -1
+    brief_attempt = 0
+    stage = stage_deadline(cfg, "generation")
+
+    while brief_attempt < 3 and (brief_attempt == 0 or similarity < threshold):
+        brief_attempt += 1
+        if brief_attempt > 1:
+            print(f"Similarity {similarity:.3f} below {threshold}. Re‑running extraction/generation (attempt {brief_attempt})")
+        brief = generate_brief(index, brief_attempt, deadline=stage,
+                               model=models[min(brief_attempt, len(models)) - 1])
+        total_seconds += brief.get("elapsed_seconds", 0)
+        total_tokens += int(brief.get("total_tokens", 0))
+        merge_usage(usage["generation"], brief["usage"])
+        brief_file = _attempt_file(cfg, work_folder, client_name, brief_attempt)
+        write_json(brief_file, brief["result"], indent=2)
+
+        print(f"evaluating brief (attempt {brief_attempt})")
+        eval_result = evaluate(brief["result"], texts, corpus_embeddings, modules)
+        total_seconds += eval_result.get("elapsed_seconds", 0)
+        total_tokens += eval_result.get("total_tokens", 0)
+        merge_usage(usage["evaluation"], eval_result["usage"])
+        similarity = eval_result["similarity"]
+        _record_attempt(router, brief, eval_result)
+
+        if brief_attempt == 1:
+            metrics["evaluation_time"] = eval_result["elapsed_seconds"]
+        metrics.update({
+            f"attempt_{brief_attempt}_similarity": similarity,
+            f"attempt_{brief_attempt}_sections": eval_result["sections"],
+            f"attempt_{brief_attempt}_gate": eval_result["gate"],
+            f"attempt_{brief_attempt}_generation_time": brief["elapsed_seconds"],
+            f"attempt_{brief_attempt}_model": brief["model"],
+        })
+
+        attempts.append({
+            "attempt": brief_attempt,
+            "brief_file": str(brief_file),
+            "score": similarity
+        })
+
+        print(f"brief attempt {brief_attempt} score {similarity})")
+
+    return {"attempts": attempts, "metrics": metrics, "usage": usage,
+            "elapsed_seconds": total_seconds, "total_tokens": total_tokens}
+
+
+def _speculative_briefs(index: Dict, texts, corpus_embeddings, modules, cfg: Dict,
+                        work_folder: str, client_name: str, width: int, models: List[str], router=None) -> Dict:
+    """
+    Generate with up to *width* of the brief *models* at once and evaluate each
+    brief as soon as it arrives.  The first brief that clears the
+    threshold wins and every other generation is cancelled.  Everything
+    spent on the other attempts (their generation, including the partial
+    usage of cancelled streams, and the evaluation of losing briefs) is
+    reported as wasted.
+    """
+    threshold = cfg.get("similarity_threshold", 0.75)
+    candidates = min(3, len(models))
+    cancel = threading.Event()
+    stage = stage_deadline(cfg, "generation")
+    attempts = []
+    metrics = {}
+    usage = {"generation": {}, "evaluation": {}}
+    total_tokens = 0
+    winner = None
+    # (seconds, tokens) spent per attempt, to work out the waste at the end
+    spent = {}
+    wasted_seconds = 0
+    wasted_tokens = 0
+    cancelled = 0
+
+    print(f"generating briefs speculatively ({candidates} models, {width} at a time)")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(width, candidates)) as pool:
+        futures = {
+            pool.submit(tracing.propagate(generate_brief), index, brief_attempt, cancel, stage,
+                        models[brief_attempt - 1]): brief_attempt
+            for brief_attempt in range(1, candidates + 1)
+        }
+        for future in as_completed(futures):
+            brief_attempt = futures[future]
+            if future.cancelled():
+                cancelled += 1
+                continue
+            brief = future.result()
+            total_tokens += int(brief.get("total_tokens", 0))
+            merge_usage(usage["generation"], brief["usage"])
+            spent[brief_attempt] = (brief.get("elapsed_seconds", 0), int(brief.get("total_tokens", 0)))
+            if brief.get("cancelled"):
+                cancelled += 1
+                continue
+            if winner is not None:
+                # finished just before the cancel reached it
+                continue
+
+            brief_file = _attempt_file(cfg, work_folder, client_name, brief_attempt)
+            write_json(brief_file, brief["result"], indent=2)
+            print(f"evaluating brief (attempt {brief_attempt}, {brief['model']})")
+            eval_result = evaluate(brief["result"], texts, corpus_embeddings, modules)
+            total_tokens += eval_result.get("total_tokens", 0)
+            merge_usage(usage["evaluation"], eval_result["usage"])
+            similarity = eval_result["similarity"]
+            _record_attempt(router, brief, eval_result)
+            seconds, tokens = spent[brief_attempt]
+            spent[brief_attempt] = (seconds + eval_result["elapsed_seconds"],
+                                    tokens + eval_result.get("total_tokens", 0))
+            # the first evaluated brief's, until a brief wins
+            if winner is None and (similarity >= threshold or "evaluation_time" not in metrics):
+                metrics["evaluation_time"] = eval_result["elapsed_seconds"]
+
+            metrics.update({
+                f"attempt_{brief_attempt}_similarity": similarity,
+                f"attempt_{brief_attempt}_sections": eval_result["sections"],
+                f"attempt_{brief_attempt}_gate": eval_result["gate"],
+                f"attempt_{brief_attempt}_generation_time": brief["elapsed_seconds"],
+                f"attempt_{brief_attempt}_model": brief["model"],
+            })
+            attempts.append({
+                "attempt": brief_attempt,
+                "brief_file": str(brief_file),
+                "score": similarity
+            })
+            print(f"brief attempt {brief_attempt} score {similarity})")
+
+            if similarity >= threshold and winner is None:
+                winner = brief_attempt
+                metrics["speculative_winner_model"] = brief["model"]
+                cancel.set()
+                for other in futures:
+                    other.cancel()
+
+    if winner is not None:
+        wasted = [spent[attempt] for attempt in spent if attempt != winner]
+        wasted_seconds = sum(seconds for seconds, _ in wasted)
+        wasted_tokens = sum(tokens for _, tokens in wasted)
+    metrics.update({
+        "speculative_width": width,
+        "speculative_winner_attempt": winner,
+        "speculative_cancelled": cancelled,
+        "speculative_wasted_seconds": wasted_seconds,
+        "speculative_wasted_tokens": wasted_tokens,
+    })
+    return {"attempts": attempts, "metrics": metrics, "usage": usage,
+            "elapsed_seconds": time.perf_counter() - start, "total_tokens": total_tokens}
+
+
+def watch() -> None:
+    """Poll data_folder and run the pipeline incrementally after every change."""
+    cfg = load_config()
+    data_dir = Path(cfg.get("data_folder", "data"))
+    interval = float(cfg.get("watch_interval_seconds", 10))
+    seen = None
+    print(f"watching {data_dir} every {interval:g}s (Ctrl+C to stop)")
+    try:
+        while True:
+            fingerprints = fingerprint_sources(data_dir, seen)
+            if fingerprints != seen:
+                try:
+                    run_pipeline(incremental=True)
+                except Exception as e:
+                    print(f"Pipeline error: {e}")
+                seen = fingerprints
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("watch stopped")
 
 
 def main():
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="Agentic project-brief pipeline")
+    parser.add_argument("--batch", metavar="ROOT",
+                        help="run every client folder under ROOT through a worker pool")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="batch worker processes (default: batch_workers in config.yaml)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running, re-indexing incrementally whenever data_folder changes")
+    args = parser.parse_args()
+
+    if args.batch:
+        from batch import run_batch
+        run_batch(Path(args.batch), workers=args.workers)
+    elif args.watch:
+        watch()
+    else:
+        run_pipeline()
 
 # ------------------------------------------------------------------
 # CLI
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from collections import Counter, deque
+from typing import Deque, Dict, Optional
+
+# process-wide counters: timeouts, stage_timeouts, deadline_skips, hedges, hedge_wins,
+# breaker_trips, breaker_skips
+_counters: Counter = Counter()
+_counters_lock = threading.Lock()
+
+
+def count(name: str, n: int = 1) -> None:
+    with _counters_lock:
+        _counters[name] += n
+
+
+def counters() -> Dict[str, int]:
+    with _counters_lock:
+        return dict(_counters)
+
+
+class DeadlineExceeded(TimeoutError):
+    """A model call or stage ran past its deadline."""
+
+
+class StageBudgetExceeded(DeadlineExceeded):
+    """A call was cut short because its stage's budget ran out, not because the model was slow."""
+
+
+class CircuitOpen(RuntimeError):
+    """The model's circuit breaker is open, so the call was not made."""
+
+
+class Deadline:
+    """
+    An absolute point in time; ``None`` seconds means no deadline.
+    ``stage_budget`` is True when the point is a stage's budget rather
+    than a call's own limit.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, stage_budget: bool = False):
+        self.at = None if seconds is None else time.monotonic() + float(seconds)
+        self.stage_budget = stage_budget
+
+    def remaining(self) -> Optional[float]:
+        return None if self.at is None else max(0.0, self.at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.at is not None and time.monotonic() >= self.at
+
+    @classmethod
+    def earliest(cls, seconds: Optional[float], other: Optional["Deadline"]) -> "Deadline":
+        """A deadline *seconds* from now, or *other* if that comes first."""
+        deadline = cls(seconds)
+        if other is not None and other.at is not None and (deadline.at is None or other.at < deadline.at):
+            deadline.at = other.at
+            deadline.stage_budget = other.stage_budget
+        return deadline
+
+
+def stage_deadline(cfg: Dict, stage: str) -> Deadline:
+    """The wall-clock budget of *stage* from ``stage_budget_seconds``."""
+    return Deadline((cfg.get("stage_budget_seconds") or {}).get(stage), stage_budget=True)
+
+
+def call_deadline(cfg: Dict, kind: str, stage: Optional[Deadline] = None) -> Deadline:
+    """The per-call limit from ``call_deadline_seconds``, capped by the *stage* budget."""
+    return Deadline.earliest((cfg.get("call_deadline_seconds") or {}).get(kind), stage)
+
+
+class LatencyTracker:
+    """Recent call durations of one model, for hedging delays."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures and rejects calls for
+    ``cooldown`` seconds; then one trial call is let through, and its
+    outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.cooldown:
+                self._trial = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def release(self) -> None:
+        """
+        End a call that says nothing about the model (cancelled, or cut by
+        its stage budget): neither a success nor a failure, but a half-open
+        trial is given back so the next call can make it.
+        """
+        with self._lock:
+            self._trial = False
+
+    def failure(self) -> bool:
+        """Record a failure; True when it (re-)opened the breaker."""
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._opened_at is None and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+                self._trial = False
+                return True
+            return False
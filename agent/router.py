@@ -0,0 +1,120 @@
+import json
+import random
+import threading
+import time
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# appends from concurrent pipelines in one process
+_history_lock = threading.Lock()
+
+
+class ModelRouter:
+    """
+    Orders the brief models by expected cost-to-pass, learned from the
+    outcomes of earlier attempts.
+
+    Every evaluated attempt is appended to ``router_history_file`` (in
+    work_folder, shared by all clients) as one JSON line.  A model's
+    expected cost-to-pass is its mean cost per attempt (``router_cost``:
+    seconds or tokens) over its estimated pass rate, so a slow model that
+    usually passes can rank before a fast one that usually does not.
+    Only attempts on inputs of a similar size are used once there are
+    enough of them.  Models with fewer than ``router_min_samples``
+    attempts keep their configured position ahead of the ranked ones,
+    and with probability ``router_exploration`` a random other model is
+    tried first, so the estimates keep up with model changes.
+    """
+
+    def __init__(self, cfg: Dict, models: List[str]):
+        self.models = models
+        self.path = Path(cfg.get("work_folder", "work")) / cfg.get("router_history_file", "router_history.jsonl")
+        self.exploration = float(cfg.get("router_exploration", 0.1))
+        self.min_samples = max(1, int(cfg.get("router_min_samples", 3)))
+        self.window = int(cfg.get("router_window", 200))
+        self.cost = cfg.get("router_cost", "seconds")
+        self.threshold = float(cfg.get("similarity_threshold", 0.75))
+        self.input_tokens = 0
+
+    def history(self) -> List[Dict]:
+        """The last ``router_window`` outcomes of each model."""
+        if not self.path.exists():
+            return []
+        per_model: Dict[str, List[Dict]] = {}
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut by a crash
+                per_model.setdefault(record.get("model"), []).append(record)
+        return [r for records in per_model.values() for r in records[-self.window:]]
+
+    def estimate(self, records: List[Dict]) -> Dict:
+        """Pass rate (with one pseudo pass and fail) and expected cost-to-pass of one model."""
+        passes = sum(1 for r in records if r["passed"])
+        pass_rate = (passes + 1) / (len(records) + 2)
+        mean_cost = sum(r[self.cost] for r in records) / len(records) if records else None
+        return {
+            "samples": len(records),
+            "pass_rate": pass_rate,
+            "mean_cost": mean_cost,
+            "expected_cost_to_pass": None if mean_cost is None else mean_cost / pass_rate,
+        }
+
+    def route(self, input_tokens: int) -> Dict:
+        """Order the models for an input of *input_tokens*; returns the decision for the metrics."""
+        self.input_tokens = input_tokens
+        history = self.history()
+        estimates = {}
+        for model in self.models:
+            records = [r for r in history if r.get("model") == model]
+            similar = [r for r in records if input_tokens / 2 <= r.get("input_tokens", 0) <= input_tokens * 2]
+            estimates[model] = self.estimate(similar if len(similar) >= self.min_samples else records)
+
+        unexplored = [m for m in self.models if estimates[m]["samples"] < self.min_samples]
+        ranked = sorted((m for m in self.models if m not in unexplored),
+                        key=lambda m: estimates[m]["expected_cost_to_pass"])
+        order = unexplored + ranked
+        explored = None
+        if len(order) > 1 and not unexplored and random.random() < self.exploration:
+            explored = random.choice(order[1:])
+            order = [explored] + [m for m in order if m != explored]
+        print(f"brief model order: {', '.join(order)}" + (f" (exploring {explored})" if explored else ""))
+        return {
+            "order": order,
+            "configured_order": self.models,
+            "explored": explored,
+            "input_tokens": input_tokens,
+            "cost": self.cost,
+            "estimates": estimates,
+        }
+
+    def record(self, model: str, score: float, seconds: float, tokens: int) -> None:
+        """Append the outcome of one evaluated attempt to the history."""
+        record = {
+            "time": time.time(),
+            "model": model,
+            "input_tokens": self.input_tokens,
+            "score": score,
+            "passed": score >= self.threshold,
+            "seconds": seconds,
+            "tokens": tokens,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with _history_lock, open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def route_models(cfg: Dict, input_tokens: int) -> tuple[List[str], Optional[ModelRouter], Optional[Dict]]:
+    """
+    The brief models in the order to try them, the router recording the
+    outcomes (None when ``router_enabled`` is off) and its decision.
+    """
+    models = [m.strip() for m in cfg.get("brief_model_names", "").split(",") if m.strip()]
+    if int(cfg.get("router_enabled", 0)) != 1:
+        return models, None, None
+    router = ModelRouter(cfg, models)
+    decision = router.route(input_tokens)
+    return decision["order"], router, decision
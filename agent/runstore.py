@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""
+Run-history metrics store.
+
+Every pipeline run is appended to a local SQLite database
+(``run_store_file`` in work_folder) with a stable schema:
+
+    runs      one row per run: client, config hash, latency, tokens, cost, attempts, best score
+    stages    seconds and tokens per stage of a run
+    attempts  one row per brief attempt: model, score, gate, generation seconds
+    usage     calls, tokens and cost per stage and model of a run
+
+The CLI reports latency percentiles and throughput trends, and flags
+regressions, grouped by model, stage, client or config hash:
+
+    python agent/runstore.py summary --by model --days 7
+    python agent/runstore.py trend --by client --bucket day
+    python agent/runstore.py regressions --by stage --recent 1 --baseline 7
+"""
+import argparse
+import json
+import re
+import sqlite3
+import time
+
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils import load_config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    client TEXT NOT NULL,
+    data_folder TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    latency_seconds REAL,
+    total_tokens INTEGER,
+    cost_usd REAL,
+    brief_attempts INTEGER,
+    best_score REAL,
+    passed INTEGER,
+    index_unchanged INTEGER
+);
+CREATE TABLE IF NOT EXISTS stages (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    stage TEXT NOT NULL,
+    seconds REAL,
+    tokens INTEGER
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    attempt INTEGER NOT NULL,
+    model TEXT,
+    score REAL,
+    gate_passed INTEGER,
+    passed INTEGER,
+    generation_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS usage (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cost_usd REAL
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs(started_at);
+"""
+
+# work_metrics key -> stage name; generation is the sum of the attempts
+STAGE_KEYS = {
+    "extraction_time": "extraction",
+    "corpus_embedding_time": "corpus_embedding",
+    "vector_index_time": "vector_index",
+    "retrieval_time": "retrieval",
+    "evaluation_time": "evaluation",
+}
+ATTEMPT_KEY = re.compile(r"attempt_(\d+)_similarity")
+
+# latency series per grouping, as (grp, started_at, seconds) rows
+SERIES = {
+    "model": "SELECT a.model AS grp, r.started_at, a.generation_seconds AS seconds FROM attempts a JOIN runs r USING (run_id)",
+    "stage": "SELECT s.stage AS grp, r.started_at, s.seconds FROM stages s JOIN runs r USING (run_id)",
+    "client": "SELECT client AS grp, started_at, latency_seconds AS seconds FROM runs",
+    "config": "SELECT config_hash AS grp, started_at, latency_seconds AS seconds FROM runs",
+}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    # batch workers write from several processes
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def store_path(cfg: Dict) -> str:
+    return str(Path(cfg.get("work_folder", "work")) / cfg.get("run_store_file", "run_history.sqlite"))
+
+
+def record_run(cfg: Dict, metrics: Dict, data_folder: str, config_hash: str, started_at: float) -> int:
+    """
+    Append one run's metrics.json content to the store; returns its run_id.
+    The client is the one the run's index names (metrics.json ``client``),
+    else the data folder's name.
+    """
+    work = metrics.get("work_metrics", {})
+    threshold = float(cfg.get("similarity_threshold", 0.75))
+    usage = metrics.get("usage", {})
+
+    attempts = []
+    for key in work:
+        match = ATTEMPT_KEY.fullmatch(key)
+        if not match:
+            continue
+        n = int(match.group(1))
+        gate = work.get(f"attempt_{n}_gate") or {}
+        score = work[key]
+        attempts.append((n, work.get(f"attempt_{n}_model"), score, int(bool(gate.get("passed", True))),
+                         int(score >= threshold), work.get(f"attempt_{n}_generation_time")))
+
+    stages = {stage: work[key] for key, stage in STAGE_KEYS.items() if key in work}
+    if attempts:
+        stages["generation"] = sum(a[5] or 0 for a in attempts)
+    if work.get("warm_up_seconds"):
+        # models load in parallel
+        stages["warm_up"] = max(work["warm_up_seconds"].values())
+    stage_tokens = {
+        stage: sum(int(u.get("prompt_tokens", 0) + u.get("completion_tokens", 0)) for u in models.values())
+        for stage, models in usage.items()
+    }
+
+    # metrics.json rounds the total cost to cents
+    cost_usd = sum(u.get("cost_usd", 0) for models in usage.values() for u in models.values())
+    best_score = work.get("best_attempt_score")
+    with closing(connect(store_path(cfg))) as conn, conn:   # commits on success, then closes
+        run_id = conn.execute(
+            "INSERT INTO runs (started_at, client, data_folder, config_hash, latency_seconds, total_tokens,"
+            " cost_usd, brief_attempts, best_score, passed, index_unchanged) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+            (started_at, metrics.get("client") or Path(data_folder).resolve().name,
+             str(Path(data_folder).resolve()), config_hash,
+             metrics.get("latency_seconds"), metrics.get("total_tokens"), cost_usd,
+             len(attempts), best_score, None if best_score is None else int(best_score >= threshold),
+             int(bool(work.get("index_unchanged")))),
+        ).lastrowid
+        conn.executemany("INSERT INTO stages VALUES (?,?,?,?)",
+                         [(run_id, stage, seconds, stage_tokens.get(stage)) for stage, seconds in stages.items()])
+        conn.executemany("INSERT INTO attempts VALUES (?,?,?,?,?,?,?)", [(run_id, *a) for a in attempts])
+        conn.executemany("INSERT INTO usage VALUES (?,?,?,?,?,?,?)", [
+            (run_id, stage, model, u.get("calls"), u.get("prompt_tokens"), u.get("completion_tokens"), u.get("cost_usd"))
+            for stage, models in usage.items() for model, u in models.items()
+        ])
+    return run_id
+
+
+# ------------------------------------------------------------------
+# Queries
+# ------------------------------------------------------------------
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    arr = np.asarray(values, dtype=float)
+    return {"p50": float(np.percentile(arr, 50)), "p95": float(np.percentile(arr, 95)), "max": float(arr.max())}
+
+
+def latency_series(conn: sqlite3.Connection, by: str, since: float = 0, until: Optional[float] = None) -> Dict[str, List]:
+    """``{group: [(started_at, seconds), ...]}`` between *since* and *until*."""
+    rows = conn.execute(
+        f"SELECT grp, started_at, seconds FROM ({SERIES[by]})"
+        " WHERE seconds IS NOT NULL AND started_at >= ? AND started_at < ? ORDER BY started_at",
+        (since, until if until is not None else float("inf")),
+    )
+    series: Dict[str, List] = {}
+    for group, started_at, seconds in rows:
+        series.setdefault(str(group), []).append((started_at, seconds))
+    return series
+
+
+def summary(conn: sqlite3.Connection, by: str, since: float = 0) -> Dict[str, Dict]:
+    """Latency percentiles per group, plus pass rate and tokens where the grouping has them."""
+    report = {}
+    for group, points in sorted(latency_series(conn, by, since).items()):
+        report[group] = {"count": len(points), "seconds": percentiles([s for _, s in points])}
+    if by == "model":
+        for model, n, passed, score, tokens in conn.execute(
+            "SELECT a.model, COUNT(*), AVG(a.passed), AVG(a.score),"
+            " (SELECT SUM(u.prompt_tokens + u.completion_tokens) FROM usage u JOIN runs r2 USING (run_id)"
+            "  WHERE u.model = a.model AND u.stage = 'generation' AND r2.started_at >= ?)"
+            " FROM attempts a JOIN runs r USING (run_id) WHERE r.started_at >= ? GROUP BY a.model", (since, since)):
+            report.setdefault(str(model), {}).update(
+                {"pass_rate": passed, "mean_score": score, "mean_tokens": (tokens or 0) / n})
+    elif by == "stage":
+        for stage, tokens in conn.execute(
+            "SELECT s.stage, AVG(s.tokens) FROM stages s JOIN runs r USING (run_id)"
+            " WHERE r.started_at >= ? GROUP BY s.stage", (since,)):
+            report.setdefault(stage, {})["mean_tokens"] = tokens
+    else:
+        column = "client" if by == "client" else "config_hash"
+        for group, passed, attempts, tokens, cost in conn.execute(
+            f"SELECT {column}, AVG(passed), AVG(brief_attempts), AVG(total_tokens), SUM(cost_usd)"
+            f" FROM runs WHERE started_at >= ? GROUP BY {column}", (since,)):
+            report.setdefault(group, {}).update({"pass_rate": passed, "mean_attempts": attempts,
+                                                 "mean_tokens": tokens, "cost_usd": cost})
+    return report
+
+
+def trend(conn: sqlite3.Connection, by: str, bucket_seconds: float, since: float = 0) -> Dict[str, List[Dict]]:
+    """Per group and time bucket: count, throughput per hour and p50/p95 seconds."""
+    report = {}
+    for group, points in sorted(latency_series(conn, by, since).items()):
+        buckets: Dict[float, List[float]] = {}
+        for started_at, seconds in points:
+            buckets.setdefault(started_at // bucket_seconds * bucket_seconds, []).append(seconds)
+        report[group] = [
+            {
+                "bucket": time.strftime("%Y-%m-%d %H:%M", time.localtime(start)),
+                "count": len(values),
+                "per_hour": len(values) / (bucket_seconds / 3600),
+                **percentiles(values),
+            }
+            for start, values in sorted(buckets.items())
+        ]
+    return report
+
+
+def regressions(conn: sqlite3.Connection, by: str, recent_seconds: float, baseline_seconds: float,
+                tolerance: float, min_samples: int = 3) -> List[Dict]:
+    """Groups whose p95 over the recent window exceeds the preceding baseline window by more than *tolerance*."""
+    now = time.time()
+    split = now - recent_seconds
+    recent = latency_series(conn, by, split)
+    baseline = latency_series(conn, by, split - baseline_seconds, split)
+    flagged = []
+    for group, points in sorted(recent.items()):
+        before = baseline.get(group, [])
+        if len(points) < min_samples or len(before) < min_samples:
+            continue
+        now_p95 = percentiles([s for _, s in points])["p95"]
+        old_p95 = percentiles([s for _, s in before])["p95"]
+        change = (now_p95 - old_p95) / old_p95 if old_p95 else 0.0
+        if change > tolerance:
+            flagged.append({by: group, "baseline_p95": old_p95, "recent_p95": now_p95, "change": change,
+                            "recent_samples": len(points), "baseline_samples": len(before)})
+    return flagged
+
+
+def main():
+    cfg = load_config()
+    parser = argparse.ArgumentParser(description="Query the pipeline run history")
+    parser.add_argument("command", choices=["summary", "trend", "regressions"])
+    parser.add_argument("--by", choices=sorted(SERIES), default="model")
+    parser.add_argument("--days", type=float, default=None, help="only runs from the last DAYS days")
+    parser.add_argument("--bucket", choices=["hour", "day", "week"], default="day", help="trend bucket size")
+    parser.add_argument("--recent", type=float, default=1, help="regressions: recent window in days")
+    parser.add_argument("--baseline", type=float, default=7, help="regressions: baseline window in days before it")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="regressions: allowed p95 increase")
+    parser.add_argument("--min-samples", type=int, default=3, help="regressions: samples needed in each window")
+    parser.add_argument("--store", default=store_path(cfg), help="SQLite file (default: run_store_file in work_folder)")
+    args = parser.parse_args()
+
+    since = time.time() - args.days * 86400 if args.days else 0
+    with closing(connect(args.store)) as conn:
+        if args.command == "summary":
+            report = summary(conn, args.by, since)
+        elif args.command == "trend":
+            report = trend(conn, args.by, {"hour": 3600, "day": 86400, "week": 7 * 86400}[args.bucket], since)
+        else:
+            report = regressions(conn, args.by, args.recent * 86400, args.baseline * 86400, args.tolerance,
+                                 args.min_samples)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import threading
+import time
+
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+from typing import Dict, List, Optional
+
+import llm
+
+# minimum seconds between /api/ps refreshes
+SYNC_INTERVAL_SECONDS = 5.0
+
+
+def tagged(model: str) -> str:
+    """*model* with Ollama's implicit ``:latest`` tag, as /api/ps names it."""
+    if not model or ":" in model.rsplit("/", 1)[-1]:
+        return model
+    return f"{model}:latest"
+
+
+class ModelScheduler:
+    """
+    Admits LLM calls so that the models they need stay loaded.
+
+    Ollama loads a model on its first call and evicts models when memory
+    runs out, and each reload costs tens of seconds.  The scheduler keeps
+    its own view of which models are resident and how much memory they
+    use, and a call for a model that is not loaded waits until it fits.
+    To make room it unloads (``keep_alive=0``) an idle model large enough
+    on its own, else idle models least recently used first, but never a
+    model that still has calls queued: those
+    calls run first, so calls end up grouped by model.  A call that has
+    waited ``max_wait_seconds`` may displace a model with queued calls.
+
+    Models are tracked under their tagged names (``tagged``), so config
+    names match what /api/ps reports.  Every load and unload is recorded
+    in ``events()``.  The scheduler is thread-safe, and Ollama requests
+    are made with its lock released; batch mode serves one instance to
+    all worker processes through ``SchedulerManager``.
+    """
+
+    def __init__(self, cfg: Dict):
+        self.cfg = cfg
+        self.budget_gb = float(cfg.get("model_memory_budget_gb", 24))
+        self.sizes_gb: Dict[str, float] = {tagged(m): gb for m, gb in (cfg.get("model_memory_gb") or {}).items()}
+        self.embedding_model = tagged(cfg.get("embeddings_model_name", ""))
+        self.default_gb = float(cfg.get("default_model_memory_gb", 8))
+        self.max_wait_seconds = float(cfg.get("scheduler_max_wait_seconds", 120))
+        self._cond = threading.Condition()
+        self._resident: Dict[str, Dict] = {}   # model -> {"kind", "last_used"}
+        self._active: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+        self._events: List[Dict] = []
+        self._start = time.perf_counter()
+        self._wait_seconds = 0.0
+        self._last_sync = -SYNC_INTERVAL_SECONDS
+        with self._cond:
+            self._sync()
+
+    # ------------------------------------------------------------------
+    # Public interface (plain methods so it works through a manager proxy)
+    # ------------------------------------------------------------------
+    def acquire(self, model: str, kind: str = "chat", preload: bool = False) -> bool:
+        """
+        Block until *model* may be called.  With *preload* (warm-up) only
+        admit it if it is resident or fits without unloading anything,
+        and return False otherwise.
+        """
+        model = tagged(model)
+        start = time.perf_counter()
+        with self._cond:
+            self._waiting[model] = self._waiting.get(model, 0) + 1
+            try:
+                while True:
+                    waited = time.perf_counter() - start
+                    if self._admit(model, kind, preload, urgent=waited >= self.max_wait_seconds):
+                        break
+                    if preload:
+                        return False
+                    self._cond.wait(timeout=1.0)
+            finally:
+                self._waiting[model] -= 1
+            self._active[model] = self._active.get(model, 0) + 1
+            self._wait_seconds += time.perf_counter() - start
+            return True
+
+    def release(self, model: str) -> None:
+        model = tagged(model)
+        with self._cond:
+            self._active[model] -= 1
+            self._resident[model]["last_used"] = time.perf_counter()
+            self._cond.notify_all()
+
+    def events(self) -> List[Dict]:
+        with self._cond:
+            return list(self._events)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "resident": sorted(self._resident),
+                "loads": sum(1 for e in self._events if e["event"] == "load"),
+                "unloads": sum(1 for e in self._events if e["event"] == "unload"),
+                "wait_seconds": self._wait_seconds,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals (called with the condition held)
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _unlocked(self):
+        """Release the condition around an Ollama request, so other calls are not held up."""
+        self._cond.release()
+        try:
+            yield
+        finally:
+            self._cond.acquire()
+
+    def _size(self, model: str) -> float:
+        return float(self.sizes_gb.get(model, self.default_gb))
+
+    def _used(self) -> float:
+        return sum(self._size(m) for m in self._resident)
+
+    def _admit(self, model: str, kind: str, preload: bool, urgent: bool) -> bool:
+        if model in self._resident:
+            return True
+        needed = self._size(model) - (self.budget_gb - self._used())
+        if needed > 0 and not preload:
+            # Ollama may have unloaded models on its own (keep_alive expiry)
+            self._sync()
+            if model in self._resident:
+                return True
+            needed = self._size(model) - (self.budget_gb - self._used())
+        if needed > 0:
+            if preload:
+                return False
+            victims = self._victims(needed, urgent)
+            if victims is None:
+                return False
+            # the victims' memory is handed to *model* before the lock is released for the unloads
+            unloads = [(victim, self._resident.pop(victim)["kind"]) for victim in victims]
+            for victim, _ in unloads:
+                self._record("unload", victim)
+            self._resident[model] = {"kind": kind, "last_used": time.perf_counter()}
+            self._record("load", model)
+            with self._unlocked():
+                for victim, victim_kind in unloads:
+                    self._unload(victim, victim_kind)
+            return True
+        self._resident[model] = {"kind": kind, "last_used": time.perf_counter()}
+        self._record("load", model)
+        return True
+
+    def _victims(self, needed: float, urgent: bool) -> Optional[List[str]]:
+        """
+        Idle models to unload; None if not enough.  The least recently used
+        model that frees *needed* on its own is preferred, so a small model
+        (the embed model) is not unloaded just for being older; otherwise
+        models go least recently used first until enough is freed.
+        """
+        idle = [
+            m for m in self._resident
+            if not self._active.get(m) and (urgent or not self._waiting.get(m))
+        ]
+        idle.sort(key=lambda m: self._resident[m]["last_used"])
+        single = next((m for m in idle if self._size(m) >= needed), None)
+        if single is not None:
+            return [single]
+        victims, freed = [], 0.0
+        for m in idle:
+            if freed >= needed:
+                break
+            victims.append(m)
+            freed += self._size(m)
+        if freed >= needed:
+            return victims
+        # a model larger than the budget still runs once everything else is idle
+        if len(self._resident) == len(idle) and not any(self._active.values()):
+            return idle
+        return None
+
+    def _unload(self, model: str, kind: str) -> None:
+        """Ask Ollama to unload *model* (called with the condition released)."""
+        try:
+            llm.unload(self.cfg, model, kind)
+        except Exception as e:
+            print(f"Unloading {model} failed: {e}")
+
+    def _sync(self) -> None:
+        """
+        Refresh resident models and their sizes from Ollama's /api/ps.  The
+        request is made with the condition released; models admitted or
+        used while it was in flight are kept.
+        """
+        now = time.perf_counter()
+        if now - self._last_sync < SYNC_INTERVAL_SECONDS:
+            return
+        self._last_sync = now
+        with self._unlocked():
+            try:
+                running = llm.running_models(self.cfg)
+            except Exception:
+                running = None
+        if running is None:
+            return
+        for m in running:
+            self.sizes_gb[tagged(m["model"])] = m["size"] / 1024 ** 3
+        loaded = {tagged(m["model"]) for m in running}
+        for model in list(self._resident):
+            if (model not in loaded and not self._active.get(model) and not self._waiting.get(model)
+                    and self._resident[model]["last_used"] < now):
+                del self._resident[model]
+                self._record("unload", model, reason="expired")
+        for model in loaded - set(self._resident):
+            kind = "embed" if model == self.embedding_model else "chat"
+            self._resident[model] = {"kind": kind, "last_used": 0.0}
+
+    def _record(self, event: str, model: str, **extra) -> None:
+        self._events.append({
+            "event": event,
+            "model": model,
+            "at_seconds": round(time.perf_counter() - self._start, 3),
+            "memory_used_gb": round(self._used(), 2),
+            **extra,
+        })
+
+
+class SchedulerManager(BaseManager):
+    """Serves one ModelScheduler to every batch worker process."""
+
+
+SchedulerManager.register("ModelScheduler", ModelScheduler)
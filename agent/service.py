@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+"""
+Resident pipeline service.
+
+An asyncio HTTP server on localhost that loads config.yaml, the Ollama
+client and the models once, then runs pipeline jobs from a bounded
+queue with ``service_workers`` workers:
+
+    POST /jobs          {"data_folder": "..."} or {"documents": {"transcript_01.txt": "...", ...}}
+    GET  /jobs          every known job and its status
+    GET  /jobs/<id>     status, timings and, once done, the brief and metrics
+    GET  /stats         queue depth, running jobs and latency percentiles
+    GET  /health
+
+A full queue answers 503.  Jobs for the same data folder share a work
+folder and run one at a time, so with ``incremental_index`` and
+``retrieval_enabled`` the extraction state and the vector index carry
+over between them.  Uploaded documents, and the work folder of their
+job, are removed once the job has finished.  Each job writes its trace
+(``trace_enabled``) to its own outputs folder.
+"""
+import argparse
+import asyncio
+import fnmatch
+import hashlib
+import itertools
+import json
+import shutil
+import threading
+import time
+import traceback
+
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import llm
+from ingest import SOURCE_PATTERNS
+from pipeline import embedding_models, run_pipeline
+from utils import load_config, read_json
+
+MAX_HEADER_BYTES = 64 * 1024
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def percentiles(values) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    arr = np.asarray(values, dtype=float)
+    return {"p50": float(np.percentile(arr, 50)), "p95": float(np.percentile(arr, 95)), "max": float(arr.max())}
+
+
+class PipelineService:
+    """Job queue, workers and state shared by every request."""
+
+    def __init__(self, cfg: Dict, workers: Optional[int] = None):
+        self.cfg = cfg
+        self.workers = workers or int(cfg.get("service_workers", 2))
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=int(cfg.get("service_queue_size", 16)))
+        self.max_body = int(float(cfg.get("service_max_body_mb", 20)) * 1024 * 1024)
+        self.outputs_root = Path(cfg.get("output_folder", "outputs")) / "service"
+        self.work_root = Path(cfg.get("work_folder", "work")) / "service"
+        # finished jobs are forgotten oldest first past service_job_history
+        self.history = int(cfg.get("service_job_history", 200))
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self.running = 0
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self.wait_seconds: deque = deque(maxlen=1000)
+        self.run_seconds: deque = deque(maxlen=1000)
+        self.started = time.time()
+        self._ids = itertools.count(1)
+        self._folder_locks: Dict[str, threading.Lock] = {}
+        self._folder_locks_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+
+    # --------------------------------------------------------------
+    # Startup
+    # --------------------------------------------------------------
+    def warm(self) -> Dict[str, float]:
+        """Open the Ollama client and load the models every job will use."""
+        llm.get_client(self.cfg)
+        if int(self.cfg.get("warm_up_models", 0)) != 1:
+            return {}
+        width = max(1, int(self.cfg.get("speculative_width", 1)))
+        brief_models = self.cfg["brief_model_names"].split(",")[:width]
+        return llm.warm_up(self.cfg, [self.cfg["extract_model_name"], *brief_models], embedding_models(self.cfg))
+
+    async def start_workers(self) -> None:
+        for _ in range(self.workers):
+            asyncio.create_task(self._worker())
+
+    # --------------------------------------------------------------
+    # Jobs
+    # --------------------------------------------------------------
+    def submit(self, body: Dict) -> Dict:
+        if self.queue.full():
+            self.counts["rejected"] += 1
+            raise HttpError(503, f"queue full ({self.queue.maxsize} jobs waiting)")
+        job_id = f"{time.strftime('%Y%m%d%H%M%S')}-{next(self._ids)}"
+        uploaded = bool(body.get("documents"))
+        if uploaded:
+            data_folder = self._save_documents(job_id, body["documents"])
+            work_key = job_id
+        elif body.get("data_folder"):
+            data_folder = Path(body["data_folder"]).resolve()
+            if not data_folder.is_dir():
+                raise HttpError(400, f"data_folder not found: {body['data_folder']}")
+            work_key = hashlib.sha256(str(data_folder).encode()).hexdigest()[:16]
+        else:
+            raise HttpError(400, "expected data_folder or documents")
+
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "data_folder": str(data_folder),
+            "outputs_dir": str(self.outputs_root / job_id),
+            "work_folder": str(self.work_root / work_key),
+            "uploaded": uploaded,
+            "submitted_at": time.time(),
+        }
+        self.queue.put_nowait(job_id)
+        self.jobs[job_id] = job
+        self.counts["submitted"] += 1
+        self._forget_old_jobs()
+        return {"job_id": job_id, "status": "queued", "queue_depth": self.queue.qsize()}
+
+    def _save_documents(self, job_id: str, documents: Dict[str, str]) -> Path:
+        if not isinstance(documents, dict):
+            raise HttpError(400, "documents must map file names to their contents")
+        folder = (self.work_root / "uploads" / job_id).resolve()
+        for name, text in documents.items():
+            name = Path(str(name)).name
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in SOURCE_PATTERNS):
+                raise HttpError(400, f"{name}: expected one of {', '.join(SOURCE_PATTERNS)}")
+            if not isinstance(text, str):
+                raise HttpError(400, f"{name}: contents must be a string")
+        folder.mkdir(parents=True, exist_ok=True)
+        for name, text in documents.items():
+            (folder / Path(str(name)).name).write_text(text)
+        return folder
+
+    def _forget_old_jobs(self) -> None:
+        finished = [j for j, job in self.jobs.items() if job["status"] in ("done", "error")]
+        for job_id in finished[: max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                self.queue.task_done()
+                continue
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            self.wait_seconds.append(job["started_at"] - job["submitted_at"])
+            self.running += 1
+            try:
+                job.update(await loop.run_in_executor(self._pool, self._run_job, job))
+            finally:
+                self.running -= 1
+                job["finished_at"] = time.time()
+                self.run_seconds.append(job["finished_at"] - job["started_at"])
+                self.counts["completed" if job["status"] == "done" else "failed"] += 1
+                self.queue.task_done()
+
+    def _run_job(self, job: Dict) -> Dict:
+        """Run one pipeline; any failure is returned instead of raised."""
+        with self._folder_lock(job["work_folder"]):
+            try:
+                metrics = run_pipeline(data_folder=job["data_folder"], outputs_dir=job["outputs_dir"],
+                                       work_folder=job["work_folder"], trace_folder=job["outputs_dir"])
+            except Exception as e:
+                traceback.print_exc()
+                return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            finally:
+                if job["uploaded"]:
+                    # nothing carries over from a one-off upload
+                    shutil.rmtree(job["data_folder"], ignore_errors=True)
+                    shutil.rmtree(job["work_folder"], ignore_errors=True)
+                    self._forget_folder_lock(job["work_folder"])
+        return {"status": "done", "metrics": metrics}
+
+    def _folder_lock(self, work_folder: str) -> threading.Lock:
+        with self._folder_locks_lock:
+            return self._folder_locks.setdefault(work_folder, threading.Lock())
+
+    def _forget_folder_lock(self, work_folder: str) -> None:
+        with self._folder_locks_lock:
+            self._folder_locks.pop(work_folder, None)
+
+    def describe(self, job_id: str) -> Dict:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HttpError(404, f"unknown job {job_id}")
+        result = dict(job)
+        if "started_at" in job:
+            result["wait_seconds"] = job["started_at"] - job["submitted_at"]
+        if "finished_at" in job:
+            result["run_seconds"] = job["finished_at"] - job["started_at"]
+        if job["status"] == "done":
+            # the file is named after the client the pipeline extracted
+            brief_file = next(Path(job["outputs_dir"]).glob(self.cfg["brief_file"].format(client_name="*")), None)
+            result["brief"] = read_json(str(brief_file)) if brief_file else None
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "running": self.running,
+            "workers": self.workers,
+            **self.counts,
+            "wait_seconds": percentiles(self.wait_seconds),
+            "run_seconds": percentiles(self.run_seconds),
+            "uptime_seconds": time.time() - self.started,
+            "llm_cache": llm.cache_stats(self.cfg),
+        }
+
+    # --------------------------------------------------------------
+    # HTTP
+    # --------------------------------------------------------------
+    def route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict]:
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if parts == ["health"] and method == "GET":
+            return 200, {"status": "ok"}
+        if parts == ["stats"] and method == "GET":
+            return 200, self.stats()
+        if parts == ["jobs"] and method == "GET":
+            return 200, {j: {"status": job["status"]} for j, job in self.jobs.items()}
+        if parts == ["jobs"] and method == "POST":
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                raise HttpError(400, f"invalid JSON: {e}")
+            if not isinstance(payload, dict):
+                raise HttpError(400, "expected a JSON object")
+            return 202, self.submit(payload)
+        if len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+            return 200, self.describe(parts[1])
+        if parts in (["health"], ["stats"], ["jobs"]) or (len(parts) == 2 and parts[0] == "jobs"):
+            raise HttpError(405, f"{method} not allowed on {path}")
+        raise HttpError(404, f"no route for {path}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """One request per connection."""
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                headers = {k.strip().lower(): v.strip()
+                           for k, _, v in (line.partition(":") for line in header_lines if line)}
+                length = int(headers.get("content-length", 0))
+                if length > self.max_body:
+                    raise HttpError(413, f"body larger than {self.max_body} bytes")
+                body = await reader.readexactly(length) if length else b""
+                status, payload = self.route(method.upper(), path, body)
+            except HttpError as e:
+                status, payload = e.status, {"error": str(e)}
+            except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+                status, payload = 400, {"error": f"malformed request: {e}"}
+            data = json.dumps(payload, indent=2, default=str).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, workers: Optional[int] = None) -> None:
+    cfg = load_config()
+    service = PipelineService(cfg, workers)
+    print("warming up models")
+    loaded = await asyncio.get_running_loop().run_in_executor(None, service.warm)
+    if loaded:
+        print(f"models ready: {', '.join(loaded)}")
+    await service.start_workers()
+    server = await asyncio.start_server(service.handle, host, port, limit=MAX_HEADER_BYTES)
+    addresses = ", ".join(f"http://{s.getsockname()[0]}:{s.getsockname()[1]}" for s in server.sockets)
+    print(f"serving on {addresses} ({service.workers} workers, queue of {service.queue.maxsize})")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    cfg = load_config()
+    parser = argparse.ArgumentParser(description="Run the pipeline as a resident HTTP service")
+    parser.add_argument("--host", default=cfg.get("service_host", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(cfg.get("service_port", 8765)))
+    parser.add_argument("--workers", type=int, default=None,
+                        help="concurrent pipeline jobs (default: service_workers in config.yaml)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        print("service stopped")
+
+
+if __name__ == "__main__":
+    main()
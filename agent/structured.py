@@ -0,0 +1,113 @@
+import csv
+import json
+
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils import timer
+
+TRUE_VALUES = ("true", "1", "yes", "y")
+
+
+def _enabled(row: Dict) -> bool:
+    return str(row.get("enabled", "true")).strip().lower() in TRUE_VALUES
+
+
+def _csv_modules(rows: Iterable[Dict]) -> Dict:
+    """requirements_modules.csv: one row per module, optionally disabled."""
+    return {"modules": [row["module"].strip() for row in rows if (row.get("module") or "").strip() and _enabled(row)]}
+
+
+def _csv_milestones(rows: Iterable[Dict]) -> Dict:
+    """requirements_timeline.csv: each milestone, with its date and owner, is a deliverable."""
+    deliverables = []
+    for row in rows:
+        milestone = (row.get("milestone") or "").strip()
+        if not milestone:
+            continue
+        details = [f"due {row['date'].strip()}" if (row.get("date") or "").strip() else "",
+                   f"owner {row['owner'].strip()}" if (row.get("owner") or "").strip() else ""]
+        details = ", ".join(d for d in details if d)
+        deliverables.append(f"{milestone} ({details})" if details else milestone)
+    return {"deliverables": deliverables}
+
+
+def _salesforce_account(data: Dict) -> Dict:
+    """salesforce_export.json: the account, its purchased modules and contacts."""
+    entities: Dict = {}
+    if data.get("account_name"):
+        entities["client_name"] = str(data["account_name"]).strip()
+    modules = data.get("modules_purchased") or []
+    entities["modules"] = [str(m).strip() for m in (modules if isinstance(modules, list) else [modules]) if str(m).strip()]
+    contacts = []
+    for contact in data.get("primary_contacts") or []:
+        if isinstance(contact, dict) and contact.get("name"):
+            contacts.append(f"{contact['name']} ({contact['role']})" if contact.get("role") else contact["name"])
+    if contacts:
+        entities["contacts"] = contacts
+    return entities
+
+
+# CSV schemas, matched on the header: (columns that must be present, mapper)
+CSV_SCHEMAS: List[tuple] = [
+    ({"module"}, _csv_modules),
+    ({"milestone"}, _csv_milestones),
+]
+# JSON schemas, matched on the top-level keys of an object: (any of these keys, mapper)
+JSON_SCHEMAS: List[tuple] = [
+    ({"account_name", "modules_purchased"}, _salesforce_account),
+]
+
+
+def _csv_mapper(path: Path) -> Optional[Callable]:
+    with path.open(newline="", encoding="utf-8") as f:
+        header = {c.strip().lower() for c in next(csv.reader(f), [])}
+    return next((mapper for columns, mapper in CSV_SCHEMAS if columns <= header), None)
+
+
+def extract_source(path: Path) -> Optional[Dict]:
+    """
+    Entities of a structured source file of a known schema, or None when
+    the file is not structured or its schema is unknown (the caller then
+    falls back to the LLM).
+    """
+    try:
+        if path.suffix.lower() == ".csv":
+            mapper = _csv_mapper(path)
+            if mapper is None:
+                return None
+            with path.open(newline="", encoding="utf-8") as f:
+                rows = [{(k or "").strip().lower(): v for k, v in row.items()} for row in csv.DictReader(f)]
+            return mapper(rows)
+        if path.suffix.lower() == ".json":
+            with path.open(encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                return None
+            mapper = next((m for keys, m in JSON_SCHEMAS if keys & data.keys()), None)
+            return mapper(data) if mapper else None
+    except (OSError, ValueError, UnicodeDecodeError) as e:
+        print(f"Structured extraction error for {path.name}: {e}")
+    return None
+
+
+@timer
+def extract_structured(data_dir: Path, sources: Iterable[str]) -> Dict:
+    """
+    Map the structured *sources* of known schemas straight to extraction
+    records, without an LLM call:
+
+        {"source": "salesforce_export.json", "entities": {...}, "provenance": "structured"}
+
+    ``fallback`` lists the sources left for the LLM.
+    """
+    records = []
+    fallback = []
+    for name in sources:
+        entities = extract_source(data_dir / name)
+        if entities is None:
+            fallback.append(name)
+            continue
+        print(f"extracting {name} (structured)")
+        records.append({"source": name, "entities": entities, "provenance": "structured"})
+    return {"result": records, "elapsed_seconds": 0, "fallback": fallback}
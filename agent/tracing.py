@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Tracing is off unless enable() is called; span() then returns a shared
+# no-op object, so instrumented code pays one global lookup per span.
+_enabled = False
+_finished: List["Span"] = []
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation; nested spans point at their parent."""
+
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "trace_id", "start", "end", "pid", "tid", "_token")
+
+    def __init__(self, name: str, attrs: Dict[str, Any], parent: Optional["Span"]):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.start = 0.0
+        self.end = 0.0
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self._token = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end = time.perf_counter()
+        if exc is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        with _lock:
+            _finished.append(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_seconds": self.end - self.start,
+            "pid": self.pid,
+            "tid": self.tid,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def enable(on: bool = True) -> None:
+    global _enabled
+    _enabled = on
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, **attrs: Any):
+    """Context manager timing *name* as a child of the current span."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs, _current.get())
+
+
+def current():
+    """The innermost open span (a no-op span when tracing is off)."""
+    return (_current.get() if _enabled else None) or _NOOP
+
+
+def propagate(fn: Callable) -> Callable:
+    """
+    Bind *fn* to the current span so spans it opens in a pool thread
+    nest under the span that submitted it.
+    """
+    if not _enabled:
+        return fn
+    parent = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def export(root: Span, folder: str, name: str = "trace") -> None:
+    """
+    Write the finished spans of *root*'s trace to ``<name>.jsonl`` (one
+    span per line) and ``<name>.chrome.json`` (Chrome ``trace_event``
+    format, for chrome://tracing or Perfetto), then drop them from memory.
+    """
+    if not isinstance(root, Span):
+        return
+    with _lock:
+        spans = [s for s in _finished if s.trace_id == root.trace_id]
+        _finished[:] = [s for s in _finished if s.trace_id != root.trace_id]
+    spans.sort(key=lambda s: s.start)
+
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    with open(Path(folder) / f"{name}.jsonl", "w") as f:
+        for s in spans:
+            f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+    origin = root.start
+    events = [
+        {
+            "name": s.name,
+            "cat": s.name.split(".")[0],
+            "ph": "X",
+            "ts": (s.start - origin) * 1e6,
+            "dur": (s.end - s.start) * 1e6,
+            "pid": s.pid,
+            "tid": s.tid,
+            "args": s.attrs,
+        }
+        for s in spans
+    ]
+    with open(Path(folder) / f"{name}.chrome.json", "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
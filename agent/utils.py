@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import copy
+import functools
+import hashlib
 import json
 import os
+import threading
 import time
 import re
 
@@ -11,10 +15,32 @@ from typing import Any, Dict, List, Tuple, Union
 import numpy as np
 import yaml
 
+import tracing
+from jsonstream import JsonObjectScanner
+
+
+# parsed config files, keyed by path, and the (mtime, size) they were parsed at
+_config_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+_config_lock = threading.Lock()
+
 
 def load_config(path: str = "config.yaml") -> Dict[str, Any]:
-    with open(path, "r") as f:
-        return yaml.safe_load(f)
+    """
+    Parse *path*, or reuse the last parse while the file is unchanged.
+    Every stage calls this, so a long-running process parses the YAML
+    once; callers get their own copy and may modify it.
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = os.path.abspath(path)
+    with _config_lock:
+        cached = _config_cache.get(key)
+    if cached is None or cached[0] != stamp:
+        with open(path, "r") as f:
+            cached = (stamp, yaml.safe_load(f))
+        with _config_lock:
+            _config_cache[key] = cached
+    return copy.deepcopy(cached[1])
 
 
 def read_json(path: str) -> Any:
@@ -28,6 +54,14 @@ def write_json(path: str, data: Any, indent: int = 2) -> None:
         json.dump(data, f, indent=indent)
 
 
+def config_hash(cfg: Dict[str, Any], keys: List[str] | None = None) -> str:
+    """Short, stable hash of *cfg* (or of the given *keys* only)."""
+    if keys is not None:
+        cfg = {k: cfg.get(k) for k in keys}
+    payload = json.dumps(cfg, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
 def cosine_similarity_old(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
 
@@ -67,16 +101,67 @@ def cosine_similarity(a: np.ndarray | list, b: np.ndarray | list) -> float:
     return float(dot / (norm_a * norm_b))
 
 
+def cosine_similarities(matrix: np.ndarray, vector: np.ndarray | list) -> np.ndarray:
+    """
+    Cosine similarity of every row of *matrix* against *vector*.
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        2‑D array of shape (n, dim), one embedding per row.
+    vector : np.ndarray | list
+        1‑D embedding (a (1, dim) array is flattened).
+
+    Returns
+    -------
+    np.ndarray
+        Array of n scores in [-1, 1]; rows or vectors with zero norm score 0.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    vector = np.asarray(vector, dtype=float).reshape(-1)
+    if matrix.size == 0:
+        return np.zeros(0)
+
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    dots = matrix @ vector
+    # Guard against zero‑vectors (division by 0)
+    return np.divide(dots, norms, out=np.zeros_like(dots), where=norms != 0)
+
+
+def cosine_similarity_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of every row of *a* against every row of *b*.
+
+    Returns
+    -------
+    np.ndarray
+        (len(a), len(b)) array; zero-norm rows score 0.
+    """
+    a = np.atleast_2d(np.asarray(a, dtype=float))
+    b = np.atleast_2d(np.asarray(b, dtype=float))
+    if a.size == 0 or b.size == 0:
+        return np.zeros((len(a), len(b)))
+    norms = np.outer(np.linalg.norm(a, axis=1), np.linalg.norm(b, axis=1))
+    dots = a @ b.T
+    return np.divide(dots, norms, out=np.zeros_like(dots), where=norms != 0)
+
+
 def timer(func):
-    """Decorator that adds 'elapsed_seconds' to the returned dict."""
+    """
+    Decorator that runs the stage in a trace span named after it and
+    adds 'elapsed_seconds' to the returned dict.
+    """
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.perf_counter()
-        result = func(*args, **kwargs)
-        elapsed = time.perf_counter() - start
-        if isinstance(result, dict):
-            result["elapsed_seconds"] = elapsed
-        else:
-            result = {"result": result, "elapsed_seconds": elapsed}
+        with tracing.span(func.__name__) as span:
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            if isinstance(result, dict):
+                result["elapsed_seconds"] = elapsed
+                span.set(total_tokens=result.get("total_tokens"))
+            else:
+                result = {"result": result, "elapsed_seconds": elapsed}
         return result
     return wrapper
 
@@ -87,7 +172,112 @@ def token_count(text: str) -> int:
     return max(1, estimated_tokens)
 
 
+# --------------------------------------------------------------- #
+# Token accounting from Ollama response counters
+# --------------------------------------------------------------- #
+USAGE_FIELDS = ("calls", "cached_calls", "estimated_calls", "prompt_tokens",
+                "completion_tokens", "prompt_eval_seconds", "eval_seconds", "load_seconds")
+
+
+def response_usage(resp: Dict[str, Any], prompt: str = "") -> Dict[str, float]:
+    """
+    Token counts and timings of one Ollama chat/embed response.
+
+    Counts come from ``prompt_eval_count``/``eval_count``; ``token_count``
+    is only used when Ollama did not return them.  Cached responses cost
+    nothing and are counted as ``cached_calls``.  Streamed responses add
+    their time to first token, and early-stopped ones an upper bound on
+    the completion tokens they avoided.
+    """
+    if resp.get("cached"):
+        return {"calls": 1, "cached_calls": 1}
+
+    usage = {"calls": 1}
+    prompt_tokens = resp.get("prompt_eval_count")
+    completion_tokens = resp.get("eval_count")
+    if prompt_tokens is None or (completion_tokens is None and "message" in resp):
+        usage["estimated_calls"] = 1
+    if prompt_tokens is None:
+        prompt_tokens = token_count(prompt)
+    if completion_tokens is None:
+        content = resp.get("message", {}).get("content", "")
+        completion_tokens = token_count(content) if content else 0
+    usage["prompt_tokens"] = prompt_tokens
+    usage["completion_tokens"] = completion_tokens
+    # Ollama durations are in nanoseconds
+    usage["prompt_eval_seconds"] = resp.get("prompt_eval_duration", 0) / 1e9
+    usage["eval_seconds"] = resp.get("eval_duration", 0) / 1e9
+    usage["load_seconds"] = resp.get("load_duration", 0) / 1e9
+    if resp.get("ttft_seconds") is not None:
+        usage["streamed_calls"] = 1
+        usage["ttft_seconds"] = resp["ttft_seconds"]
+    if resp.get("early_stop"):
+        usage["early_stops"] = 1
+        usage["tokens_saved_max"] = resp.get("tokens_saved_max", 0)
+    return usage
+
+
+def add_usage(into: Dict[str, Dict[str, float]], model: str, usage: Dict[str, float]) -> None:
+    """Accumulate one response's *usage* under *model*."""
+    counters = into.setdefault(model, {field: 0 for field in USAGE_FIELDS})
+    for field, value in usage.items():
+        counters[field] = counters.get(field, 0) + value
+
+
+def merge_usage(into: Dict[str, Dict[str, float]], other: Dict[str, Dict[str, float]]) -> None:
+    """Accumulate a per-model usage dict into another."""
+    for model, usage in (other or {}).items():
+        add_usage(into, model, usage)
+
+
+def usage_tokens(usage: Dict[str, Dict[str, float]]) -> int:
+    return int(sum(u.get("prompt_tokens", 0) + u.get("completion_tokens", 0) for u in usage.values()))
+
+
+def model_cost_1k(cfg: Dict[str, Any], model: str) -> Tuple[float, float]:
+    """
+    (prompt, completion) USD per 1k tokens for *model*.
+
+    ``model_costs_1k`` entries are either one rate or a mapping with
+    ``prompt``/``completion`` rates; unlisted models fall back to
+    ``estimate_model_cost_1k``.
+    """
+    default = cfg.get("estimate_model_cost_1k", 0)
+    rate = (cfg.get("model_costs_1k") or {}).get(model, default)
+    if isinstance(rate, dict):
+        return rate.get("prompt", default), rate.get("completion", default)
+    return rate, rate
+
+
+def usage_report(cfg: Dict[str, Any], usage_by_stage: Dict[str, Dict[str, Dict[str, float]]]) -> Tuple[Dict, float]:
+    """
+    Per-stage, per-model usage with cost and throughput, plus the total cost.
+    """
+    report: Dict[str, Dict[str, Dict[str, float]]] = {}
+    total_cost = 0.0
+    for stage, models in usage_by_stage.items():
+        report[stage] = {}
+        for model, u in models.items():
+            prompt_rate, completion_rate = model_cost_1k(cfg, model)
+            cost = (u.get("prompt_tokens", 0) * prompt_rate + u.get("completion_tokens", 0) * completion_rate) / 1000
+            total_cost += cost
+            prompt_eval_seconds = u.get("prompt_eval_seconds", 0)
+            eval_seconds = u.get("eval_seconds", 0)
+            report[stage][model] = {
+                **u,
+                "prompt_tokens_per_second": u.get("prompt_tokens", 0) / prompt_eval_seconds if prompt_eval_seconds else None,
+                "tokens_per_second": u.get("completion_tokens", 0) / eval_seconds if eval_seconds else None,
+                **({"mean_ttft_seconds": u["ttft_seconds"] / u["streamed_calls"]} if u.get("streamed_calls") else {}),
+                "cost_usd": round(cost, 6),
+            }
+    return report, total_cost
+
+
 def extract_json(text):
+    # first balanced object outside <think> blocks; the greedy regex is the fallback
+    data = JsonObjectScanner().feed(text)
+    if data is not None:
+        return json.dumps(data)
     match = re.search(r'\{.*\}', text, re.DOTALL)
     if match:
         try:
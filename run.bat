@@ -14,6 +14,14 @@ rem Activate it
 call .venv\Scripts\activate.bat
 echo Virtual environment activated ...
 
+rem Install requirements, only when they changed since the last install
+copy /b starter\requirements.txt + agent\requirements.txt .venv\requirements.new >nul
+fc /b .venv\requirements.new .venv\requirements.installed >nul 2>&1
+IF NOT ERRORLEVEL 1 (
+    echo Requirements unchanged - skipping pip install
+    goto :deps_ready
+)
+
 rem Upgrade pip
 python -m pip install --upgrade pip
 
@@ -23,6 +31,9 @@ pip install -r starter\requirements.txt
 
 echo Installing agent requirements
 pip install -r agent\requirements.txt
+copy /y .venv\requirements.new .venv\requirements.installed >nul
+
+:deps_ready
 
 rem Run the pipeline
 echo Running agent\pipeline.py ...
@@ -16,21 +16,27 @@ fi
 source .venv/bin/activate
 echo "Virtual environment activated"
 
-# 3️⃣  Upgrade pip (recommended)
-pip install -U pip
-
-# 4️⃣  Install the two requirement files
-echo "Installing starter requirements …"
-pip install -r starter/requirements.txt
-
-echo "Installing agent requirements …"
-pip install -r agent/requirements.txt
+# 3️⃣  Install requirements, only when they changed since the last install
+REQ_STAMP=".venv/.requirements.sha256"
+REQ_HASH=$(cat starter/requirements.txt agent/requirements.txt | sha256sum | cut -d' ' -f1)
+if [[ ! -f "$REQ_STAMP" || "$(cat "$REQ_STAMP")" != "$REQ_HASH" ]]; then
+  pip install -U pip
+
+  echo "Installing starter requirements …"
+  pip install -r starter/requirements.txt
+
+  echo "Installing agent requirements …"
+  pip install -r agent/requirements.txt
+  echo "$REQ_HASH" > "$REQ_STAMP"
+else
+  echo "Requirements unchanged – skipping pip install"
+fi
 
-# 5️⃣  Run the pipeline
+# 4️⃣  Run the pipeline
 echo "Running agent/pipeline.py …"
 python agent/pipeline.py
 
-# 6️⃣  Run the evaluation script
+# 5️⃣  Run the evaluation script
 echo "Running starter/eval.py …"
 python starter/eval.py
 
@@ -1,11 +1,17 @@
 from __future__ import annotations
+import argparse
 import json
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import sys
 import time
 import yaml
 
 REQUIRED_KEYS = ["modules", "config_yaml", "risks", "next_steps"]
+# scores summarised in batch reports; the last three come from metrics.json
+REPORT_FIELDS = ["field_completeness", "module_accuracy", "hallucination_rate",
+                 "latency_seconds", "cost_estimate_usd", "total_tokens"]
 
 def load_json(p: Path):
     return json.loads(p.read_text())
@@ -15,14 +21,31 @@ def jaccard(a: set, b: set) -> float:
         return 1.0
     return len(a & b) / max(1, len(a | b))
 
-def main():
-    root = Path(__file__).resolve().parents[1]
-    outputs = root / "outputs"
-    gold = root / "gold" / "customerX.yaml"
+def percentile(values: list, q: float) -> float | None:
+    """Linear-interpolated percentile (numpy's default method), q in [0, 100]."""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
 
-    brief_path = outputs / "customerX_brief.json"
-    metrics_path = outputs / "metrics.json"
+def distribution(values: list) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "min": None, "max": None}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "min": min(values),
+        "max": max(values),
+    }
 
+def score(brief: dict, gold_data: dict, metrics: dict | None) -> dict:
+    """Score one brief against its gold file (and metrics.json, when present)."""
     results = {
         "field_completeness": 0.0,
         "module_accuracy": 0.0,
@@ -33,17 +56,11 @@ def main():
         "status": "FAIL",
     }
 
-    if not brief_path.exists():
-        print("No outputs found. Expected `outputs/customerX_brief.json`. Please generate your agent outputs and rerun.")
-        sys.exit(2)
-
-    brief = load_json(brief_path)
     # Field completeness
     present = sum(1 for k in REQUIRED_KEYS if k in brief)
     results["field_completeness"] = present / len(REQUIRED_KEYS)
 
     # Module accuracy vs gold
-    gold_data = yaml.safe_load(gold.read_text())
     gold_modules = set(m.strip().lower() for m in gold_data.get("modules", []))
     pred_modules = set(m.strip().lower() for m in brief.get("modules", []))
     results["module_accuracy"] = jaccard(pred_modules, gold_modules)
@@ -51,15 +68,146 @@ def main():
     results["hallucination_rate"] = 0.0 if not pred_modules else len(hallucinations) / len(pred_modules)
 
     # Metrics (optional)
-    if metrics_path.exists():
-        m = load_json(metrics_path)
-        results["latency_seconds"] = m.get("latency_seconds")
-        results["cost_estimate_usd"] = m.get("cost_estimate_usd")
-        results["total_tokens"] = m.get("total_tokens")
+    if metrics:
+        results["latency_seconds"] = metrics.get("latency_seconds")
+        results["cost_estimate_usd"] = metrics.get("cost_estimate_usd")
+        results["total_tokens"] = metrics.get("total_tokens")
 
     # Simple pass/fail suggestion (you may adjust thresholds)
     if results["field_completeness"] == 1.0 and results["module_accuracy"] >= 0.67:
         results["status"] = "PASS"
+    return results
+
+# ------------------------------------------------------------------
+# Batch mode
+# ------------------------------------------------------------------
+def find_gold(brief_path: Path, root: Path, gold_root: Path) -> Path | None:
+    """
+    The gold file for ``<dir>/<client>_brief.json``: ``<client>.yaml`` next
+    to the brief, or under *gold_root* as ``<client>.yaml``,
+    ``<dir name>.yaml`` or ``<dir relative to root>/<client>.yaml``.
+    A version suffix is not part of the client: ``customerX_v1_brief.json``
+    is scored against ``customerX.yaml``.
+    """
+    client = re.sub(r"_v\d+$", "", brief_path.name[: -len("_brief.json")])
+    relative = brief_path.parent.relative_to(root)
+    candidates = [
+        brief_path.parent / f"{client}.yaml",
+        gold_root / relative / f"{client}.yaml",
+        gold_root / f"{brief_path.parent.name}.yaml",
+        gold_root / f"{client}.yaml",
+    ]
+    return next((p for p in candidates if p.is_file()), None)
+
+def discover(root: Path, gold_root: Path) -> list[tuple[str, str, str | None, str | None]]:
+    """(name, brief, gold, metrics) for every ``*_brief.json`` under *root*."""
+    triples = []
+    for brief_path in sorted(root.rglob("*_brief.json")):
+        gold = find_gold(brief_path, root, gold_root)
+        metrics = brief_path.parent / "metrics.json"
+        name = str(brief_path.relative_to(root))
+        triples.append((name, str(brief_path), str(gold) if gold else None,
+                        str(metrics) if metrics.is_file() else None))
+    return triples
+
+def score_triple(triple: tuple) -> tuple[str, dict]:
+    name, brief_path, gold_path, metrics_path = triple
+    if gold_path is None:
+        return name, {"status": "NO_GOLD"}
+    try:
+        brief = load_json(Path(brief_path))
+        gold_data = yaml.safe_load(Path(gold_path).read_text()) or {}
+        metrics = load_json(Path(metrics_path)) if metrics_path else None
+        results = score(brief, gold_data, metrics)
+        if results["cost_estimate_usd"] is not None:
+            results["cost_estimate_usd"] = float(results["cost_estimate_usd"])
+    except Exception as e:
+        return name, {"status": "ERROR", "error": f"{type(e).__name__}: {e}"}
+    results["gold"] = gold_path
+    return name, results
+
+def evaluate_batch(root: Path, gold_root: Path, workers: int | None = None) -> dict:
+    """Score every brief under *root* in a process pool and aggregate the results."""
+    start = time.perf_counter()
+    triples = discover(root, gold_root)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        per_brief = dict(pool.map(score_triple, triples, chunksize=16))
+
+    scored = [r for r in per_brief.values() if r["status"] in ("PASS", "FAIL")]
+    passed = sum(1 for r in scored if r["status"] == "PASS")
+    return {
+        "root": str(root),
+        "briefs": len(per_brief),
+        "scored": len(scored),
+        "passed": passed,
+        "pass_rate": passed / len(scored) if scored else 0.0,
+        "missing_gold": sorted(n for n, r in per_brief.items() if r["status"] == "NO_GOLD"),
+        "errors": {n: r["error"] for n, r in sorted(per_brief.items()) if r["status"] == "ERROR"},
+        **{field: distribution([r.get(field) for r in scored]) for field in REPORT_FIELDS},
+        "elapsed_seconds": time.perf_counter() - start,
+        "per_brief": per_brief,
+    }
+
+def diff_reports(report: dict, baseline: dict) -> dict:
+    """Mean/p50/p95 changes per field, and briefs whose status changed."""
+    changes = {}
+    for field in REPORT_FIELDS:
+        now, before = report.get(field, {}), baseline.get(field, {})
+        changes[field] = {
+            stat: None if now.get(stat) is None or before.get(stat) is None else now[stat] - before[stat]
+            for stat in ("mean", "p50", "p95")
+        }
+    old = baseline.get("per_brief", {})
+    status = {
+        name: f"{old[name]['status']} -> {r['status']}"
+        for name, r in sorted(report["per_brief"].items())
+        if name in old and old[name]["status"] != r["status"]
+    }
+    return {
+        "pass_rate": report["pass_rate"] - baseline.get("pass_rate", 0.0),
+        "fields": changes,
+        "status_changes": status,
+        "new_briefs": sorted(set(report["per_brief"]) - set(old)),
+        "removed_briefs": sorted(set(old) - set(report["per_brief"])),
+    }
+
+def main_batch(args, root: Path):
+    report = evaluate_batch(Path(args.batch), Path(args.gold) if args.gold else root / "gold", args.workers)
+    if args.baseline:
+        report["baseline_diff"] = diff_reports(report, load_json(Path(args.baseline)))
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    summary = {k: v for k, v in report.items() if k != "per_brief"}
+    print(json.dumps(summary, indent=2))
+    sys.exit(0)
+
+def main():
+    root = Path(__file__).resolve().parents[1]
+    parser = argparse.ArgumentParser(description="Score generated briefs against gold files")
+    parser.add_argument("--batch", metavar="DIR", help="score every *_brief.json under DIR")
+    parser.add_argument("--gold", metavar="DIR", help="gold folder for batch mode (default: gold/)")
+    parser.add_argument("--workers", type=int, help="batch worker processes (default: CPU count)")
+    parser.add_argument("--output", metavar="FILE", help="write the batch report to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="earlier batch report to diff against")
+    args = parser.parse_args()
+    if args.batch:
+        main_batch(args, root)
+
+    outputs = root / "outputs"
+    gold = root / "gold" / "customerX.yaml"
+
+    brief_path = outputs / "customerX_brief.json"
+    metrics_path = outputs / "metrics.json"
+
+    if not brief_path.exists():
+        print("No outputs found. Expected `outputs/customerX_brief.json`. Please generate your agent outputs and rerun.")
+        sys.exit(2)
+
+    brief = load_json(brief_path)
+    gold_data = yaml.safe_load(gold.read_text())
+    metrics = load_json(metrics_path) if metrics_path.exists() else None
+    results = score(brief, gold_data, metrics)
 
     print(json.dumps(results, indent=2))
     # exit code 0 so CI doesn't block reading metrics; rubric can judge numerically
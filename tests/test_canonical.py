@@ -0,0 +1,102 @@
+import sys
+
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "agent"))
+
+from canonical import brief_view, canonicalize, normalize, similar  # noqa: E402
+from utils import load_config  # noqa: E402
+
+
+@pytest.fixture
+def default_config(monkeypatch):
+    # config.yaml is read relative to the project root
+    monkeypatch.chdir(PROJECT_ROOT)
+    return load_config()
+
+
+def _record(source, provenance="llm", **entities):
+    return {"source": source, "provenance": provenance, "entities": entities}
+
+
+def _entries(result, field):
+    return [entry for entry in result["result"] if entry["field"] == field]
+
+
+def test_normalize_drops_case_accents_and_punctuation():
+    assert normalize("  Café-Go   Live! ") == "cafe go live"
+
+
+@pytest.mark.parametrize("a, b, same", [
+    ("customer x", "customerx", True),
+    ("integrate the billing module", "integrate the biling module", True),
+    ("data migration", "data migration rollback plan", False),
+    ("go live", "go live in eight weeks", False),
+    ("pharmacy", "scheduling", False),
+])
+def test_similar(a, b, same):
+    assert similar(a, b, 0.85) is same
+
+
+def test_near_duplicates_across_sources_merge_into_one_entry(default_config):
+    result = canonicalize([
+        _record("transcript_01.txt", client_name="Customer X", goals=["Go live in Q3", "Train nurses"]),
+        _record("transcript_02.txt", client_name="CustomerX", goals=["go-live in Q3."]),
+        _record("transcript_03.txt", client_name="customer x", goals=["Data migration", "Data migration rollback plan"]),
+    ])
+
+    [client] = _entries(result, "client_name")
+    assert client["mentions"] == 3
+    assert client["sources"] == ["transcript_01.txt", "transcript_02.txt", "transcript_03.txt"]
+    goals = _entries(result, "goals")
+    assert [g["mentions"] for g in goals] == [2, 1, 1, 1]
+    assert goals[0]["sources"] == ["transcript_01.txt", "transcript_02.txt"]
+    assert [g["value"] for g in goals[1:]] == ["Train nurses", "Data migration", "Data migration rollback plan"]
+    assert result["entities_in"] == 8
+    assert result["entities_out"] == 5
+    assert result["compression_ratio"] == pytest.approx(8 / 5)
+
+
+def test_structured_source_sets_provenance(default_config):
+    result = canonicalize([
+        _record("transcript_01.txt", modules=["Billing"]),
+        _record("requirements_modules.csv", provenance="structured", modules=["billing", "eMAR"]),
+    ])
+    assert {m["value"]: m["provenance"] for m in _entries(result, "modules")} == {
+        "Billing": "structured", "eMAR": "structured"}
+
+
+def test_sources_are_capped_but_mentions_are_counted(default_config):
+    max_sources = int(default_config["canonical_max_sources"])
+    records = [_record(f"transcript_{i:02d}.txt", risks=["Legacy interface latency"]) for i in range(max_sources + 3)]
+
+    [risk] = _entries(canonicalize(records), "risks")
+
+    assert risk["mentions"] == max_sources + 3
+    assert risk["sources"] == [f"transcript_{i:02d}.txt" for i in range(max_sources)]
+
+
+def test_windowed_records_cite_the_window_of_each_fact(default_config):
+    record = _record("transcript_01.txt", goals=["Go live in Q3", "Train nurses"])
+    record["windows"] = [
+        {"chunk": "transcript_01.txt#0", "start": 0, "end": 900, "entities": {"goals": ["Go live in Q3"]}},
+        {"chunk": "transcript_01.txt#1", "start": 0, "end": 700, "entities": {"goals": ["Train nurses", "Go live in Q3"]}},
+    ]
+
+    goals = {g["value"]: g["sources"] for g in _entries(canonicalize([record]), "goals")}
+
+    assert goals == {
+        "Go live in Q3": ["transcript_01.txt#0[0:900]", "transcript_01.txt#1[0:700]"],
+        "Train nurses": ["transcript_01.txt#1[0:700]"],
+    }
+
+
+def test_brief_view_lists_canonical_values_per_field(default_config):
+    result = canonicalize([
+        _record("transcript_01.txt", client_name="Customer X", goals=["Go live in Q3"]),
+        _record("transcript_02.txt", client_name="Customer X", goals=["Train nurses"]),
+    ])
+    assert brief_view(result["result"]) == {"client_name": ["Customer X"], "goals": ["Go live in Q3", "Train nurses"]}
@@ -0,0 +1,95 @@
+import importlib.util
+import json
+import sys
+
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# starter/ is not a package; the pool's workers unpickle score_triple from this module name
+_spec = importlib.util.spec_from_file_location("starter_eval", PROJECT_ROOT / "starter" / "eval.py")
+starter_eval = importlib.util.module_from_spec(_spec)
+sys.modules["starter_eval"] = starter_eval
+_spec.loader.exec_module(starter_eval)
+
+BRIEF = {"summary": "", "config_yaml": "", "risks": [], "next_steps": []}
+
+
+def _write_client(root: Path, folder: str, modules, metrics=None, brief_name="customerX_brief.json"):
+    (root / folder).mkdir(parents=True)
+    (root / folder / brief_name).write_text(json.dumps({**BRIEF, "modules": modules}))
+    if metrics is not None:
+        (root / folder / "metrics.json").write_text(json.dumps(metrics))
+
+
+@pytest.fixture
+def batch(tmp_path):
+    """Three scorable clients, one without gold and one with a broken metrics.json."""
+    outputs, gold = tmp_path / "outputs", tmp_path / "gold"
+    gold.mkdir()
+    (gold / "customerX.yaml").write_text("modules: [Billing, eMAR, Pharmacy]\n")
+    (gold / "acme.yaml").write_text("modules: [Scheduling]\n")
+    _write_client(outputs, "a", ["Billing", "eMAR", "Pharmacy"],
+                  {"latency_seconds": 10, "cost_estimate_usd": 0.01, "total_tokens": 100})
+    _write_client(outputs, "b", ["Billing", "eMAR"],
+                  {"latency_seconds": 20, "cost_estimate_usd": "0.02", "total_tokens": 200})
+    _write_client(outputs, "c", ["Billing"], {"latency_seconds": 30, "total_tokens": 300},
+                  brief_name="customerX_v2_brief.json")
+    _write_client(outputs, "d", ["Billing"], brief_name="globex_brief.json")
+    _write_client(outputs, "e", ["Billing"], {"cost_estimate_usd": "n/a"})
+    return outputs, gold
+
+
+def test_batch_report_aggregates_scored_briefs(batch):
+    report = starter_eval.evaluate_batch(*batch, workers=2)
+
+    assert report["briefs"] == 5
+    assert report["scored"] == 3
+    # 2 of 3 gold modules is a Jaccard of 0.667, just under the 0.67 pass mark
+    assert report["passed"] == 1
+    assert report["pass_rate"] == pytest.approx(1 / 3)
+    assert report["missing_gold"] == ["d/globex_brief.json"]
+    assert list(report["errors"]) == ["e/customerX_brief.json"]
+    assert report["per_brief"]["c/customerX_v2_brief.json"]["gold"].endswith("customerX.yaml")
+
+    latency = report["latency_seconds"]
+    assert (latency["count"], latency["mean"], latency["p50"], latency["min"], latency["max"]) == (3, 20, 20, 10, 30)
+    assert latency["p95"] == pytest.approx(29)
+    assert report["cost_estimate_usd"]["count"] == 2
+    assert report["cost_estimate_usd"]["mean"] == pytest.approx(0.015)
+    assert report["module_accuracy"]["mean"] == pytest.approx((1 + 2 / 3 + 1 / 3) / 3)
+
+
+def test_gold_next_to_the_brief_wins(batch):
+    outputs, gold = batch
+    (outputs / "d" / "globex.yaml").write_text("modules: [Billing]\n")
+    report = starter_eval.evaluate_batch(outputs, gold, workers=1)
+    assert report["per_brief"]["d/globex_brief.json"]["status"] == "PASS"
+    assert report["missing_gold"] == []
+
+
+def test_diff_against_a_baseline(batch):
+    outputs, gold = batch
+    baseline = starter_eval.evaluate_batch(outputs, gold, workers=1)
+    (outputs / "c" / "customerX_v2_brief.json").write_text(
+        json.dumps({**BRIEF, "modules": ["Billing", "eMAR", "Pharmacy"]}))
+    (outputs / "c" / "metrics.json").write_text(json.dumps({"latency_seconds": 60, "total_tokens": 300}))
+    _write_client(outputs, "f", ["Billing", "eMAR", "Pharmacy"])
+
+    diff = starter_eval.diff_reports(starter_eval.evaluate_batch(outputs, gold, workers=1), baseline)
+
+    assert diff["status_changes"] == {"c/customerX_v2_brief.json": "FAIL -> PASS"}
+    assert diff["new_briefs"] == ["f/customerX_brief.json"]
+    assert diff["removed_briefs"] == []
+    assert diff["pass_rate"] == pytest.approx(3 / 4 - 1 / 3)
+    assert diff["fields"]["latency_seconds"]["mean"] == pytest.approx(10)
+    assert diff["fields"]["cost_estimate_usd"] == {"mean": 0, "p50": 0, "p95": 0}
+
+
+def test_diff_reports_none_for_stats_missing_on_either_side():
+    empty = {"pass_rate": 0.0, "per_brief": {}, **{f: starter_eval.distribution([]) for f in starter_eval.REPORT_FIELDS}}
+    now = {**empty, "latency_seconds": starter_eval.distribution([1.0, 2.0])}
+    diff = starter_eval.diff_reports(now, empty)
+    assert diff["fields"]["latency_seconds"] == {"mean": None, "p50": None, "p95": None}
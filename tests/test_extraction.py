@@ -0,0 +1,65 @@
+import sys
+
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "agent"))
+
+import extraction  # noqa: E402
+from ingest import build_corpus  # noqa: E402
+from utils import load_config  # noqa: E402
+
+
+@pytest.fixture
+def default_config(monkeypatch):
+    # config.yaml is read relative to the project root
+    monkeypatch.chdir(PROJECT_ROOT)
+    return load_config()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Answer every extraction request with the paragraph markers found in its text."""
+    def extract(label, prompt, cfg, usage, stage=None):
+        text = prompt.split("\n\nText:\n", 1)[1]
+        goals = [line for line in text.splitlines() if line.startswith("goal ")]
+        return {"client_name": "Customer X", "goals": goals, "deliverables": []}
+
+    monkeypatch.setattr(extraction, "_extract_with_llm", extract)
+
+
+def _long_transcript(folder: Path, chars: int) -> list[str]:
+    paragraphs = []
+    n = 0
+    while sum(len(p) + 2 for p in paragraphs) < chars:
+        paragraphs.append(f"goal {n:05d}\n" + "discussion of the rollout plan " * 20)
+        n += 1
+    (folder / "transcript_01.txt").write_text("\n\n".join(paragraphs))
+    return [f"goal {i:05d}" for i in range(n)]
+
+
+@pytest.mark.parametrize("chunk_chars", [None, 8000])
+def test_long_source_yields_one_merged_record(tmp_path, default_config, fake_llm, chunk_chars):
+    window_chars = extraction.extract_window_chars(default_config)
+    goals = _long_transcript(tmp_path, 3 * window_chars)
+    # the pipeline's chunk size: ingest_chunk_chars, else the extraction window
+    docs = build_corpus(tmp_path, chunk_chars or default_config.get("ingest_chunk_chars") or window_chars)
+    assert len(docs) > 1
+
+    extracted = extraction.extract_entities(docs)
+
+    assert [record["source"] for record in extracted["result"]] == ["transcript_01.txt"]
+    record = extracted["result"][0]
+    assert len(record["windows"]) >= len(docs)
+    assert {window["chunk"] for window in record["windows"]} == {doc.doc_id for doc in docs}
+    assert record["entities"]["client_name"] == "Customer X"
+    assert record["entities"]["goals"] == goals
+
+
+def test_ingest_chunks_fit_one_extraction_window(tmp_path, default_config):
+    window_chars = extraction.extract_window_chars(default_config)
+    _long_transcript(tmp_path, 3 * window_chars)
+    docs = build_corpus(tmp_path, default_config.get("ingest_chunk_chars") or window_chars)
+    assert all(extraction.plan_windows(doc.text, default_config) == [(0, len(doc.text))] for doc in docs)
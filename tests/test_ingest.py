@@ -0,0 +1,92 @@
+import csv
+import json
+import sys
+
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "agent"))
+
+from ingest import iter_corpus, iter_csv_chunks, iter_json_chunks, iter_text_chunks  # noqa: E402
+
+
+def _assert_contiguous(chunks, total):
+    """Chunk ranges start at 0, follow each other without gaps and end at *total*."""
+    assert chunks[0][1] == 0
+    for (_, _, end), (_, start, _) in zip(chunks, chunks[1:]):
+        assert start == end
+    assert chunks[-1][2] == total
+
+
+@pytest.mark.parametrize("max_chars", [50, 200, 5000])
+def test_text_chunks_are_byte_ranges_of_the_file(tmp_path, max_chars):
+    path = tmp_path / "transcript_01.txt"
+    paragraphs = [f"Paragraph {i}: café go-live für Kunde ✓ " * (i % 4 + 1) for i in range(40)]
+    # one paragraph longer than any chunk, without line breaks, is cut inside
+    paragraphs.insert(10, "é" * 300)
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+    data = path.read_bytes()
+
+    chunks = list(iter_text_chunks(path, max_chars))
+
+    _assert_contiguous(chunks, len(data))
+    for text, start, end in chunks:
+        assert text == data[start:end].decode("utf-8")
+        assert end - start <= max_chars
+
+
+def test_text_chunks_end_on_paragraph_breaks(tmp_path):
+    path = tmp_path / "transcript_01.txt"
+    path.write_text("\n\n".join(f"paragraph {i:03d} " * 5 for i in range(30)))
+    for text, _, _ in list(iter_text_chunks(path, 200))[:-1]:
+        assert text.endswith("\n\n")
+
+
+def test_csv_chunks_are_row_ranges(tmp_path):
+    path = tmp_path / "requirements_modules.csv"
+    with path.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["module", "priority"])
+        writer.writerows([f"module {i}", i % 3] for i in range(100))
+
+    chunks = list(iter_csv_chunks(path, 300))
+
+    assert len(chunks) > 1
+    _assert_contiguous(chunks, 100)
+    for text, start, end in chunks:
+        assert text.splitlines() == [f"module=module {i}, priority={i % 3}" for i in range(start, end)]
+
+
+def test_json_chunks_are_record_ranges(tmp_path):
+    path = tmp_path / "salesforce_export.json"
+    opportunities = [{"id": i, "stage": "Proposal", "notes": "x" * 40} for i in range(50)]
+    path.write_text(json.dumps({"account": "Customer X", "opportunities": opportunities}))
+
+    chunks = list(iter_json_chunks(path, 500))
+
+    assert len(chunks) > 1
+    _assert_contiguous(chunks, 51)
+    records = [("account", "Customer X")] + [("opportunities", o) for o in opportunities]
+    for text, start, end in chunks:
+        expected = {}
+        for key, value in records[start:end]:
+            if key == "opportunities":
+                expected.setdefault(key, []).append(value)
+            else:
+                expected[key] = value
+        assert json.loads(text) == expected
+
+
+def test_only_split_files_get_numbered_chunk_ids(tmp_path):
+    (tmp_path / "transcript_01.txt").write_text("short call notes")
+    (tmp_path / "transcript_02.txt").write_text("\n\n".join("paragraph " * 10 for _ in range(20)))
+
+    docs = list(iter_corpus(tmp_path, 300))
+
+    assert docs[0].doc_id == "transcript_01.txt"
+    assert (docs[0].start, docs[0].end) == (0, len("short call notes"))
+    split = [d for d in docs if d.source == "transcript_02.txt"]
+    assert [d.doc_id for d in split] == [f"transcript_02.txt#{i}" for i in range(len(split))]
+    assert len(split) > 1
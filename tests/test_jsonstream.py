@@ -0,0 +1,55 @@
+import sys
+
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "agent"))
+
+from jsonstream import JsonObjectScanner  # noqa: E402
+
+
+def _feed_in_chunks(text: str, size: int):
+    """Feed *text* *size* characters at a time; the object and the offset it was returned at."""
+    scanner = JsonObjectScanner()
+    for end in range(size, len(text) + size, size):
+        obj = scanner.feed(text[end - size:end])
+        if obj is not None:
+            return obj, min(end, len(text))
+    return None, None
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_object_is_returned_when_its_closing_brace_arrives(size):
+    text = 'Here is the brief: {"summary": "go {live}", "risks": ["a \\" }"]} and then some prose'
+    obj, returned_at = _feed_in_chunks(text, size)
+    assert obj == {"summary": "go {live}", "risks": ['a " }']}
+    closing = text.index("} and then") + 1
+    assert closing <= returned_at < closing + size
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 1000])
+def test_think_blocks_are_skipped_even_when_their_tags_are_split(size):
+    text = '<think>maybe {"draft": 1} or {</think>\n{"final": true}'
+    obj, _ = _feed_in_chunks(text, size)
+    assert obj == {"final": True}
+
+
+def test_balanced_text_that_is_not_json_is_skipped():
+    scanner = JsonObjectScanner()
+    assert scanner.feed("{not json} {also {not}} ") is None
+    assert scanner.feed('{"a": [1, {"b": 2}]}') == {"a": [1, {"b": 2}]}
+
+
+def test_only_the_first_object_is_kept():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('{"a": 1}{"b": 2}') == {"a": 1}
+    assert scanner.feed('{"c": 3}') == {"a": 1}
+    assert scanner.result == {"a": 1}
+
+
+def test_incomplete_object_yields_nothing():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('{"summary": "cut off') is None
+    assert scanner.result is None
@@ -0,0 +1,82 @@
+import sys
+import time
+
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "agent"))
+
+import llm  # noqa: E402
+import resilience  # noqa: E402
+from resilience import CircuitBreaker, CircuitOpen, Deadline, StageBudgetExceeded, call_deadline  # noqa: E402
+
+
+class Span:
+    def set(self, **attributes):
+        pass
+
+
+def test_breaker_opens_after_threshold_consecutive_failures():
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    assert not breaker.failure()
+    assert not breaker.failure()
+    breaker.success()
+    assert not breaker.failure()
+    assert not breaker.failure()
+    assert breaker.failure()
+    assert not breaker.allow()
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.01)
+    assert breaker.failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    # only one trial at a time
+    assert not breaker.allow()
+    assert breaker.failure()
+    assert not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_released_trial_lets_the_next_call_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.01)
+    breaker.failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("error", [llm.Cancelled("m"), StageBudgetExceeded("m")])
+def test_guarded_trip_cooldown_neutral_trial_then_allowed(monkeypatch, error):
+    cfg = {"breaker_failure_threshold": 1, "breaker_cooldown_seconds": 0.01}
+    monkeypatch.setattr(llm, "_breakers", {})
+
+    def fail(stop):
+        raise ConnectionError("down")
+
+    def interrupted(stop):
+        raise error
+
+    with pytest.raises(ConnectionError):
+        llm._guarded(cfg, "m", fail, None, None, None, Span())
+    with pytest.raises(CircuitOpen):
+        llm._guarded(cfg, "m", fail, None, None, None, Span())
+    time.sleep(0.02)
+    with pytest.raises(type(error)):
+        llm._guarded(cfg, "m", interrupted, None, None, None, Span())
+    assert llm._guarded(cfg, "m", lambda stop: {"ok": True}, None, None, None, Span()) == {"ok": True}
+
+
+def test_call_deadline_inherits_the_stage_budget_flag():
+    cfg = {"call_deadline_seconds": {"extraction": 60}, "stage_budget_seconds": {"extraction": 1}}
+    stage = resilience.stage_deadline(cfg, "extraction")
+    assert call_deadline(cfg, "extraction", stage).stage_budget
+    assert not call_deadline(cfg, "extraction", Deadline(120, stage_budget=True)).stage_budget
+    assert not Deadline().expired() and Deadline().remaining() is None
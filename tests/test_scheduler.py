@@ -0,0 +1,54 @@
+import sys
+
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "agent"))
+
+import llm  # noqa: E402
+import scheduler  # noqa: E402
+
+
+@pytest.fixture
+def ollama(monkeypatch):
+    """No models running; every unload is recorded instead of sent."""
+    unloaded = []
+    monkeypatch.setattr(llm, "running_models", lambda cfg: [])
+    monkeypatch.setattr(llm, "unload", lambda cfg, model, kind: unloaded.append(model))
+    return unloaded
+
+
+def _scheduler(sizes_gb: dict) -> scheduler.ModelScheduler:
+    return scheduler.ModelScheduler({
+        "model_memory_budget_gb": 24,
+        "model_memory_gb": sizes_gb,
+        "embeddings_model_name": "embed",
+    })
+
+
+def _use(sched: scheduler.ModelScheduler, *models: str) -> None:
+    for model in models:
+        assert sched.acquire(model)
+        sched.release(model)
+
+
+def test_one_large_enough_model_is_unloaded_instead_of_older_small_ones(ollama):
+    sched = _scheduler({"embed": 1, "small": 9, "large": 14, "next": 12})
+    _use(sched, "embed", "small", "large")   # 24 GB, embed least recently used
+
+    _use(sched, "next")
+
+    assert ollama == ["large:latest"]
+    assert sched.stats()["resident"] == ["embed:latest", "next:latest", "small:latest"]
+
+
+def test_least_recently_used_models_are_unloaded_when_none_is_large_enough(ollama):
+    sched = _scheduler({"a": 8, "b": 8, "c": 8, "next": 12})
+    _use(sched, "a", "b", "c")
+
+    _use(sched, "next")
+
+    assert ollama == ["a:latest", "b:latest"]
+    assert sched.stats()["resident"] == ["c:latest", "next:latest"]